@@ -0,0 +1,339 @@
+import json
+import math
+import time
+import logging
+import datetime
+import threading
+from collections import deque
+from submodules.database_writer import DatabaseWriter
+
+ANOMALY_EVENT_COLUMNS = ("timestamp", "manufacturer", "serial_number", "event_type", "severity", "details")
+
+
+class _RobotWindow:
+    def __init__(self, window_size):
+        self.positions = deque(maxlen=window_size)
+        self.error_window = deque(maxlen=window_size)
+        self.error_counts = {}
+        self.reported_errors = set()
+        self.last_battery = None
+        self.drain_rate = None
+        self.last_seen = None
+        self.manufacturer = None
+        self.e_stop = "NONE"
+        self.field_violation = False
+        self.stuck = False
+        self.drain_outlier = False
+        self.discharging_since = None
+        self.stale = False
+
+
+class AnomalyDetector:
+    def __init__(self, db_conn=None, window_size=20, stuck_seconds=10.0, stuck_distance=0.05,
+                 drain_rate_alpha=0.2, drain_z_threshold=3.0, min_drain_samples=30,
+                 repeated_error_count=3, heartbeat_timeout=30.0, heartbeat_check_interval=1.0, db_writer=None,
+                 history=None, drain_window=60.0):
+        self.db_conn = db_conn
+        self.db_writer = db_writer if db_writer is not None else DatabaseWriter(db_conn)
+        self.window_size = window_size
+        self.stuck_seconds = stuck_seconds
+        self.stuck_distance = stuck_distance
+        self.drain_rate_alpha = drain_rate_alpha
+        self.drain_z_threshold = drain_z_threshold
+        self.min_drain_samples = min_drain_samples
+        self.repeated_error_count = repeated_error_count
+        self.heartbeat_timeout = heartbeat_timeout
+        self.heartbeat_check_interval = heartbeat_check_interval
+        self.last_heartbeat_check = 0.0
+        # With a StateHistory the drain rate is a least-squares slope over drain_window seconds of discharge.
+        self.history = history
+        self.drain_window = drain_window
+
+        self.robots = {}
+        self.callbacks = []
+        # Exponentially weighted fleet-wide drain-rate statistics (percent per second)
+        self.fleet_drain_mean = 0.0
+        self.fleet_drain_var = 0.0
+        self.fleet_drain_samples = 0
+        # Guards the stale flag between the ingest thread and the heartbeat thread.
+        self.lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        self.logger = logging.getLogger('AnomalyDetector')
+        logging.basicConfig(level=logging.WARN)
+
+    def register_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def _window(self, robot_id):
+        window = self.robots.get(robot_id)
+        if window is None:
+            window = _RobotWindow(self.window_size)
+            self.robots[robot_id] = window
+        return window
+
+    def process_state(self, state_message, now=None):
+        """Runs every detector over one state message and returns the emitted events."""
+        now = time.time() if now is None else now
+        robot_id = state_message.get("serialNumber", "")
+        window = self._window(robot_id)
+        window.manufacturer = state_message.get("manufacturer")
+
+        events = []
+        with self.lock:
+            window.last_seen = now
+            restored = window.stale
+            window.stale = False
+        if restored:
+            events.append(self._event("HEARTBEAT_RESTORED", robot_id, window, now, "INFO", {}))
+
+        self._check_stuck(robot_id, window, state_message, now, events)
+        self._check_battery(robot_id, window, state_message, now, events)
+        self._check_errors(robot_id, window, state_message, now, events)
+        self._check_safety(robot_id, window, state_message, now, events)
+
+        for event in events:
+            self._emit(event)
+        # Without the heartbeat thread (benchmarks, replay) the sweep is amortised over messages instead.
+        if self._thread is None and now - self.last_heartbeat_check >= self.heartbeat_check_interval:
+            events.extend(self.check_heartbeats(now))
+        return events
+
+    def check_heartbeats(self, now=None):
+        """Flags robots whose last state is older than heartbeat_timeout."""
+        now = time.time() if now is None else now
+        self.last_heartbeat_check = now
+        stale = []
+        with self.lock:
+            for robot_id, window in list(self.robots.items()):
+                if not window.stale and window.last_seen is not None and now - window.last_seen > self.heartbeat_timeout:
+                    window.stale = True
+                    stale.append((robot_id, window, now - window.last_seen))
+        events = [self._event("STALE_HEARTBEAT", robot_id, window, now, "WARNING", {"secondsSinceLastState": seconds})
+                  for robot_id, window, seconds in stale]
+        for event in events:
+            self._emit(event)
+        return events
+
+    def start(self):
+        """Sweeps heartbeats every heartbeat_check_interval, so robots that stop reporting are flagged too."""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="AnomalyHeartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.heartbeat_check_interval):
+            try:
+                self.check_heartbeats()
+            except Exception as e:
+                self.logger.error(f"Heartbeat check failed: {e}")
+
+    def _check_stuck(self, robot_id, window, state_message, now, events):
+        position = state_message.get("agvPosition")
+        if not state_message.get("driving", False) or not position:
+            window.positions.clear()
+            window.stuck = False
+            return
+
+        positions = window.positions
+        # Sample at most window_size points per stuck_seconds so the bounded window always spans it.
+        if not positions or now - positions[-1][0] >= self.stuck_seconds / self.window_size:
+            positions.append((now, position.get("x", 0.0), position.get("y", 0.0)))
+        # Keep exactly one sample older than the observation window as the reference point.
+        while len(positions) > 2 and positions[1][0] <= now - self.stuck_seconds:
+            positions.popleft()
+
+        oldest_t, oldest_x, oldest_y = positions[0]
+        if now - oldest_t < self.stuck_seconds:
+            return
+        moved = math.hypot(position.get("x", 0.0) - oldest_x, position.get("y", 0.0) - oldest_y)
+        stuck = moved < self.stuck_distance
+        if stuck and not window.stuck:
+            events.append(self._event(
+                "STUCK", robot_id, window, now, "WARNING",
+                {"distanceMoved": moved, "seconds": now - oldest_t, "lastNodeId": state_message.get("lastNodeId")}
+            ))
+        window.stuck = stuck
+
+    def _check_battery(self, robot_id, window, state_message, now, events):
+        battery_state = state_message.get("batteryState")
+        if not battery_state or "batteryCharge" not in battery_state:
+            return
+        charge = battery_state["batteryCharge"]
+        previous = window.last_battery
+        window.last_battery = (now, charge)
+        if battery_state.get("charging", False):
+            window.drain_rate = None
+            window.drain_outlier = False
+            window.discharging_since = None
+            return
+        if window.discharging_since is None:
+            window.discharging_since = now
+        if previous is None or now <= previous[0]:
+            return
+
+        if self.history is not None:
+            slope = self.history.battery_rate(robot_id, min(self.drain_window, now - window.discharging_since), now)
+            if slope is None:
+                return
+            sample = -slope
+        else:
+            sample = (previous[1] - charge) / (now - previous[0])
+        alpha = self.drain_rate_alpha
+        window.drain_rate = sample if window.drain_rate is None else (1 - alpha) * window.drain_rate + alpha * sample
+        rate = window.drain_rate
+
+        # Update the fleet distribution before testing so a single robot cannot hide itself.
+        self.fleet_drain_samples += 1
+        fleet_alpha = max(1.0 / self.fleet_drain_samples, 0.01)
+        delta = rate - self.fleet_drain_mean
+        self.fleet_drain_mean += fleet_alpha * delta
+        self.fleet_drain_var = (1 - fleet_alpha) * (self.fleet_drain_var + fleet_alpha * delta * delta)
+
+        if self.fleet_drain_samples < self.min_drain_samples:
+            return
+        std = math.sqrt(self.fleet_drain_var)
+        outlier = std > 0.0 and (rate - self.fleet_drain_mean) / std > self.drain_z_threshold
+        if outlier and not window.drain_outlier:
+            events.append(self._event(
+                "BATTERY_DRAIN_OUTLIER", robot_id, window, now, "WARNING",
+                {"drainRate": rate, "fleetMean": self.fleet_drain_mean, "fleetStd": std, "batteryCharge": charge}
+            ))
+        window.drain_outlier = outlier
+
+    def _check_errors(self, robot_id, window, state_message, now, events):
+        errors = {}
+        for error in state_message.get("errors") or []:
+            errors.setdefault(error.get("errorType", "UNKNOWN"), error)
+
+        if len(window.error_window) == window.error_window.maxlen:
+            for code in window.error_window[0]:
+                count = window.error_counts[code] - 1
+                if count:
+                    window.error_counts[code] = count
+                else:
+                    del window.error_counts[code]
+                    window.reported_errors.discard(code)
+        window.error_window.append(tuple(errors))
+
+        for code, error in errors.items():
+            count = window.error_counts.get(code, 0) + 1
+            window.error_counts[code] = count
+            if code in window.reported_errors:
+                continue
+            if error.get("errorLevel") == "FATAL":
+                window.reported_errors.add(code)
+                events.append(self._event("FATAL_ERROR", robot_id, window, now, "CRITICAL", {"error": error}))
+            elif count >= self.repeated_error_count:
+                window.reported_errors.add(code)
+                events.append(self._event(
+                    "REPEATED_ERROR", robot_id, window, now, "WARNING",
+                    {"errorType": code, "occurrences": count, "window": len(window.error_window)}
+                ))
+
+    def _check_safety(self, robot_id, window, state_message, now, events):
+        safety_state = state_message.get("safetyState") or {}
+        e_stop = safety_state.get("eStop", "NONE")
+        if e_stop != window.e_stop:
+            if e_stop != "NONE":
+                events.append(self._event("ESTOP", robot_id, window, now, "CRITICAL", {"eStop": e_stop}))
+            else:
+                events.append(self._event("ESTOP_CLEARED", robot_id, window, now, "INFO", {"previous": window.e_stop}))
+            window.e_stop = e_stop
+
+        field_violation = bool(safety_state.get("fieldViolation", False))
+        if field_violation and not window.field_violation:
+            events.append(self._event("FIELD_VIOLATION", robot_id, window, now, "CRITICAL", {}))
+        window.field_violation = field_violation
+
+    def _event(self, event_type, robot_id, window, now, severity, details):
+        return {
+            "eventType": event_type,
+            "serialNumber": robot_id,
+            "manufacturer": window.manufacturer,
+            "timestamp": now,
+            "severity": severity,
+            "details": details
+        }
+
+    def _emit(self, event):
+        self.logger.warning(f"Anomaly {event['eventType']} on AGV {event['serialNumber']}: {event['details']}")
+        for callback in self.callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                self.logger.error(f"Anomaly callback failed: {e}")
+        if self.db_writer.db_conn is not None or self.db_writer.write_buffer is not None:
+            self._save_to_database(event)
+
+    def _save_to_database(self, event):
+        self.db_writer.insert("anomaly_events", ANOMALY_EVENT_COLUMNS, (
+            datetime.datetime.fromtimestamp(event["timestamp"]),
+            event["manufacturer"],
+            event["serialNumber"],
+            event["eventType"],
+            event["severity"],
+            json.dumps(event["details"])
+        ))
+
+    def get_active_anomalies(self):
+        active = {}
+        for robot_id, window in self.robots.items():
+            flags = []
+            if window.stuck:
+                flags.append("STUCK")
+            if window.drain_outlier:
+                flags.append("BATTERY_DRAIN_OUTLIER")
+            if window.e_stop != "NONE":
+                flags.append("ESTOP")
+            if window.field_violation:
+                flags.append("FIELD_VIOLATION")
+            if window.stale:
+                flags.append("STALE_HEARTBEAT")
+            flags.extend(sorted(window.reported_errors))
+            if flags:
+                active[robot_id] = flags
+        return active
+
+
+def benchmark(robot_count=500, messages_per_robot=100):
+    detector = AnomalyDetector(db_conn=None)
+    detector.logger.setLevel(logging.ERROR)
+    states = []
+    for step in range(messages_per_robot):
+        for robot_index in range(robot_count):
+            states.append({
+                "serialNumber": f"agv_{robot_index:04d}",
+                "manufacturer": "robots",
+                "driving": True,
+                "agvPosition": {"x": step * 0.1, "y": float(robot_index), "theta": 0.0},
+                "batteryState": {"batteryCharge": 100.0 - step * 0.01 * (1 + robot_index % 3), "charging": False},
+                "errors": [{"errorType": "warning", "errorLevel": "WARNING"}] if step % 10 == 0 else [],
+                "safetyState": {"eStop": "NONE", "fieldViolation": False}
+            })
+
+    start = time.perf_counter()
+    for i, state in enumerate(states):
+        detector.process_state(state, now=i * 0.002)
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "robots": robot_count,
+        "messages": len(states),
+        "perMessageMicroseconds": elapsed / len(states) * 1e6
+    }
+    print(f"Anomaly detection benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
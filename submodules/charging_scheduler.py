@@ -0,0 +1,312 @@
+import math
+import time
+import logging
+
+
+class _BatteryTrend:
+    def __init__(self):
+        self.charge = None
+        self.updated = None
+        self.drain_rate = 0.0
+        self.charging = False
+        self.position = None
+        self.idle = True
+        self.last_node_id = None
+        self.charger_id = None
+        self.assigned_at = None
+
+
+class ChargingScheduler:
+    def __init__(self, order_publisher, chargers, low_threshold=30.0, critical_threshold=15.0, target_charge=90.0,
+                 forecast_horizon=600.0, reserve_robots=0, schedule_interval=5.0, drain_rate_alpha=0.1,
+                 map_registry=None, assignment_timeout=900.0):
+        self.order_publisher = order_publisher
+        # Routes to the chargers are planned over the map registry's node network.
+        self.map_registry = map_registry
+        # A robot that has not started charging this long after being sent is released from its charger.
+        self.assignment_timeout = assignment_timeout
+        self.chargers = {charger["charger_id"]: dict(charger) for charger in chargers}
+        self.low_threshold = low_threshold
+        self.critical_threshold = critical_threshold
+        self.target_charge = target_charge
+        self.forecast_horizon = forecast_horizon
+        self.reserve_robots = reserve_robots
+        self.schedule_interval = schedule_interval
+        self.drain_rate_alpha = drain_rate_alpha
+
+        self.robots = {}
+        self.assignments = {}
+        self.task_backlog = 0
+        self.last_schedule = 0.0
+        self.charging_orders = 0
+        self.failed_dispatches = 0
+        self.expired_assignments = 0
+
+        self.logger = logging.getLogger('ChargingScheduler')
+        logging.basicConfig(level=logging.WARN)
+
+    def set_task_backlog(self, task_count):
+        """Number of tasks waiting for a robot; the scheduler keeps that many robots available."""
+        self.task_backlog = task_count
+
+    def update_from_state(self, state_message, now=None):
+        robot_id = state_message.get("serialNumber", "")
+        battery_state = state_message.get("batteryState")
+        if not robot_id or not battery_state:
+            return
+        now = time.time() if now is None else now
+        trend = self.robots.get(robot_id)
+        if trend is None:
+            trend = _BatteryTrend()
+            self.robots[robot_id] = trend
+
+        charge = battery_state.get("batteryCharge", 0.0)
+        charging = battery_state.get("charging", False)
+        if trend.charge is not None and not charging and not trend.charging and now > trend.updated:
+            sample = (trend.charge - charge) / (now - trend.updated)
+            trend.drain_rate = (1 - self.drain_rate_alpha) * trend.drain_rate + self.drain_rate_alpha * max(sample, 0.0)
+        trend.charge = charge
+        trend.charging = charging
+        trend.updated = now
+        trend.idle = not state_message.get("nodeStates") and not state_message.get("driving", False)
+        trend.last_node_id = state_message.get("lastNodeId") or None
+
+        position = state_message.get("agvPosition")
+        if position:
+            trend.position = (position.get("x", 0.0), position.get("y", 0.0), position.get("mapId"))
+
+    def forecast_seconds(self, robot_id, threshold):
+        """Seconds until the robot's charge reaches `threshold` at its current drain rate."""
+        trend = self.robots.get(robot_id)
+        if trend is None or trend.charge is None:
+            return math.inf
+        if trend.charge <= threshold:
+            return 0.0
+        if trend.drain_rate <= 0.0:
+            return math.inf
+        return (trend.charge - threshold) / trend.drain_rate
+
+    def _nearest_charger(self, position, free_chargers):
+        best_id, best_distance = None, math.inf
+        for charger_id in free_chargers:
+            charger = self.chargers[charger_id]
+            if position is None:
+                return charger_id
+            if charger.get("map_id") is not None and position[2] is not None and charger["map_id"] != position[2]:
+                continue
+            distance = math.hypot(charger["x"] - position[0], charger["y"] - position[1])
+            if distance < best_distance:
+                best_id, best_distance = charger_id, distance
+        return best_id
+
+    def schedule(self, now=None):
+        """Returns (releases, assignments) for one batch of charging decisions."""
+        now = time.time() if now is None else now
+        self.last_schedule = now
+
+        releases = []
+        for robot_id, charger_id in list(self.assignments.items()):
+            trend = self.robots.get(robot_id)
+            if trend is not None and trend.charge is not None and trend.charge >= self.target_charge:
+                self.release(robot_id)
+                releases.append((robot_id, charger_id))
+            elif trend is None or (not trend.charging and now - trend.assigned_at > self.assignment_timeout):
+                self.logger.warning(f"AGV {robot_id} did not start charging at {charger_id} within "
+                                    f"{self.assignment_timeout:.0f} s; releasing the charger.")
+                self.release(robot_id)
+                self.expired_assignments += 1
+                releases.append((robot_id, charger_id))
+
+        free_chargers = [charger_id for charger_id, charger in self.chargers.items() if not charger.get("robot_id")]
+        candidates = []
+        available = 0
+        for robot_id, trend in self.robots.items():
+            if trend.charger_id is not None or trend.charging:
+                continue
+            available += 1
+            if trend.charge is None:
+                continue
+            time_to_low = self.forecast_seconds(robot_id, self.low_threshold)
+            if time_to_low <= self.forecast_horizon:
+                candidates.append((self.forecast_seconds(robot_id, self.critical_threshold), time_to_low, robot_id))
+        candidates.sort()
+
+        required = self.task_backlog + self.reserve_robots
+        decisions = []
+        for time_to_critical, _, robot_id in candidates:
+            if not free_chargers:
+                break
+            trend = self.robots[robot_id]
+            critical = trend.charge <= self.critical_threshold or time_to_critical <= self.schedule_interval
+            if not critical and available - 1 < required:
+                # Remaining candidates are less urgent; keep them working for the backlog.
+                break
+            if not critical and not trend.idle:
+                continue
+            charger_id = self._nearest_charger(trend.position, free_chargers)
+            if charger_id is None:
+                continue
+            free_chargers.remove(charger_id)
+            self.chargers[charger_id]["robot_id"] = robot_id
+            self.assignments[robot_id] = charger_id
+            trend.charger_id = charger_id
+            trend.assigned_at = now
+            available -= 1
+            decisions.append((robot_id, charger_id))
+        return releases, decisions
+
+    def release(self, robot_id):
+        """Frees the charger assigned to a robot, if any."""
+        charger_id = self.assignments.pop(robot_id, None)
+        if charger_id is not None and self.chargers[charger_id].get("robot_id") == robot_id:
+            self.chargers[charger_id]["robot_id"] = None
+        trend = self.robots.get(robot_id)
+        if trend is not None:
+            trend.charger_id = None
+            trend.assigned_at = None
+        return charger_id
+
+    def _route(self, robot_id, charger):
+        """Node ids from the robot's last node to the charger node; an order must start where the robot is."""
+        start = self.robots[robot_id].last_node_id
+        if start is None or self.map_registry is None:
+            return None, None
+        map_id = charger.get("map_id", "map_1")
+        grid_map = self.map_registry.maps.get(map_id)
+        if grid_map is None:
+            return None, None
+        return grid_map, grid_map.route(start, charger["node_id"])
+
+    def _build_order(self, robot_id, charger_id, grid_map, path):
+        charger = self.chargers[charger_id]
+        publisher = self.order_publisher
+        publisher.new_order(f"charge_{robot_id}_{self.charging_orders}")
+        for index, node_id in enumerate(path):
+            x, y = grid_map.nodes[node_id]
+            last = index == len(path) - 1
+            publisher.add_node(
+                node_id=node_id,
+                sequence_id=index * 2,
+                node_description=f"Charging at {charger_id}" if last else f"Route to {charger_id}",
+                node_position={
+                    "x": x,
+                    "y": y,
+                    "theta": charger.get("theta", 0.0) if last else 0.0,
+                    "mapId": grid_map.map_id,
+                    "allowedDeviationXy": charger.get("allowed_deviation_xy", 0.1),
+                    "allowedDeviationTheta": charger.get("allowed_deviation_theta", 0.1)
+                },
+                actions=[
+                    {
+                        "actionId": f"start_charging_{self.charging_orders}",
+                        "actionType": "startCharging",
+                        "blockingType": "HARD",
+                        "actionParameters": []
+                    }
+                ] if last else []
+            )
+            if index:
+                publisher.add_edge(
+                    edge_id=f"{path[index - 1]}_{node_id}",
+                    sequence_id=index * 2 - 1,
+                    start_node_id=path[index - 1],
+                    end_node_id=node_id,
+                    edge_description=f"Route to {charger_id}",
+                    actions=[]
+                )
+
+    def dispatch(self, mqtt_client, decisions):
+        """Sends each robot to its charger; a robot that cannot be sent gives its charger back.
+
+        Returns the decisions that were actually published.
+        """
+        dispatched = []
+        for robot_id, charger_id in decisions:
+            charger = self.chargers[charger_id]
+            grid_map, path = self._route(robot_id, charger)
+            if path is None:
+                self.logger.warning(f"No route from AGV {robot_id}'s last node "
+                                    f"{self.robots[robot_id].last_node_id} to charger {charger_id}")
+                published = False
+            else:
+                self.charging_orders += 1
+                with self.order_publisher.lock:
+                    self._build_order(robot_id, charger_id, grid_map, path)
+                    published = self.order_publisher.publish_order(mqtt_client, robot_id)
+            if not published:
+                self.release(robot_id)
+                self.failed_dispatches += 1
+                self.logger.warning(f"Charging order for AGV {robot_id} was not published; released {charger_id}")
+                continue
+            dispatched.append((robot_id, charger_id))
+            self.logger.info(f"Sent AGV {robot_id} to charger {charger_id} via {' -> '.join(path)}")
+        return dispatched
+
+    def maybe_schedule(self, mqtt_client, now=None):
+        """Runs a scheduling batch at most once per schedule_interval."""
+        now = time.time() if now is None else now
+        if now - self.last_schedule < self.schedule_interval:
+            return [], []
+        releases, decisions = self.schedule(now)
+        for robot_id, charger_id in releases:
+            self.logger.info(f"AGV {robot_id} finished charging at {charger_id}")
+        if decisions:
+            decisions = self.dispatch(mqtt_client, decisions)
+        return releases, decisions
+
+    def get_charger_status(self):
+        return {charger_id: charger.get("robot_id") for charger_id, charger in self.chargers.items()}
+
+    def get_forecasts(self):
+        return {
+            robot_id: {
+                "batteryCharge": trend.charge,
+                "drainRate": trend.drain_rate,
+                "secondsToLow": self.forecast_seconds(robot_id, self.low_threshold),
+                "secondsToCritical": self.forecast_seconds(robot_id, self.critical_threshold),
+                "charger": trend.charger_id
+            }
+            for robot_id, trend in self.robots.items()
+        }
+
+
+def benchmark(robot_count=300, charger_count=20, rounds=50):
+    import random
+
+    random.seed(7)
+    chargers = [
+        {"charger_id": f"charger_{i}", "node_id": f"charging_node_{i}", "x": float(i * 5), "y": 0.0, "map_id": "map_1"}
+        for i in range(charger_count)
+    ]
+    scheduler = ChargingScheduler(order_publisher=None, chargers=chargers)
+    scheduler.set_task_backlog(robot_count // 2)
+    for step in range(3):
+        for i in range(robot_count):
+            scheduler.update_from_state({
+                "serialNumber": f"agv_{i:03d}",
+                "batteryState": {"batteryCharge": 20.0 + (i % 70) - step * 0.5, "charging": False},
+                "agvPosition": {"x": random.uniform(0, 100), "y": random.uniform(0, 50), "mapId": "map_1"},
+                "nodeStates": []
+            }, now=step * 10.0)
+
+    elapsed = []
+    for _ in range(rounds):
+        for robot_id in list(scheduler.assignments):
+            scheduler.robots[robot_id].charge = 100.0
+        start = time.perf_counter()
+        scheduler.schedule(now=100.0)
+        elapsed.append(time.perf_counter() - start)
+
+    elapsed.sort()
+    result = {
+        "robots": robot_count,
+        "chargers": charger_count,
+        "medianScheduleMilliseconds": elapsed[len(elapsed) // 2] * 1e3,
+        "maxScheduleMilliseconds": elapsed[-1] * 1e3
+    }
+    print(f"Charging scheduler benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,127 @@
+import json
+import time
+
+
+class CompiledTemplate:
+    """A message pre-encoded into static byte fragments with slots for a few top-level fields."""
+
+    def __init__(self, template, dynamic_fields):
+        placeholders = {field: f"__compiled_template_slot_{index}__" for index, field in enumerate(dynamic_fields)}
+        staged = dict(template)
+        staged.update(placeholders)
+        encoded = json.dumps(staged)
+
+        self.fragments = []
+        self.fields = []
+        remaining = encoded
+        # Top-level keys keep insertion order, so slots are found in template order.
+        for field in template:
+            if field not in placeholders:
+                continue
+            marker = json.dumps(placeholders[field])
+            before, _, remaining = remaining.partition(marker)
+            self.fragments.append(before.encode("utf-8"))
+            self.fields.append(field)
+        self.fragments.append(remaining.encode("utf-8"))
+
+    @staticmethod
+    def _encode_value(value):
+        if type(value) is int:
+            return str(value).encode("ascii")
+        return json.dumps(value).encode("utf-8")
+
+    def render(self, values):
+        parts = [self.fragments[0]]
+        for field, fragment in zip(self.fields, self.fragments[1:]):
+            parts.append(self._encode_value(values[field]))
+            parts.append(fragment)
+        return b"".join(parts)
+
+
+def _build_benchmark_order(node_count=50):
+    nodes, edges = [], []
+    for i in range(node_count):
+        nodes.append({
+            "nodeId": f"node_{i}",
+            "sequenceId": 2 * i,
+            "nodeDescription": f"Node {i}",
+            "released": True,
+            "nodePosition": {
+                "x": float(i), "y": 0.0, "theta": 0.0, "mapId": "map_1",
+                "allowedDeviationXy": 0.1, "allowedDeviationTheta": 0.1, "mapDescription": "Ground floor"
+            },
+            "actions": [{
+                "actionId": f"action_{i}", "actionType": "PICK", "blockingType": "HARD",
+                "actionParameters": [{"key": "duration", "value": 5}]
+            }]
+        })
+        if i:
+            edges.append({
+                "edgeId": f"edge_{i}",
+                "sequenceId": 2 * i - 1,
+                "released": True,
+                "startNodeId": f"node_{i - 1}",
+                "endNodeId": f"node_{i}",
+                "maxSpeed": 1.5,
+                "length": 1.0,
+                "trajectory": {
+                    "degree": 3,
+                    "knotVector": [0.0, 0.0, 0.0, 0.0, 0.25, 0.5, 0.75, 1.0, 1.0, 1.0, 1.0],
+                    "controlPoints": [
+                        {"x": i - 1 + k / 6.0, "y": 0.1 * (k % 2), "weight": 1.0} for k in range(7)
+                    ]
+                },
+                "actions": []
+            })
+    return {
+        "headerId": 0,
+        "timestamp": None,
+        "version": "2.0.0",
+        "manufacturer": "robots",
+        "serialNumber": None,
+        "orderId": "order_001",
+        "orderUpdateId": 0,
+        "zoneSetId": "zone_set_001",
+        "nodes": nodes,
+        "edges": edges
+    }
+
+
+def benchmark(node_count=50, iterations=2000):
+    from submodules.order import ORDER_DYNAMIC_FIELDS
+
+    template = _build_benchmark_order(node_count)
+    compiled = CompiledTemplate(template, ORDER_DYNAMIC_FIELDS)
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        template["headerId"] = i
+        template["timestamp"] = "2024-01-01T00:00:00.000000+00:00"
+        template["serialNumber"] = f"agv_{i % 500:03d}"
+        json.dumps(template)
+    baseline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(iterations):
+        compiled.render({
+            "headerId": i,
+            "timestamp": "2024-01-01T00:00:00.000000+00:00",
+            "serialNumber": f"agv_{i % 500:03d}",
+            "orderId": "order_001",
+            "orderUpdateId": 0
+        })
+    compiled_elapsed = time.perf_counter() - start
+
+    assert json.loads(compiled.render(template)) == template
+    result = {
+        "nodes": node_count,
+        "payloadBytes": len(compiled.render(template)),
+        "jsonDumpsOrdersPerSecond": iterations / baseline,
+        "compiledOrdersPerSecond": iterations / compiled_elapsed
+    }
+    print(f"Compiled template benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,329 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+import yaml
+
+
+def changed_sections(old_config, new_config):
+    """Top-level sections whose contents differ, including sections added or removed."""
+    old_config, new_config = old_config or {}, new_config or {}
+    return sorted(key for key in set(old_config) | set(new_config) if old_config.get(key) != new_config.get(key))
+
+
+def changed_keys(old_section, new_section):
+    old_section, new_section = old_section or {}, new_section or {}
+    return sorted(key for key in set(old_section) | set(new_section) if old_section.get(key) != new_section.get(key))
+
+
+def membership_changes(old_members, new_members):
+    """(added, removed) in configuration order, so subscriptions are made and dropped predictably."""
+    return ([member for member in new_members if member not in old_members],
+            [member for member in old_members if member not in new_members])
+
+
+class ManufacturerPolicies:
+    """Per-manufacturer overrides from the manufacturer_policies config section.
+
+    ingest: false drops a manufacturer's traffic on arrival while the subscription stays, which
+    quarantines a misbehaving vendor without touching the rest of the fleet. timeout_factor overrides
+    the liveness timeout factor for that manufacturer's robots.
+    """
+
+    def __init__(self, policies=None):
+        self.dropped = {}
+        self.update(policies)
+
+    def update(self, policies):
+        policies = {name: dict(policy or {}) for name, policy in (policies or {}).items()}
+        blocked = frozenset(name for name, policy in policies.items() if not policy.get("ingest", True))
+        # One assignment, so the ingest path never sees half of an update.
+        self._state = (policies, blocked)
+
+    @property
+    def policies(self):
+        return self._state[0]
+
+    def allows_ingest(self, manufacturer):
+        if manufacturer in self._state[1]:
+            self.dropped[manufacturer] = self.dropped.get(manufacturer, 0) + 1
+            return False
+        return True
+
+    def timeout_factors(self):
+        return {name: policy["timeout_factor"] for name, policy in self.policies.items() if "timeout_factor" in policy}
+
+    def get_stats(self):
+        return {"policies": self.policies, "blocked": sorted(self._state[1]), "dropped": dict(self.dropped)}
+
+
+class IngestGapMeter:
+    """Arrival times of recent messages, to tell whether a reload interrupted ingest.
+
+    tick() is one deque append; gaps are only computed when a reload asks for them.
+    """
+
+    def __init__(self, samples=100000, clock=time.monotonic):
+        self.clock = clock
+        self.times = deque(maxlen=samples)
+
+    def tick(self):
+        self.times.append(self.clock())
+
+    def max_gap(self, start, end):
+        """Longest stretch without a message between start and end, counting both ends of the interval."""
+        times = np.fromiter(tuple(self.times), dtype=np.float64)
+        times = times[(times >= start) & (times <= end)]
+        edges = np.concatenate(([start], times, [end]))
+        return float(np.diff(edges).max()) if end > start else 0.0
+
+    def count(self, start, end):
+        times = np.fromiter(tuple(self.times), dtype=np.float64)
+        return int(np.count_nonzero((times >= start) & (times <= end)))
+
+
+class ConfigWatcher:
+    """Polls a YAML config file and hands each new version to on_change(new_config, changed_sections, old_config).
+
+    A change is noticed by mtime and size and confirmed by a content hash, so touching the file or an
+    editor's save-by-rename without edits does nothing. A file that does not parse keeps the running
+    config. With a gap meter, each reload is followed by a settle period after which the longest
+    ingest gap around the reload is compared with the same span just before it.
+    """
+
+    def __init__(self, path, on_change, config=None, interval=1.0, gap_meter=None, settle_seconds=2.0,
+                 history_size=20):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self.gap_meter = gap_meter
+        self.settle_seconds = settle_seconds
+        self.history = deque(maxlen=history_size)
+        self.reloads = 0
+        self.failures = 0
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+        self.logger = logging.getLogger('ConfigWatcher')
+        logging.basicConfig(level=logging.WARN)
+
+        self.signature = self._signature()
+        raw = self._read()
+        self.digest = hashlib.sha1(raw).hexdigest() if raw is not None else None
+        self.config = config if config is not None else (yaml.safe_load(raw) if raw is not None else {})
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as config_file:
+                return config_file.read()
+        except OSError as e:
+            self.logger.error(f"Cannot read config {self.path}: {e}")
+            return None
+
+    def check(self, force=False):
+        """Applies the file if it changed; returns the reload record, or None when nothing was applied."""
+        with self.lock:
+            signature = self._signature()
+            if signature is None or (signature == self.signature and not force):
+                return None
+            self.signature = signature
+            raw = self._read()
+            if raw is None:
+                return None
+            digest = hashlib.sha1(raw).hexdigest()
+            if digest == self.digest and not force:
+                return None
+            try:
+                config = yaml.safe_load(raw)
+                if not isinstance(config, dict):
+                    raise ValueError("top level is not a mapping")
+            except (yaml.YAMLError, ValueError) as e:
+                self.failures += 1
+                self.logger.error(f"Keeping the running config; {self.path} does not parse: {e}")
+                return None
+            self.digest = digest
+            old_config, self.config = self.config, config
+            changed = changed_sections(old_config, config)
+            if not changed:
+                return None
+
+            record = {"timestamp": time.time(), "changed": changed, "result": None}
+            clock = self.gap_meter.clock if self.gap_meter is not None else time.monotonic
+            started = clock()
+            try:
+                record["result"] = self.on_change(config, changed, old_config)
+            except Exception as e:
+                self.failures += 1
+                record["error"] = str(e)
+                self.logger.error(f"Applying config change to {changed} failed: {e}")
+            finished = clock()
+            record["applySeconds"] = finished - started
+            self.reloads += 1
+            self.history.append(record)
+            self.logger.info(f"Config reloaded in {record['applySeconds'] * 1000:.1f} ms; changed: {changed}")
+
+        if self.gap_meter is not None:
+            timer = threading.Timer(self.settle_seconds, self._measure_gap, (record, started, finished))
+            timer.daemon = True
+            timer.start()
+        return record
+
+    def _measure_gap(self, record, started, finished):
+        span = finished - started + self.settle_seconds
+        record["ingestGapSeconds"] = self.gap_meter.max_gap(started, started + span)
+        record["baselineGapSeconds"] = self.gap_meter.max_gap(started - span, started)
+        record["messagesDuringReload"] = self.gap_meter.count(started, started + span)
+        self.logger.info(f"Longest ingest gap around the reload: {record['ingestGapSeconds'] * 1000:.1f} ms "
+                         f"(before it: {record['baselineGapSeconds'] * 1000:.1f} ms)")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="ConfigWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.logger.error(f"Config check failed: {e}")
+
+    def get_stats(self):
+        return {"reloads": self.reloads, "failures": self.failures, "history": list(self.history)}
+
+
+class _SlowSubscribeClient:
+    """LocalClient wrapper where (un)subscribe takes effect after a broker round trip, as over the network."""
+
+    def __init__(self, client, round_trip):
+        self.client = client
+        self.round_trip = round_trip
+
+    def subscribe(self, topic, qos=0):
+        time.sleep(self.round_trip)
+        return self.client.subscribe(topic, qos)
+
+    def unsubscribe(self, topic):
+        time.sleep(self.round_trip)
+        return self.client.unsubscribe(topic)
+
+
+def benchmark(rate=2000, seconds=3.0, reloads=6, round_trip=0.005):
+    """Switches fleet membership back and forth under load, incrementally and by resubscribing everything.
+
+    The incremental path subscribes new manufacturers before dropping old ones, so traffic from
+    manufacturers in both sets never goes unsubscribed; tearing down and resubscribing loses what
+    arrives during the round trips.
+    """
+    from submodules.local_broker import LocalBroker, LocalClient
+    from submodules.connection import ConnectionHandler
+    from submodules.factsheet import FactsheetHandler
+    from submodules.state import StateHandler
+    from submodules.visualization import VisualizationSubscriber
+
+    logging.getLogger().setLevel(logging.WARN)
+    memberships = (["+"], ["robots", "acme"], ["robots"], ["robots", "acme"])
+
+    def run(incremental):
+        broker = LocalBroker("benchmark", 18830)
+        subscriber = LocalClient(client_id="fleet_manager")
+        publisher = LocalClient(client_id="robots")
+        meter = IngestGapMeter()
+        received = {"robots": 0, "acme": 0}
+
+        def on_message(client, userdata, msg):
+            meter.tick()
+            manufacturer = msg.topic.split('/')[2]
+            received[manufacturer] = received.get(manufacturer, 0) + 1
+
+        subscriber.on_message = on_message
+        subscriber.connect("benchmark", 18830)
+        publisher.connect("benchmark", 18830)
+        handlers = [ConnectionHandler("uagv", "2.0.0", "v2", None), FactsheetHandler("uagv", "2.0.0", "v2", None),
+                    StateHandler("uagv", "2.0.0", "v2", None), VisualizationSubscriber("uagv", "2.0.0", "v2", "robots")]
+        client = _SlowSubscribeClient(subscriber, round_trip)
+
+        def apply(members, subscribe):
+            for manufacturer in members:
+                for handler in handlers:
+                    target = None if manufacturer == "+" and isinstance(handler, VisualizationSubscriber) else manufacturer
+                    if subscribe:
+                        handler.subscribe_to_topics(client, target)
+                    else:
+                        handler.unsubscribe_from_topics(client, target)
+
+        current = memberships[0]
+        apply(current, True)
+        sent = {"robots": 0}
+        running = [True]
+
+        def publish():
+            # Only "robots" is in every membership, so every one of its messages should arrive.
+            interval = 1.0 / rate
+            next_time = time.monotonic()
+            index = 0
+            while running[0]:
+                publisher.publish(f"uagv/v2/robots/agv_{index % 50}/state", b"{}")
+                sent["robots"] += 1
+                index += 1
+                next_time += interval
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+        thread = threading.Thread(target=publish, daemon=True)
+        started = time.monotonic()
+        thread.start()
+        for step in range(reloads):
+            time.sleep(seconds / (reloads + 1))
+            new = memberships[(step + 1) % len(memberships)]
+            if incremental:
+                added, removed = membership_changes(current, new)
+                apply(added, True)
+                apply(removed, False)
+            else:
+                apply(current, False)
+                apply(new, True)
+            current = new
+        time.sleep(seconds / (reloads + 1))
+        running[0] = False
+        thread.join()
+        finished = time.monotonic()
+        broker.close()
+        return {"sent": sent["robots"], "received": received["robots"], "lost": sent["robots"] - received["robots"],
+                "maxGapMs": meter.max_gap(started + 0.05, finished - 0.05) * 1000}
+
+    result = {"incremental": run(True), "resubscribeAll": run(False)}
+
+    meter = IngestGapMeter()
+    ticks = 200000
+    tick_started = time.perf_counter()
+    for _ in range(ticks):
+        meter.tick()
+    result["tickMicroseconds"] = (time.perf_counter() - tick_started) / ticks * 1e6
+    print(f"Config reload benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
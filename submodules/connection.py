@@ -1,27 +1,24 @@
-import json
-import os
-import jsonschema
-from jsonschema import validate
 import logging
+from submodules.schema_cache import validate, SchemaValidationError
+from submodules.database_writer import DatabaseWriter
+
+CONNECTION_COLUMNS = ("header_id", "timestamp", "version", "manufacturer", "serial_number", "connection_state")
 
 class ConnectionHandler:
-    def __init__(self, fleetname, version, versions, db_conn):
+    def __init__(self, fleetname, version, versions, db_conn, db_writer=None):
         self.fleetname = fleetname
         self.version = version
         self.versions = versions
         self.db_conn = db_conn
+        self.db_writer = db_writer if db_writer is not None else DatabaseWriter(db_conn)
 
         self.logger = logging.getLogger('ConnectionHandler')
         logging.basicConfig(level=logging.WARNING)
 
-        schema_path = os.path.join(os.path.dirname(__file__), 'schemas', 'connection.schema')
-        with open(schema_path, 'r') as schema_file:
-            self.connection_schema = json.load(schema_file)
-
     def validate_message(self, message):
         try:
-            validate(instance=message, schema=self.connection_schema)
-        except jsonschema.exceptions.ValidationError as e:
+            validate("connection", message)
+        except SchemaValidationError as e:
             self.logger.error(f"Schema validation failed: {e.message}")
             raise
 
@@ -32,31 +29,27 @@ class ConnectionHandler:
         self.logger.info(f"AGV {agv_id} is now {connection_state}")
         self.write_to_database(message)
 
-    def subscribe_to_topics(self, mqtt_client):
-        topic = f"{self.fleetname}/{self.versions}/+/+/connection"
+    def subscribe_to_topics(self, mqtt_client, manufacturer="+"):
+        topic = f"{self.fleetname}/{self.versions}/{manufacturer}/+/connection"
         mqtt_client.subscribe(topic, qos=1)
         self.logger.info(f"Subscribed to topic: {topic}")
 
+    def unsubscribe_from_topics(self, mqtt_client, manufacturer="+"):
+        topic = f"{self.fleetname}/{self.versions}/{manufacturer}/+/connection"
+        mqtt_client.unsubscribe(topic)
+        self.logger.info(f"Unsubscribed from topic: {topic}")
+
     def write_to_database(self, message):
-        cursor = self.db_conn.cursor()
-        try:
-            query = """
-            INSERT INTO connection (header_id, timestamp, version, manufacturer, serial_number, connection_state)
-            VALUES (%s, %s, %s, %s, %s, %s)
-            """
-            cursor.execute(query, (
-                message.get("headerId"),
-                message.get("timestamp"),
-                message.get("version"),
-                message.get("manufacturer"),
-                message.get("serialNumber"),
-                message.get("connectionState")
-            ))
-            self.db_conn.commit()
+        written = self.db_writer.insert("connection", CONNECTION_COLUMNS, (
+            message.get("headerId"),
+            message.get("timestamp"),
+            message.get("version"),
+            message.get("manufacturer"),
+            message.get("serialNumber"),
+            message.get("connectionState")
+        ))
+        if written:
             self.logger.info("Connection data written to database successfully.")
-        except Exception as e:
-            self.logger.error(f"Failed to write to database: {e}")
-            self.db_conn.rollback()
             
     def get_connection_status(self,message):
         return message.get("connectionState")
@@ -0,0 +1,244 @@
+import time
+import logging
+import threading
+
+
+class DatabaseWriter:
+    """Shared insert path for all handlers; diverts rows to the write-ahead buffer during outages.
+
+    With batch_size > 1 rows are grouped per table and written with one bulk insert and one commit
+    per flush, which is what keeps the embedded backend fast; batch_interval bounds their latency.
+    """
+
+    def __init__(self, db_conn, write_buffer=None, connection_factory=None, slow_write_threshold=0.5,
+                 batch_size=1, batch_interval=0.5):
+        self.db_conn = db_conn
+        self.write_buffer = write_buffer
+        self.connection_factory = connection_factory
+        self.slow_write_threshold = slow_write_threshold
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.connection_listeners = []
+        self.insert_listeners = []
+        self.reconnect_lock = threading.Lock()
+        # Serializes transactions on the shared connection between handlers, flushes and buffer replay.
+        self.write_lock = threading.RLock()
+        self.batches = {}
+        self.batched_rows = 0
+        self.batch_started = None
+        self._flush_thread = None
+        self._stop_event = threading.Event()
+
+        self.logger = logging.getLogger('DatabaseWriter')
+        logging.basicConfig(level=logging.WARN)
+
+    def add_connection_listener(self, listener):
+        """Registers a callback(db_conn) invoked whenever the connection is replaced."""
+        self.connection_listeners.append(listener)
+
+    def add_insert_listener(self, listener):
+        """Registers a callback(table, serial_number) invoked once rows reach the database."""
+        self.insert_listeners.append(listener)
+
+    def _notify_insert(self, table, columns, values):
+        if not self.insert_listeners:
+            return
+        serial_number = values[columns.index("serial_number")] if values is not None and "serial_number" in columns else None
+        for listener in self.insert_listeners:
+            listener(table, serial_number)
+
+    def set_connection(self, db_conn):
+        self.db_conn = db_conn
+        for listener in self.connection_listeners:
+            listener(db_conn)
+
+    @staticmethod
+    def is_connection_error(db_conn, error):
+        """True when the connection itself is gone, not just one statement; a dead connection never recovers."""
+        if getattr(db_conn, "closed", 0):
+            return True
+        if getattr(db_conn, "dialect", "postgres") != "postgres":
+            return False
+        # Matched by name through the class hierarchy so psycopg2 stays out of the import path.
+        return any(cls.__name__ in ("OperationalError", "InterfaceError") for cls in type(error).__mro__)
+
+    def connection_failed(self, db_conn, error):
+        """Drops a dead connection so the write-ahead buffer's retry loop opens a new one."""
+        if db_conn is None or not self.is_connection_error(db_conn, error):
+            return False
+        with self.reconnect_lock:
+            if self.db_conn is not db_conn:
+                return True
+            self.logger.warning(f"Database connection lost ({error}); reconnecting.")
+            try:
+                db_conn.close()
+            except Exception:
+                pass
+            self.set_connection(None)
+        return True
+
+    def reconnect(self):
+        # Startup bootstrap and buffer replay may both try; only one connection gets opened.
+        with self.reconnect_lock:
+            if self.connection_factory is None or self.db_conn is not None:
+                return self.db_conn is not None
+            db_conn = self.connection_factory()
+            if db_conn is None:
+                return False
+            self.set_connection(db_conn)
+        self.logger.info("Reconnected to database.")
+        return True
+
+    @staticmethod
+    def build_insert_query(table, columns):
+        placeholders = ", ".join(["%s"] * len(columns))
+        return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+
+    def insert(self, table, columns, values):
+        """Inserts one row, or buffers it when the database is down, slow or still draining."""
+        if self.write_buffer is not None and (self.db_conn is None or self.write_buffer.is_buffering()):
+            self.write_buffer.append(table, columns, values)
+            return True
+        if self.db_conn is None:
+            self.logger.error(f"No database connection; dropping {table} row.")
+            return False
+        if self.batch_size > 1:
+            return self._add_to_batch(table, columns, values)
+
+        start = time.perf_counter()
+        db_conn = self.db_conn
+        try:
+            with self.write_lock:
+                cursor = db_conn.cursor()
+                cursor.execute(self.build_insert_query(table, columns), values)
+                db_conn.commit()
+        except Exception as e:
+            self.logger.error(f"Failed to write {table} row to database: {e}")
+            self._rollback()
+            self.connection_failed(db_conn, e)
+            if self.write_buffer is None:
+                return False
+            self.write_buffer.mark_unavailable(str(e))
+            self.write_buffer.append(table, columns, values)
+            return True
+
+        elapsed = time.perf_counter() - start
+        if self.write_buffer is not None and elapsed > self.slow_write_threshold:
+            self.write_buffer.mark_unavailable(f"slow write ({elapsed:.3f}s)")
+        self._notify_insert(table, columns, values)
+        return True
+
+    def _add_to_batch(self, table, columns, values):
+        with self.write_lock:
+            if self.batch_started is None:
+                self.batch_started = time.monotonic()
+            self.batches.setdefault((table, tuple(columns)), []).append(tuple(values))
+            self.batched_rows += 1
+            if self.batched_rows >= self.batch_size:
+                self.flush()
+        return True
+
+    def maybe_flush(self):
+        with self.write_lock:
+            if self.batch_started is not None and time.monotonic() - self.batch_started >= self.batch_interval:
+                self.flush()
+
+    def flush(self):
+        """Writes every pending batch in one transaction; on failure the rows go to the write-ahead buffer."""
+        with self.write_lock:
+            batches, self.batches = self.batches, {}
+            self.batched_rows = 0
+            self.batch_started = None
+            if not batches:
+                return True
+
+            start = time.perf_counter()
+            db_conn = self.db_conn
+            try:
+                for (table, columns), rows in batches.items():
+                    self.insert_many(table, columns, rows, notify=False)
+                db_conn.commit()
+            except Exception as e:
+                self.logger.error(f"Failed to write batch of {sum(len(r) for r in batches.values())} rows: {e}")
+                self._rollback()
+                self.connection_failed(db_conn, e)
+                if self.write_buffer is None:
+                    return False
+                self.write_buffer.mark_unavailable(str(e))
+                for (table, columns), rows in batches.items():
+                    for values in rows:
+                        self.write_buffer.append(table, columns, values)
+                return True
+
+            elapsed = time.perf_counter() - start
+            if self.write_buffer is not None and elapsed > self.slow_write_threshold:
+                self.write_buffer.mark_unavailable(f"slow batch write ({elapsed:.3f}s)")
+
+        for (table, columns), rows in batches.items():
+            if "serial_number" not in columns:
+                self._notify_insert(table, columns, None)
+                continue
+            index = columns.index("serial_number")
+            for serial_number in {values[index] for values in rows}:
+                for listener in self.insert_listeners:
+                    listener(table, serial_number)
+        return True
+
+    def start(self):
+        """Flushes partially filled batches every batch_interval; only needed when batching."""
+        if self.batch_size <= 1 or self._flush_thread is not None:
+            return
+        self._stop_event.clear()
+        self._flush_thread = threading.Thread(target=self._run, name="DatabaseWriterFlush", daemon=True)
+        self._flush_thread.start()
+
+    def configure(self, batch_size=None, batch_interval=None):
+        """Changes batching at runtime; rows batched so far are written first when batching is turned off."""
+        with self.write_lock:
+            if batch_interval is not None:
+                self.batch_interval = batch_interval
+            if batch_size is not None:
+                self.batch_size = batch_size
+                if self.batched_rows >= batch_size and self.db_conn is not None:
+                    self.flush()
+        self.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._flush_thread is not None:
+            self._flush_thread.join()
+            self._flush_thread = None
+        if self.db_conn is not None:
+            self.flush()
+
+    def _run(self):
+        while not self._stop_event.wait(self.batch_interval / 2):
+            if self.db_conn is not None:
+                self.maybe_flush()
+
+    def insert_many(self, table, columns, rows, notify=True):
+        """Bulk insert without committing; used by buffer replay and batch flushes."""
+        cursor = self.db_conn.cursor()
+        execute_values = None
+        if getattr(self.db_conn, "dialect", "postgres") == "postgres":
+            try:
+                from psycopg2.extras import execute_values
+            except ImportError:
+                pass
+        if execute_values is None:
+            cursor.executemany(self.build_insert_query(table, columns), rows)
+        else:
+            execute_values(cursor, f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s", rows, page_size=len(rows))
+        if notify:
+            self._notify_insert(table, columns, None)
+
+    def commit(self):
+        self.db_conn.commit()
+
+    def _rollback(self):
+        if self.db_conn is None:
+            return
+        try:
+            self.db_conn.rollback()
+        except Exception as e:
+            self.logger.error(f"Rollback failed: {e}")
@@ -0,0 +1,371 @@
+import time
+import logging
+
+REROUTE = "REROUTE"
+CANCEL_ORDER = "CANCEL_ORDER"
+
+
+def _node(node_id):
+    return ("node", node_id)
+
+
+def _edge(start_node_id, end_node_id):
+    # Aisles are treated as single-lane, so both directions of an edge are the same resource.
+    return ("edge",) + tuple(sorted((start_node_id, end_node_id)))
+
+
+class DeadlockDetector:
+    """Wait-for graph between robots, maintained incrementally from state messages.
+
+    Each robot holds the node it last reached, or the edge it is on once it has left that node,
+    and requests the next edge and node of its released base. A robot that has stood still on the
+    same node for min_wait_seconds waits for whoever holds the first requested resource. Only
+    robots whose edges changed are searched for cycles, so one update costs the size of the
+    subgraph reachable from them instead of the whole fleet.
+    """
+
+    def __init__(self, min_wait_seconds=5.0, node_tolerance=0.1, auto_cancel=False):
+        self.min_wait_seconds = min_wait_seconds
+        self.node_tolerance = node_tolerance
+        self.auto_cancel = auto_cancel
+        self.robots = {}
+        self.holders = {}
+        self.requesters = {}
+        self.waits_on = {}
+        self.deadlocks = {}
+        self.updates = 0
+        self.searched = 0
+
+        self.logger = logging.getLogger('DeadlockDetector')
+        logging.basicConfig(level=logging.WARN)
+
+    @staticmethod
+    def _index_add(index, resource, serial_number):
+        if resource is not None:
+            index.setdefault(resource, set()).add(serial_number)
+
+    @staticmethod
+    def _index_remove(index, resource, serial_number):
+        members = index.get(resource)
+        if members is None:
+            return
+        members.discard(serial_number)
+        if not members:
+            del index[resource]
+
+    def _parse_state(self, message):
+        last_node_id = message.get("lastNodeId") or None
+        last_sequence_id = message.get("lastNodeSequenceId", 0)
+        next_node = None
+        for node_state in message.get("nodeStates", []):
+            sequence_id = node_state.get("sequenceId", 0)
+            if sequence_id <= last_sequence_id or not node_state.get("released", True):
+                continue
+            if next_node is None or sequence_id < next_node.get("sequenceId", 0):
+                next_node = node_state
+        next_node_id = next_node.get("nodeId") if next_node is not None else None
+        if next_node_id == last_node_id:
+            next_node_id = None
+
+        left_node = (message.get("distanceSinceLastNode") or 0.0) > self.node_tolerance
+        if last_node_id is None:
+            holds = None
+        elif left_node and next_node_id is not None:
+            holds = _edge(last_node_id, next_node_id)
+        else:
+            holds = _node(last_node_id)
+
+        requests = ()
+        if next_node_id is not None:
+            if holds is not None and holds[0] == "node":
+                requests = (_edge(last_node_id, next_node_id), _node(next_node_id))
+            else:
+                requests = (_node(next_node_id),)
+        return holds, requests, (message.get("orderId"), last_sequence_id)
+
+    def _compute_waits(self, serial_number):
+        robot = self.robots[serial_number]
+        if not robot["waiting"]:
+            return set()
+        for resource in robot["requests"]:
+            blockers = self.holders.get(resource, set()) - {serial_number}
+            if blockers:
+                return blockers
+        return set()
+
+    def _refresh(self, serial_number, changed):
+        waits = self._compute_waits(serial_number)
+        if waits != self.waits_on.get(serial_number, set()):
+            if waits:
+                self.waits_on[serial_number] = waits
+            else:
+                self.waits_on.pop(serial_number, None)
+            changed.add(serial_number)
+
+    def update_from_state(self, message, now=None):
+        """Applies one state message; returns deadlocks that appeared because of it."""
+        serial_number = message.get("serialNumber")
+        if serial_number is None:
+            return []
+        now = time.time() if now is None else now
+        self.updates += 1
+        holds, requests, progress = self._parse_state(message)
+
+        robot = self.robots.get(serial_number)
+        if robot is None:
+            robot = {"holds": None, "requests": (), "progress": None, "stalledSince": now, "waiting": False}
+            self.robots[serial_number] = robot
+        if message.get("driving", False) or progress != robot["progress"]:
+            robot["stalledSince"] = now
+        robot["progress"] = progress
+        robot["waiting"] = (not message.get("driving", False) and not message.get("paused", False)
+                            and bool(requests) and now - robot["stalledSince"] >= self.min_wait_seconds)
+
+        previous_holds = robot["holds"]
+        if previous_holds != holds:
+            self._index_remove(self.holders, previous_holds, serial_number)
+            self._index_add(self.holders, holds, serial_number)
+            robot["holds"] = holds
+        if robot["requests"] != requests:
+            for resource in robot["requests"]:
+                self._index_remove(self.requesters, resource, serial_number)
+            for resource in requests:
+                self._index_add(self.requesters, resource, serial_number)
+            robot["requests"] = requests
+
+        changed = set()
+        self._refresh(serial_number, changed)
+        if previous_holds != holds:
+            # Robots queued behind the old or new resource now wait for someone else, or for no one.
+            for resource in (previous_holds, holds):
+                for requester in list(self.requesters.get(resource, ())):
+                    if requester != serial_number:
+                        self._refresh(requester, changed)
+        if not changed:
+            return []
+        return self._detect(changed)
+
+    def remove_robot(self, serial_number):
+        robot = self.robots.pop(serial_number, None)
+        if robot is None:
+            return
+        self._index_remove(self.holders, robot["holds"], serial_number)
+        for resource in robot["requests"]:
+            self._index_remove(self.requesters, resource, serial_number)
+        self.waits_on.pop(serial_number, None)
+        changed = {serial_number}
+        for requester in list(self.requesters.get(robot["holds"], ())):
+            self._refresh(requester, changed)
+        self._detect(changed)
+
+    def _find_cycle(self, start):
+        """Depth-first search along wait-for edges for a path back to start."""
+        parents = {start: None}
+        stack = [start]
+        while stack:
+            current = stack.pop()
+            self.searched += 1
+            for blocker in self.waits_on.get(current, ()):
+                if blocker == start:
+                    cycle = [current]
+                    while parents[cycle[-1]] is not None:
+                        cycle.append(parents[cycle[-1]])
+                    cycle.reverse()
+                    return cycle
+                if blocker not in parents:
+                    parents[blocker] = current
+                    stack.append(blocker)
+        return None
+
+    def _is_cycle(self, cycle):
+        return all(cycle[(k + 1) % len(cycle)] in self.waits_on.get(serial_number, ())
+                   for k, serial_number in enumerate(cycle))
+
+    def _detect(self, changed):
+        for key in [key for key, deadlock in self.deadlocks.items()
+                    if not key.isdisjoint(changed) and not self._is_cycle(deadlock["cycle"])]:
+            self.logger.info(f"Deadlock between {sorted(key)} cleared.")
+            del self.deadlocks[key]
+
+        found = []
+        # A new cycle has to run through a robot whose wait-for edges just changed.
+        for serial_number in sorted(changed):
+            if serial_number not in self.waits_on:
+                continue
+            cycle = self._find_cycle(serial_number)
+            if cycle is None or frozenset(cycle) in self.deadlocks:
+                continue
+            deadlock = {
+                "cycle": cycle,
+                "resources": [self.robots[member]["holds"] for member in cycle],
+                "detected": time.time(),
+                "proposals": self.propose_resolution(cycle)
+            }
+            self.deadlocks[frozenset(cycle)] = deadlock
+            self.logger.warning(f"Deadlock between {cycle}; proposing {deadlock['proposals'][0]}")
+            found.append(deadlock)
+        return found
+
+    def propose_resolution(self, cycle):
+        """Breaks the cycle at the robot that started waiting last, since it closed the cycle."""
+        victim = max(cycle, key=lambda member: (self.robots[member]["stalledSince"], member))
+        avoid_nodes = sorted({
+            node_id
+            for member in cycle if member != victim and self.robots[member]["holds"] is not None
+            for node_id in self.robots[member]["holds"][1:]
+        })
+        return [
+            {"type": REROUTE, "serialNumber": victim, "avoidNodes": avoid_nodes},
+            {"type": CANCEL_ORDER, "serialNumber": victim, "actionType": "cancelOrder"}
+        ]
+
+    def resolve(self, deadlock, instant_actions_publisher, mqtt_client):
+        """Sends cancelOrder to the proposed victim; re-routing is left to whoever dispatches orders."""
+        proposal = next(p for p in deadlock["proposals"] if p["type"] == CANCEL_ORDER)
+        instant_actions_publisher.publish_action(
+            mqtt_client, proposal["serialNumber"], "cancelOrder",
+            f"cancel_deadlock_{int(deadlock['detected'] * 1000)}", blocking_type="HARD"
+        )
+        deadlock["resolution"] = proposal
+        return proposal
+
+    def find_cycles(self):
+        """Every deadlocked group in the current graph (Tarjan's SCC, iterative)."""
+        index_of = {}
+        lowlink = {}
+        on_stack = set()
+        stack = []
+        groups = []
+        counter = 0
+        for root in self.waits_on:
+            if root in index_of:
+                continue
+            work = [(root, iter(self.waits_on.get(root, ())))]
+            index_of[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, blockers = work[-1]
+                advanced = False
+                for blocker in blockers:
+                    if blocker not in index_of:
+                        index_of[blocker] = lowlink[blocker] = counter
+                        counter += 1
+                        stack.append(blocker)
+                        on_stack.add(blocker)
+                        work.append((blocker, iter(self.waits_on.get(blocker, ()))))
+                        advanced = True
+                        break
+                    if blocker in on_stack:
+                        lowlink[node] = min(lowlink[node], index_of[blocker])
+                if advanced:
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index_of[node]:
+                    group = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        group.append(member)
+                        if member == node:
+                            break
+                    if len(group) > 1:
+                        groups.append(sorted(group))
+        return groups
+
+    def get_deadlocks(self):
+        return [dict(deadlock) for deadlock in self.deadlocks.values()]
+
+    def get_stats(self):
+        return {
+            "robots": len(self.robots),
+            "waiting": len(self.waits_on),
+            "deadlocks": len(self.deadlocks),
+            "updates": self.updates,
+            "searchedNodes": self.searched
+        }
+
+
+def _benchmark_state(serial_number, last_node_id, next_node_id, driving=False):
+    return {
+        "serialNumber": serial_number,
+        "orderId": f"order_{serial_number}",
+        "lastNodeId": last_node_id,
+        "lastNodeSequenceId": 0,
+        "distanceSinceLastNode": 0.0,
+        "driving": driving,
+        "nodeStates": [{"nodeId": next_node_id, "sequenceId": 2, "released": True}]
+    }
+
+
+def benchmark(robot_count=500, grid_size=40, rounds=20, cycle_lengths=(2, 3, 4, 6), seed=3):
+    """Robots parked on a grid waiting on neighbours, with a few planted cycles; incremental vs full search."""
+    import random
+
+    rng = random.Random(seed)
+    cells = rng.sample([(x, y) for x in range(grid_size) for y in range(grid_size)], robot_count)
+    node_of = {f"agv_{i:04d}": f"n_{x}_{y}" for i, (x, y) in enumerate(cells)}
+    serials = sorted(node_of)
+    occupied = set(node_of.values())
+
+    # Planted cycles: each member's next node is the next member's current node.
+    next_node = {}
+    planted = []
+    position = 0
+    for length in cycle_lengths:
+        members = serials[position:position + length]
+        position += length
+        for k, member in enumerate(members):
+            next_node[member] = node_of[members[(k + 1) % length]]
+        planted.append(sorted(members))
+    # Everyone else wants a random neighbour cell; most are free, some are held by chains of waiters.
+    for serial_number in serials[position:]:
+        x, y = map(int, node_of[serial_number].split("_")[1:])
+        dx, dy = rng.choice([(1, 0), (-1, 0), (0, 1), (0, -1)])
+        candidate = f"n_{x + dx}_{y + dy}"
+        if candidate in occupied and rng.random() < 0.7:
+            next_node[serial_number] = candidate
+        else:
+            next_node[serial_number] = f"free_{serial_number}"
+
+    detector = DeadlockDetector(min_wait_seconds=1.0)
+    detector.logger.setLevel(logging.ERROR)
+    now = 1000.0
+    start = time.perf_counter()
+    messages = 0
+    for round_index in range(rounds):
+        now += 1.0
+        order = list(serials)
+        rng.shuffle(order)
+        for serial_number in order:
+            detector.update_from_state(_benchmark_state(serial_number, node_of[serial_number],
+                                                        next_node[serial_number]), now=now)
+            messages += 1
+    elapsed = time.perf_counter() - start
+
+    full_start = time.perf_counter()
+    groups = detector.find_cycles()
+    full_elapsed = time.perf_counter() - full_start
+
+    incremental = sorted(sorted(deadlock["cycle"]) for deadlock in detector.deadlocks.values())
+    result = {
+        "robots": robot_count,
+        "messages": messages,
+        "perMessageMicroseconds": elapsed / messages * 1e6,
+        "fullSearchMicroseconds": full_elapsed * 1e6,
+        "waiting": len(detector.waits_on),
+        "planted": len(planted),
+        "detected": len(incremental),
+        "matchesFullSearch": incremental == sorted(groups),
+        "allPlantedFound": all(cycle in incremental for cycle in planted)
+    }
+    print(f"Deadlock detection benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
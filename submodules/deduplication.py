@@ -0,0 +1,168 @@
+import time
+import logging
+import datetime
+from collections import OrderedDict
+
+ACCEPTED = "accepted"
+DUPLICATE = "duplicate"
+LATE = "late"
+RESET = "reset"
+
+# Topics whose messages replace the live view; anything older than the newest one is stale.
+# Connection is not one of them: a robot's Last Will is built when it connects, so the
+# CONNECTIONBROKEN the broker publishes for it carries an older headerId than what follows.
+ORDERED_TOPICS = ("state", "visualization")
+
+
+def _parse_timestamp(value):
+    """VDA5050 ISO 8601 timestamp as an aware datetime; None when it cannot be read."""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+class HeaderIdFilter:
+    """Sliding-window anti-replay filter on headerId, one window per AGV topic.
+
+    Each stream keeps the highest headerId seen and a bitmask of the ids below it, so a check is a
+    couple of integer operations and memory per stream is constant.
+    """
+
+    def __init__(self, window_size=64, max_streams=100000, ordered_topics=ORDERED_TOPICS):
+        self.window_size = window_size
+        self.full_mask = (1 << window_size) - 1
+        self.max_streams = max_streams
+        self.ordered_topics = set(ordered_topics)
+        self.streams = OrderedDict()
+        self.metrics = {}
+
+        self.logger = logging.getLogger('HeaderIdFilter')
+        logging.basicConfig(level=logging.WARN)
+
+    def _count(self, topic_kind, verdict):
+        counts = self.metrics.get(topic_kind)
+        if counts is None:
+            counts = {ACCEPTED: 0, DUPLICATE: 0, LATE: 0, RESET: 0}
+            self.metrics[topic_kind] = counts
+        counts[verdict] += 1
+
+    def check(self, topic, message):
+        """Returns ACCEPTED, RESET (accepted, robot restarted its counter), DUPLICATE or LATE."""
+        header_id = message.get("headerId")
+        topic_kind = topic.rsplit('/', 1)[-1]
+        if not isinstance(header_id, int):
+            self._count(topic_kind, ACCEPTED)
+            return ACCEPTED
+        timestamp = message.get("timestamp")
+
+        stream = self.streams.get(topic)
+        if stream is None:
+            self.streams[topic] = [header_id, 1, timestamp]
+            if len(self.streams) > self.max_streams:
+                self.streams.popitem(last=False)
+            self._count(topic_kind, ACCEPTED)
+            return ACCEPTED
+        self.streams.move_to_end(topic)
+
+        highest, mask, last_timestamp = stream
+        if header_id > highest:
+            shift = header_id - highest
+            stream[0] = header_id
+            stream[1] = ((mask << shift) | 1) & self.full_mask if shift < self.window_size else 1
+            stream[2] = timestamp
+            verdict = ACCEPTED
+        elif message.get("connectionState") == "CONNECTIONBROKEN":
+            # The Last Will is built at connect time and often reuses the ONLINE message's headerId and
+            # timestamp, so it would look like a duplicate or late; a robot's disconnect must never be lost.
+            verdict = ACCEPTED
+        else:
+            offset = highest - header_id
+            if offset >= self.window_size or topic_kind in self.ordered_topics:
+                if self._is_newer(timestamp, last_timestamp):
+                    # A lower headerId with a newer timestamp means the robot restarted its counter.
+                    stream[0], stream[1], stream[2] = header_id, 1, timestamp
+                    verdict = RESET
+                elif offset == 0:
+                    verdict = DUPLICATE
+                else:
+                    verdict = LATE
+            elif mask >> offset & 1:
+                verdict = DUPLICATE
+            else:
+                stream[1] = mask | (1 << offset)
+                verdict = ACCEPTED
+
+        self._count(topic_kind, verdict)
+        if verdict == RESET:
+            self.logger.info(f"headerId reset on {topic}: {highest} -> {header_id}")
+        return verdict
+
+    @staticmethod
+    def _is_newer(timestamp, last_timestamp):
+        # Only parsed on the rare lower-headerId path; ISO strings with and without fractional
+        # seconds do not sort correctly as text. A redelivered duplicate has the very same string.
+        if timestamp == last_timestamp:
+            return False
+        timestamp, last_timestamp = _parse_timestamp(timestamp), _parse_timestamp(last_timestamp)
+        return timestamp is not None and last_timestamp is not None and timestamp > last_timestamp
+
+    def accept(self, topic, message):
+        verdict = self.check(topic, message)
+        return verdict == ACCEPTED or verdict == RESET
+
+    def forget(self, topic):
+        self.streams.pop(topic, None)
+
+    def reset(self):
+        """Forgets every stream, e.g. before replaying recorded traffic that would otherwise count as late."""
+        self.streams.clear()
+
+    def get_metrics(self):
+        totals = {ACCEPTED: 0, DUPLICATE: 0, LATE: 0, RESET: 0}
+        for counts in self.metrics.values():
+            for verdict, count in counts.items():
+                totals[verdict] += count
+        return {"streams": len(self.streams), "totals": totals, "byTopic": {k: dict(v) for k, v in self.metrics.items()}}
+
+
+def benchmark(robots=500, messages_per_robot=200, duplicate_every=10):
+    message_filter = HeaderIdFilter()
+    traffic = []
+    for header_id in range(messages_per_robot):
+        for robot in range(robots):
+            topic = f"uagv/v2/robots/{robot:04d}/state"
+            message = {"headerId": header_id, "timestamp": f"2024-01-01T00:00:{header_id:06d}"}
+            traffic.append((topic, message))
+            if header_id % duplicate_every == 0:
+                traffic.append((topic, message))
+
+    start = time.perf_counter()
+    for topic, message in traffic:
+        message_filter.check(topic, message)
+    elapsed = time.perf_counter() - start
+
+    metrics = message_filter.get_metrics()
+
+    # A Last Will built at connect time repeats the ONLINE message's headerId and timestamp.
+    will_filter = HeaderIdFilter()
+    will_topic = "uagv/v2/robots/0000/connection"
+    online = {"headerId": 0, "timestamp": "2024-01-01T00:00:00Z", "connectionState": "ONLINE"}
+    will_filter.check(will_topic, online)
+    will_verdict = will_filter.check(will_topic, dict(online, connectionState="CONNECTIONBROKEN"))
+
+    result = {
+        "messages": len(traffic),
+        "dropped": metrics["totals"][DUPLICATE] + metrics["totals"][LATE],
+        "nanosecondsPerMessage": elapsed / len(traffic) * 1e9,
+        "lastWillAccepted": will_verdict == ACCEPTED
+    }
+    print(f"Deduplication benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -1,29 +1,35 @@
 import json
-import os
-import jsonschema
-from jsonschema import validate
+from submodules.schema_cache import validate, SchemaValidationError
 import logging
+from submodules.database_writer import DatabaseWriter
+
+FACTSHEET_COLUMNS = (
+    "header_id", "timestamp", "version", "manufacturer", "serial_number", "series_name",
+    "agv_kinematic", "agv_class", "max_load_mass", "localization_types", "navigation_types",
+    "speed_min", "speed_max", "acceleration_max", "deceleration_max", "height_min", "height_max",
+    "width", "length", "msg_len", "topic_serial_len", "topic_elem_len", "id_len", "id_numerical_only", "enum_len", "load_id_len",
+    "order_nodes_max", "node_actions_max", "order_edges_max", "edge_actions_max", "actions_parameters_max", "instant_actions_max",
+    "trajectory_knot_vector_max", "trajectory_control_points_max", "state_node_states_max", "state_edge_states_max",
+    "state_loads_max", "state_action_states_max", "state_errors_max", "state_information_max", "error_references_max",
+    "information_references_max", "min_order_interval", "min_state_interval", "default_state_interval",
+    "visualization_interval", "optional_parameters", "agv_actions", "wheel_definitions", "envelopes_2d", "load_positions", "load_sets"
+)
 
 class FactsheetHandler:
-    def __init__(self, fleetname, version, versions, db_conn):
+    def __init__(self, fleetname, version, versions, db_conn, db_writer=None):
         self.fleetname = fleetname
         self.version = version
         self.versions = versions
         self.db_conn = db_conn  
+        self.db_writer = db_writer if db_writer is not None else DatabaseWriter(db_conn)
 
         self.logger = logging.getLogger("FactsheetHandler")
         logging.basicConfig(level=logging.INFO)
 
-        schema_path = os.path.join(
-            os.path.dirname(__file__), "schemas", "factsheet.schema"
-        )
-        with open(schema_path, "r", encoding="utf-8") as schema_file:
-            self.factsheet_schema = json.load(schema_file)
-
     def validate_message(self, message):
         try:
-            validate(instance=message, schema=self.factsheet_schema)
-        except jsonschema.exceptions.ValidationError as e:
+            validate("factsheet", message)
+        except SchemaValidationError as e:
             self.logger.error(f"Factsheet schema validation failed: {e.message}")
             raise
 
@@ -136,19 +142,6 @@ class FactsheetHandler:
             loadSets = loadSpecification.get("loadSets", [])
 
             
-            cursor = self.db_conn.cursor()
-            insert_query = """
-                INSERT INTO factsheet (
-                    header_id, timestamp, version, manufacturer, serial_number, series_name,
-                    agv_kinematic, agv_class, max_load_mass, localization_types, navigation_types,
-                    speed_min, speed_max, acceleration_max, deceleration_max, height_min, height_max,
-                    width, length, msg_len, topic_serial_len, topic_elem_len, id_len, id_numerical_only, enum_len, load_id_len,
-                    order_nodes_max, node_actions_max, order_edges_max, edge_actions_max, actions_parameters_max, instant_actions_max, trajectory_knot_vector_max, 
-                    trajectory_control_points_max, state_node_states_max, state_edge_states_max, state_loads_max, state_action_states_max, 
-                    state_errors_max, state_information_max, error_references_max, information_references_max, min_order_interval, 
-                    min_state_interval, default_state_interval, visualization_interval, optional_parameters, agv_actions, wheel_definitions, envelopes_2d, load_positions, load_sets
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
             data_tuple = (
                 header_id,
                 timestamp,
@@ -204,21 +197,23 @@ class FactsheetHandler:
                 json.dumps(loadSets)
             )
 
-            cursor.execute(insert_query, data_tuple)
-            self.db_conn.commit()  
-
-            self.logger.info(
-                f"Factsheet data inserted into database for serial number: {serial_number}"
-            )
+            if self.db_writer.insert("factsheet", FACTSHEET_COLUMNS, data_tuple):
+                self.logger.info(
+                    f"Factsheet data inserted into database for serial number: {serial_number}"
+                )
 
         except Exception as e:
             self.logger.error(f"Failed to insert factsheet data into database: {e}")
-            self.db_conn.rollback()  
             
-    def subscribe_to_topics(self, mqtt_client):
-        topic = f"{self.fleetname}/{self.versions}/+/+/factsheet"
+    def subscribe_to_topics(self, mqtt_client, manufacturer="+"):
+        topic = f"{self.fleetname}/{self.versions}/{manufacturer}/+/factsheet"
         mqtt_client.subscribe(topic, qos=0)
         self.logger.info(f"Subscribed to topic: {topic}")
+
+    def unsubscribe_from_topics(self, mqtt_client, manufacturer="+"):
+        topic = f"{self.fleetname}/{self.versions}/{manufacturer}/+/factsheet"
+        mqtt_client.unsubscribe(topic)
+        self.logger.info(f"Unsubscribed from topic: {topic}")
         
         
     def get_robot_id(self, message):
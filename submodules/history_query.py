@@ -0,0 +1,393 @@
+import time
+import logging
+import datetime
+import threading
+from collections import OrderedDict
+
+from submodules.database_writer import DatabaseWriter
+
+PREPARED_STATEMENTS = {
+    "robot_timeline": """
+        PREPARE robot_timeline (text, timestamp, timestamp, integer) AS
+        SELECT timestamp, header_id, order_id, order_update_id, last_node_id, last_node_sequence_id,
+               driving, paused, operating_mode, agv_position, velocity,
+               (battery_state->>'batteryCharge')::real AS battery_charge,
+               jsonb_array_length(COALESCE(errors, '[]'::jsonb)) AS error_count
+        FROM state
+        WHERE serial_number = $1 AND timestamp >= $2 AND timestamp < $3
+        ORDER BY timestamp
+        LIMIT $4
+    """,
+    "order_versions": """
+        PREPARE order_versions (text) AS
+        SELECT order_update_id, header_id, timestamp, serial_number, zone_set_id,
+               jsonb_array_length(nodes) AS node_count, jsonb_array_length(edges) AS edge_count
+        FROM orders
+        WHERE order_id = $1
+        ORDER BY order_update_id, timestamp
+    """,
+    "order_progress": """
+        PREPARE order_progress (text) AS
+        SELECT serial_number, order_update_id, MIN(timestamp) AS first_seen, MAX(timestamp) AS last_seen,
+               MAX(last_node_sequence_id) AS max_node_sequence_id, COUNT(*) AS state_count,
+               BOOL_OR(jsonb_array_length(COALESCE(errors, '[]'::jsonb)) > 0) AS had_errors
+        FROM state
+        WHERE order_id = $1
+        GROUP BY serial_number, order_update_id
+        ORDER BY order_update_id, serial_number
+    """,
+    "connection_uptime": """
+        PREPARE connection_uptime (text, timestamp, timestamp) AS
+        WITH events AS (
+            (SELECT timestamp, connection_state FROM connection
+             WHERE serial_number = $1 AND timestamp < $2
+             ORDER BY timestamp DESC LIMIT 1)
+            UNION ALL
+            (SELECT timestamp, connection_state FROM connection
+             WHERE serial_number = $1 AND timestamp >= $2 AND timestamp < $3)
+        ), spans AS (
+            SELECT connection_state, GREATEST(timestamp, $2) AS span_start,
+                   LEAD(timestamp, 1, $3) OVER (ORDER BY timestamp) AS span_end
+            FROM events
+        )
+        SELECT COALESCE(SUM(EXTRACT(EPOCH FROM span_end - span_start)) FILTER (WHERE connection_state = 'ONLINE'), 0)
+                   AS online_seconds,
+               COUNT(*) FILTER (WHERE connection_state = 'CONNECTIONBROKEN' AND span_start >= $2) AS broken_events,
+               COUNT(*) FILTER (WHERE span_start >= $2) AS events
+        FROM spans
+    """
+}
+
+# The same queries for the embedded SQLite backend, which has no PREPARE; sqlite3 caches the plans.
+# Connection timestamps are the robots' ISO strings there, so they are compared through julianday().
+SQLITE_STATEMENTS = {
+    "robot_timeline": """
+        SELECT timestamp, header_id, order_id, order_update_id, last_node_id, last_node_sequence_id,
+               driving, paused, operating_mode, agv_position, velocity,
+               CAST(json_extract(battery_state, '$.batteryCharge') AS REAL) AS battery_charge,
+               json_array_length(COALESCE(errors, '[]')) AS error_count
+        FROM state
+        WHERE serial_number = ?1 AND timestamp >= ?2 AND timestamp < ?3
+        ORDER BY timestamp
+        LIMIT ?4
+    """,
+    "order_versions": """
+        SELECT order_update_id, header_id, timestamp, serial_number, zone_set_id,
+               json_array_length(nodes) AS node_count, json_array_length(edges) AS edge_count
+        FROM orders
+        WHERE order_id = ?1
+        ORDER BY order_update_id, timestamp
+    """,
+    "order_progress": """
+        SELECT serial_number, order_update_id, MIN(timestamp) AS first_seen, MAX(timestamp) AS last_seen,
+               MAX(last_node_sequence_id) AS max_node_sequence_id, COUNT(*) AS state_count,
+               MAX(json_array_length(COALESCE(errors, '[]')) > 0) AS had_errors
+        FROM state
+        WHERE order_id = ?1
+        GROUP BY serial_number, order_update_id
+        ORDER BY order_update_id, serial_number
+    """,
+    "connection_uptime": """
+        WITH events AS (
+            SELECT * FROM (SELECT julianday(timestamp) AS day, connection_state FROM connection
+                           WHERE serial_number = ?1 AND julianday(timestamp) < julianday(?2)
+                           ORDER BY day DESC LIMIT 1)
+            UNION ALL
+            SELECT julianday(timestamp) AS day, connection_state FROM connection
+            WHERE serial_number = ?1 AND julianday(timestamp) >= julianday(?2) AND julianday(timestamp) < julianday(?3)
+        ), spans AS (
+            SELECT connection_state, MAX(day, julianday(?2)) AS span_start,
+                   LEAD(day, 1, julianday(?3)) OVER (ORDER BY day) AS span_end
+            FROM events
+        )
+        SELECT COALESCE(SUM((span_end - span_start) * 86400.0) FILTER (WHERE connection_state = 'ONLINE'), 0)
+                   AS online_seconds,
+               COUNT(*) FILTER (WHERE connection_state = 'CONNECTIONBROKEN' AND span_start >= julianday(?2))
+                   AS broken_events,
+               COUNT(*) FILTER (WHERE span_start >= julianday(?2)) AS events
+        FROM spans
+    """
+}
+
+
+class QueryCache:
+    """LRU result cache with a TTL; entries are tagged with (table, serial_number) for invalidation."""
+
+    def __init__(self, max_entries=512, ttl=5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.tags = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, tags=()):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, value, tags)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        _, _, tags = self.entries.pop(key)
+        for tag in tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+    def invalidate(self, table, serial_number=None):
+        with self.lock:
+            if serial_number is None:
+                tags = [tag for tag in self.tags if tag[0] == table]
+            else:
+                tags = [(table, serial_number), (table, None)]
+            for tag in tags:
+                for key in list(self.tags.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tags.clear()
+
+
+class FleetHistoryQuery:
+    """Read side of the history tables.
+
+    Queries run on their own connection, opened through connection_factory, so they never commit,
+    roll back or hold a server-side cursor on the connection the DatabaseWriter is writing through.
+    Without a factory the given db_conn is used as is, for standalone use.
+    """
+
+    def __init__(self, db_conn=None, cache_ttl=5.0, cache_size=512, fetch_size=2000, history=None,
+                 connection_factory=None):
+        self.db_conn = db_conn
+        self.connection_factory = connection_factory
+        self.history = history
+        self.cache = QueryCache(cache_size, cache_ttl)
+        self.fetch_size = fetch_size
+        # The connection the statements were prepared on; holding it keeps a reconnect from looking the same.
+        self.prepared_connection = None
+        self.cursor_count = 0
+        self.lock = threading.Lock()
+
+        self.logger = logging.getLogger('FleetHistoryQuery')
+        logging.basicConfig(level=logging.WARN)
+
+    def on_rows_inserted(self, table, serial_number):
+        self.cache.invalidate(table, serial_number)
+
+    def _connection(self):
+        if self.connection_factory is not None and (self.db_conn is None or getattr(self.db_conn, "closed", 0)):
+            self.db_conn = self.connection_factory()
+        if self.db_conn is None:
+            raise ConnectionError("History database is not reachable.")
+        return self.db_conn
+
+    def _connection_failed(self, db_conn, error):
+        # Only a connection this class opened itself is dropped; the next query opens a new one.
+        if self.connection_factory is None or not DatabaseWriter.is_connection_error(db_conn, error):
+            return
+        try:
+            db_conn.close()
+        except Exception:
+            pass
+        if self.db_conn is db_conn:
+            self.db_conn = None
+
+    def _prepare(self, db_conn):
+        if self.prepared_connection is db_conn:
+            return
+        cursor = db_conn.cursor()
+        for statement in PREPARED_STATEMENTS.values():
+            cursor.execute(statement)
+        db_conn.commit()
+        self.prepared_connection = db_conn
+
+    def _execute(self, name, params):
+        with self.lock:
+            db_conn = self._connection()
+            sqlite = getattr(db_conn, "dialect", "postgres") == "sqlite"
+            try:
+                if not sqlite:
+                    self._prepare(db_conn)
+                cursor = db_conn.cursor()
+                if sqlite:
+                    cursor.execute(SQLITE_STATEMENTS[name], params)
+                else:
+                    cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+                rows = cursor.fetchall()
+                columns = [column[0] for column in cursor.description]
+                db_conn.commit()
+            except Exception as e:
+                self.logger.error(f"History query {name} failed: {e}")
+                try:
+                    db_conn.rollback()
+                except Exception:
+                    pass
+                self._connection_failed(db_conn, e)
+                raise
+        return [dict(zip(columns, row)) for row in rows]
+
+    @staticmethod
+    def _is_open_window(end):
+        # Windows that end in the past cannot change when new rows arrive.
+        return end is None or end >= datetime.datetime.now()
+
+    def _cached(self, key, tags, loader):
+        result = self.cache.get(key)
+        if result is None:
+            result = loader()
+            self.cache.put(key, result, tags)
+        return result
+
+    def robot_timeline(self, serial_number, start, end=None, limit=10000):
+        open_window = self._is_open_window(end)
+        end = end or datetime.datetime.max
+        return self._cached(
+            ("robot_timeline", serial_number, start, end, limit),
+            [("state", serial_number)] if open_window else [],
+            lambda: self._execute("robot_timeline", (serial_number, start, end, limit))
+        )
+
+    def order_history(self, order_id):
+        """Every published version of an order together with the state progress per robot."""
+        def load():
+            return {
+                "orderId": order_id,
+                "versions": self._execute("order_versions", (order_id,)),
+                "progress": self._execute("order_progress", (order_id,))
+            }
+        return self._cached(("order_history", order_id), [("orders", None), ("state", None)], load)
+
+    def connection_uptime(self, serial_number, start, end=None):
+        open_window = self._is_open_window(end)
+        end = end or datetime.datetime.now()
+
+        def load():
+            row = self._execute("connection_uptime", (serial_number, start, end))[0]
+            online_seconds = float(row["online_seconds"])
+            window = (end - start).total_seconds()
+            return {
+                "serialNumber": serial_number,
+                "onlineSeconds": online_seconds,
+                "windowSeconds": window,
+                "uptimeRatio": online_seconds / window if window > 0 else 0.0,
+                "connectionBrokenEvents": row["broken_events"],
+                "events": row["events"]
+            }
+        return self._cached(
+            ("connection_uptime", serial_number, start, end if not open_window else None),
+            [("connection", serial_number)] if open_window else [],
+            load
+        )
+
+    def recent_window(self, serial_number, seconds, now=None):
+        """Position, speed and battery of the last `seconds` from the in-memory StateHistory; no database query.
+
+        The rings reach back history.coverage(serial_number) seconds; use robot_timeline for anything older.
+        """
+        if self.history is None:
+            return None
+        return self.history.window(serial_number, seconds, now)
+
+    def iter_robot_timeline(self, serial_number, start, end=None):
+        """Streams an arbitrarily long timeline through a server-side cursor; not cached.
+
+        With a connection factory each stream gets a connection of its own, so a slow consumer neither
+        holds up the other queries nor has its cursor closed by their commits.
+        """
+        with self.lock:
+            self.cursor_count += 1
+            name = f"robot_timeline_{self.cursor_count}"
+            db_conn = self.connection_factory() if self.connection_factory is not None else self.db_conn
+        if db_conn is None:
+            raise ConnectionError("History database is not reachable.")
+        cursor = db_conn.cursor(name=name)
+        cursor.itersize = self.fetch_size
+        try:
+            cursor.execute("""
+                SELECT timestamp, header_id, order_id, last_node_id, last_node_sequence_id, driving,
+                       agv_position, velocity, battery_state, errors
+                FROM state
+                WHERE serial_number = %s AND timestamp >= %s AND timestamp < %s
+                ORDER BY timestamp
+            """, (serial_number, start, end or datetime.datetime.max))
+            columns = None
+            for row in cursor:
+                if columns is None:
+                    columns = [column[0] for column in cursor.description]
+                yield dict(zip(columns, row))
+        finally:
+            cursor.close()
+            if self.connection_factory is not None:
+                db_conn.close()
+            else:
+                db_conn.commit()
+
+    def get_cache_stats(self):
+        return {"entries": len(self.cache.entries), "hits": self.cache.hits, "misses": self.cache.misses}
+
+
+def benchmark(db_conn, serial_number, order_id=None, hours=1, repeats=20):
+    query = FleetHistoryQuery(db_conn)
+    end = datetime.datetime.now()
+    start = end - datetime.timedelta(hours=hours)
+    cases = {
+        "robot_timeline": lambda: query.robot_timeline(serial_number, start, end),
+        "connection_uptime": lambda: query.connection_uptime(serial_number, start, end),
+        "iter_robot_timeline": lambda: sum(1 for _ in query.iter_robot_timeline(serial_number, start, end)),
+    }
+    if order_id is not None:
+        cases["order_history"] = lambda: query.order_history(order_id)
+
+    results = {}
+    for name, run in cases.items():
+        query.cache.clear()
+        cold_start = time.perf_counter()
+        run()
+        cold = time.perf_counter() - cold_start
+        warm_start = time.perf_counter()
+        for _ in range(repeats):
+            run()
+        warm = (time.perf_counter() - warm_start) / repeats
+        results[name] = {"coldMilliseconds": cold * 1e3, "warmMilliseconds": warm * 1e3}
+        print(f"{name}: cold {cold * 1e3:.2f} ms, warm {warm * 1e3:.3f} ms")
+    return results
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+    import yaml
+    import psycopg2
+
+    config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'config.yaml')
+    with open(config_path, 'r') as config_file:
+        postgres_config = yaml.safe_load(config_file)['postgres']
+    conn = psycopg2.connect(
+        host=postgres_config['host'],
+        port=postgres_config['port'],
+        database=postgres_config['database'],
+        user=postgres_config['user'],
+        password=postgres_config['password']
+    )
+    benchmark(conn, sys.argv[1] if len(sys.argv) > 1 else "001", sys.argv[2] if len(sys.argv) > 2 else None)
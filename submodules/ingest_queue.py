@@ -0,0 +1,391 @@
+import json
+import time
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+CRITICAL = "critical"
+ROUTINE = "routine"
+TELEMETRY = "telemetry"
+LANES = (CRITICAL, ROUTINE, TELEMETRY)
+
+
+class _Item:
+    __slots__ = ("userdata", "msg", "message", "kind", "robot", "lane", "enqueued", "sequence")
+
+    def __init__(self, userdata, msg, message, kind, robot, lane, enqueued, sequence):
+        self.userdata = userdata
+        self.msg = msg
+        self.message = message
+        self.kind = kind
+        self.robot = robot
+        self.lane = lane
+        self.enqueued = enqueued
+        self.sequence = sequence
+
+
+class IngestQueue:
+    """Prioritised hand-off between the MQTT network thread and the message pipeline.
+
+    submit() decodes and classifies each message and returns at once; one worker thread runs the
+    handler, always taking the critical lane first. Connection messages, and states that report an
+    eStop, a field violation, a fatal error or a change in the robot's safety/error picture, go to
+    the critical lane. Visualizations are telemetry and only the newest per robot is kept. Other
+    states and factsheets are routine; above coalesce_depth a new state replaces the robot's queued
+    one, and a full lane sheds its oldest message. Under sustained load telemetry still gets one
+    turn per telemetry_share routine messages.
+    """
+
+    def __init__(self, handler, critical_depth=10000, routine_depth=5000, telemetry_depth=2000, coalesce_depth=500,
+                 telemetry_share=20, latency_samples=10000, overload_log_interval=10.0, clock=time.monotonic):
+        self.handler = handler
+        self.depths = {CRITICAL: critical_depth, ROUTINE: routine_depth, TELEMETRY: telemetry_depth}
+        self.coalesce_depth = coalesce_depth
+        self.telemetry_share = telemetry_share
+        self.overload_log_interval = overload_log_interval
+        self.clock = clock
+
+        self.lanes = {lane: deque() for lane in LANES}
+        self.pending = {ROUTINE: {}, TELEMETRY: {}}
+        self.signatures = {}
+        self.critical_sequence = {}
+        self.sequence = 0
+        self.routine_streak = 0
+        self.counters = {lane: {"enqueued": 0, "processed": 0, "coalesced": 0, "dropped": 0, "superseded": 0,
+                                "maxDepth": 0} for lane in LANES}
+        self.invalid = 0
+        self.latencies = {lane: deque(maxlen=latency_samples) for lane in LANES}
+        self.last_overload_log = None
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self._thread = None
+        self._running = False
+
+        self.logger = logging.getLogger('IngestQueue')
+        logging.basicConfig(level=logging.WARN)
+
+    @staticmethod
+    def _signature(message):
+        safety = message.get("safetyState") or {}
+        errors = message.get("errors") or []
+        return (safety.get("eStop", "NONE"), bool(safety.get("fieldViolation", False)),
+                frozenset((error.get("errorType"), error.get("errorLevel")) for error in errors
+                          if isinstance(error, dict)))
+
+    def classify(self, kind, message):
+        """Returns the lane for a decoded message; tracks each robot's safety/error signature."""
+        if kind == "connection":
+            return CRITICAL
+        if kind == "visualization":
+            return TELEMETRY
+        if kind != "state":
+            return ROUTINE
+        signature = self._signature(message)
+        robot = message.get("serialNumber")
+        changed = self.signatures.get(robot) != signature
+        self.signatures[robot] = signature
+        e_stop, field_violation, errors = signature
+        if changed or e_stop != "NONE" or field_violation or any(level == "FATAL" for _, level in errors):
+            return CRITICAL
+        return ROUTINE
+
+    def submit(self, userdata, msg):
+        """Called from the network thread; decoding happens here so the lane can depend on the content."""
+        try:
+            message = json.loads(msg.payload)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            self.invalid += 1
+            self.logger.error(f"Failed to decode JSON message: {e}")
+            return None
+        if not isinstance(message, dict):
+            self.invalid += 1
+            return None
+        kind = msg.topic.rsplit('/', 1)[-1]
+        now = self.clock()
+        with self.lock:
+            lane = self.classify(kind, message)
+            robot = message.get("serialNumber")
+            counters = self.counters[lane]
+            counters["enqueued"] += 1
+            queue = self.lanes[lane]
+
+            pending = self.pending.get(lane)
+            if lane == TELEMETRY or lane == ROUTINE and kind == "state":
+                item = pending.get((robot, kind))
+                if item is not None and (lane == TELEMETRY or len(queue) >= self.coalesce_depth):
+                    # Keeps its place in line; only the newest content is processed.
+                    item.msg, item.message = msg, message
+                    counters["coalesced"] += 1
+                    return lane
+
+            self.sequence += 1
+            item = _Item(userdata, msg, message, kind, robot, lane, now, self.sequence)
+            if lane == CRITICAL and kind == "state":
+                # Routine states of this robot that are still queued are older than this one.
+                self.critical_sequence[robot] = self.sequence
+            if len(queue) >= self.depths[lane]:
+                self._shed(lane, now)
+                if lane == CRITICAL:
+                    counters["dropped"] += 1
+                    return None
+            queue.append(item)
+            if pending is not None:
+                pending[(robot, kind)] = item
+            counters["maxDepth"] = max(counters["maxDepth"], len(queue))
+            self.condition.notify()
+        return lane
+
+    def _shed(self, lane, now):
+        if lane != CRITICAL:
+            dropped = self.lanes[lane].popleft()
+            self._forget(dropped)
+            self.counters[lane]["dropped"] += 1
+        if self.last_overload_log is None or now - self.last_overload_log >= self.overload_log_interval:
+            self.last_overload_log = now
+            self.logger.warning(f"Ingest overloaded; {lane} lane is full, depths: {self.get_depths()}")
+
+    def _forget(self, item):
+        pending = self.pending.get(item.lane)
+        if pending is not None and pending.get((item.robot, item.kind)) is item:
+            del pending[(item.robot, item.kind)]
+
+    def _take(self):
+        """Next item by lane priority; routine states overtaken by a critical state are skipped."""
+        order = LANES
+        if self.routine_streak >= self.telemetry_share and self.lanes[TELEMETRY]:
+            order = (CRITICAL, TELEMETRY, ROUTINE)
+        for lane in order:
+            queue = self.lanes[lane]
+            while queue:
+                item = queue.popleft()
+                self._forget(item)
+                if (lane == ROUTINE and item.kind == "state"
+                        and item.sequence < self.critical_sequence.get(item.robot, 0)):
+                    self.counters[lane]["superseded"] += 1
+                    continue
+                if lane == ROUTINE:
+                    self.routine_streak += 1
+                elif lane == TELEMETRY:
+                    self.routine_streak = 0
+                return item
+        return None
+
+    def process_pending(self, limit=None):
+        """Runs the handler on queued messages from the calling thread; returns how many were processed."""
+        processed = 0
+        while limit is None or processed < limit:
+            with self.lock:
+                item = self._take()
+            if item is None:
+                break
+            self._process(item)
+            processed += 1
+        return processed
+
+    def _process(self, item):
+        try:
+            self.handler(item.userdata, item.msg, item.message)
+        except Exception as e:
+            self.logger.error(f"Handler failed for {item.msg.topic}: {e}")
+        done = self.clock()
+        with self.lock:
+            self.counters[item.lane]["processed"] += 1
+            self.latencies[item.lane].append(done - item.enqueued)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                item = self._take()
+                while item is None and self._running:
+                    self.condition.wait(0.5)
+                    item = self._take()
+            if item is None:
+                return
+            self._process(item)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="IngestQueue", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Gives the worker up to timeout seconds to drain the lanes, then stops it."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and any(self.lanes.values()):
+            time.sleep(0.01)
+        with self.condition:
+            self._running = False
+            for queue in self.lanes.values():
+                queue.clear()
+            for pending in self.pending.values():
+                pending.clear()
+            self.condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def configure(self, critical_depth=None, routine_depth=None, telemetry_depth=None, coalesce_depth=None,
+                  telemetry_share=None):
+        """Resizes the lanes at runtime; a lane already above its new depth drains rather than being cut."""
+        with self.lock:
+            for lane, depth in ((CRITICAL, critical_depth), (ROUTINE, routine_depth), (TELEMETRY, telemetry_depth)):
+                if depth is not None:
+                    self.depths[lane] = depth
+            if coalesce_depth is not None:
+                self.coalesce_depth = coalesce_depth
+            if telemetry_share is not None:
+                self.telemetry_share = telemetry_share
+
+    def get_depths(self):
+        return {lane: len(queue) for lane, queue in self.lanes.items()}
+
+    @staticmethod
+    def _percentiles(samples):
+        if not samples:
+            return None
+        values = np.fromiter(samples, dtype=np.float64)
+        p50, p90, p99 = np.percentile(values, (50, 90, 99)).tolist()
+        return {"p50": p50, "p90": p90, "p99": p99, "max": float(values.max()), "samples": len(values)}
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "invalid": self.invalid,
+                "lanes": {lane: {**self.counters[lane], "depth": len(self.lanes[lane]),
+                                 "latencySeconds": self._percentiles(self.latencies[lane])} for lane in LANES}
+            }
+
+
+class _BenchmarkMessage:
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def benchmark(robots=500, seconds=5.0, rate=4000, service_time=0.0005, e_stop_every=200, seed=46):
+    """Load test: offered load well above what a slowed-down pipeline can take, against a plain FIFO.
+
+    The handler sleeps service_time per state (a slow database), so the pipeline manages about
+    1 / service_time states a second. Robots publish state and visualization; now and then one hits
+    eStop. Reports the latency of eStop states and connection events with and without the lanes.
+    """
+    import random
+
+    rng = random.Random(seed)
+    header_ids = {}
+
+    def message(robot, kind, e_stop="NONE", **extra):
+        header_ids[(robot, kind)] = header_ids.get((robot, kind), 0) + 1
+        body = {"headerId": header_ids[(robot, kind)], "serialNumber": f"agv_{robot:04d}", **extra}
+        if kind == "state":
+            body["safetyState"] = {"eStop": e_stop, "fieldViolation": False}
+            body["errors"] = []
+            body["nodeStates"] = [{"nodeId": f"node_{i}", "sequenceId": 2 * i} for i in range(10)]
+        return _BenchmarkMessage(f"uagv/v2/robots/agv_{robot:04d}/{kind}", json.dumps(body).encode())
+
+    traffic = []
+    for i in range(int(seconds * rate)):
+        robot = rng.randrange(robots)
+        if i % e_stop_every == 0:
+            traffic.append((message(robot, "state", e_stop="AUTOACK", sent=i), True))
+            traffic.append((message(robot, "state", sent=i), False))
+        elif i % (e_stop_every * 2) == 1:
+            traffic.append((message(robot, "connection", connectionState="CONNECTIONBROKEN", sent=i), True))
+        else:
+            traffic.append((message(robot, "state" if i % 2 else "visualization", sent=i), False))
+
+    def run(prioritised):
+        critical_latency = []
+        processed = [0]
+        started = {}
+
+        def handler(userdata, msg, decoded):
+            if msg.topic.endswith("/state"):
+                time.sleep(service_time)
+            processed[0] += 1
+            if decoded.get("connectionState") or decoded.get("safetyState", {}).get("eStop", "NONE") != "NONE":
+                critical_latency.append(time.monotonic() - started[id(msg)])
+
+        if prioritised:
+            queue = IngestQueue(handler)
+            queue.logger.setLevel(logging.ERROR)
+            queue.start()
+            submit = queue.submit
+        else:
+            fifo = deque()
+            condition = threading.Condition()
+            running = [True]
+
+            def worker():
+                while True:
+                    with condition:
+                        while not fifo and running[0]:
+                            condition.wait(0.5)
+                        if not fifo:
+                            return
+                        msg = fifo.popleft()
+                    handler(None, msg, json.loads(msg.payload))
+
+            thread = threading.Thread(target=worker, daemon=True)
+            thread.start()
+
+            def submit(userdata, msg):
+                with condition:
+                    fifo.append(msg)
+                    condition.notify()
+
+        start = time.monotonic()
+        for index, (msg, critical) in enumerate(traffic):
+            due = start + index / rate
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            started[id(msg)] = time.monotonic()
+            submit(None, msg)
+        offered_for = time.monotonic() - start
+        if prioritised:
+            stats = queue.get_stats()
+            queue.stop(timeout=0.0)
+        else:
+            with condition:
+                backlog = len(fifo)
+                fifo.clear()
+                running[0] = False
+                condition.notify()
+            thread.join()
+            stats = {"backlogAtEnd": backlog}
+        latencies = np.array(critical_latency) if critical_latency else np.zeros(1)
+        return {
+            "criticalSeen": len(critical_latency),
+            "criticalLatencyMilliseconds": {"p50": float(np.percentile(latencies, 50) * 1e3),
+                                            "p99": float(np.percentile(latencies, 99) * 1e3),
+                                            "max": float(latencies.max() * 1e3)},
+            "processedPerSecond": processed[0] / offered_for,
+            "stats": stats
+        }
+
+    criticals = sum(1 for _, critical in traffic if critical)
+    fifo_result = run(False)
+    lanes_result = run(True)
+    lanes = lanes_result["stats"]["lanes"]
+    result = {
+        "offeredPerSecond": rate,
+        "criticalSent": criticals,
+        "fifo": {k: v for k, v in fifo_result.items() if k != "stats"} | fifo_result["stats"],
+        "lanes": {k: v for k, v in lanes_result.items() if k != "stats"},
+        "routine": {k: lanes[ROUTINE][k] for k in ("enqueued", "processed", "coalesced", "dropped", "superseded",
+                                                   "maxDepth")},
+        "telemetry": {k: lanes[TELEMETRY][k] for k in ("enqueued", "processed", "coalesced", "dropped", "maxDepth")}
+    }
+    print(f"Ingest queue benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
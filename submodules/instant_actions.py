@@ -1,21 +1,30 @@
 import json
 import datetime
 import logging
+from submodules.database_writer import DatabaseWriter
+from submodules.compiled_template import CompiledTemplate
+
+INSTANT_ACTIONS_COLUMNS = ("header_id", "timestamp", "version", "manufacturer", "serial_number", "actions")
+
+INSTANT_ACTIONS_DYNAMIC_FIELDS = ("headerId", "timestamp", "serialNumber")
 
 class InstantActionsPublisher:
-    def __init__(self, fleetname, version, versions, manufacturer, db_conn):
+    def __init__(self, fleetname, version, versions, manufacturer, db_conn, db_writer=None, compiled_template=False):
         self.fleetname = fleetname
         self.version = version
         self.manufacturer = manufacturer
         self.versions = versions
         self.db_conn = db_conn  
+        self.db_writer = db_writer if db_writer is not None else DatabaseWriter(db_conn)
+        self.use_compiled_template = compiled_template
+        self._compiled = None
         
         self.logger = logging.getLogger('InstantActionsPublisher')
         logging.basicConfig(level=logging.WARN)
 
         # Header ID'yi veritabanından yükle
         self.message_template = {
-            "headerId": self._load_last_header_id_from_db(),
+            "headerId": self._load_last_header_id_from_db() if db_conn is not None else 0,
             "timestamp": None,
             "version": self.version,
             "manufacturer": self.manufacturer,
@@ -44,6 +53,10 @@ class InstantActionsPublisher:
             self.logger.error(f"Failed to load last headerId from database: {e}")
             return 0
 
+    def sync_header_id(self):
+        """Continues after the last stored headerId once the database connects after startup."""
+        self.message_template["headerId"] = max(self.message_template["headerId"], self._load_last_header_id_from_db())
+
     def _update_timestamp(self):
         self.message_template["timestamp"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
 
@@ -54,36 +67,55 @@ class InstantActionsPublisher:
         self._increment_header_id() 
         self._update_timestamp()  
         
-        try:
-            cursor = self.db_conn.cursor()
-            insert_query = """
-                INSERT INTO instant_actions (header_id, timestamp, version, manufacturer, serial_number, actions)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """
-            cursor.execute(insert_query, (
-                self.message_template["headerId"],
-                datetime.datetime.now(),
-                self.version,
-                self.manufacturer,
-                self.robot_id,
-                json.dumps(self.message_template["actions"])
-            ))
+        self.db_writer.insert("instant_actions", INSTANT_ACTIONS_COLUMNS, (
+            self.message_template["headerId"],
+            datetime.datetime.now(),
+            self.version,
+            self.manufacturer,
+            self.robot_id,
+            self._compile()[1] if self.use_compiled_template else json.dumps(self.message_template["actions"])
+        ))
 
-            self.db_conn.commit()
-        except Exception as e:
-            self.logger.error(f"Failed to save data to database: {e}")
-            self.db_conn.rollback()
+    def invalidate_compiled_template(self):
+        """Must be called after changing message_template outside the add/update/remove methods."""
+        self._compiled = None
+
+    def _compile(self):
+        if self._compiled is None:
+            self._compiled = (
+                CompiledTemplate(self.message_template, INSTANT_ACTIONS_DYNAMIC_FIELDS),
+                json.dumps(self.message_template["actions"])
+            )
+        return self._compiled
 
     def publish_instant_actions(self, mqtt_client , robot_id):
         self.message_template["serialNumber"] = robot_id
         self.robot_id = robot_id
         self._update_timestamp()
-        message = json.dumps(self.message_template)
+        if self.use_compiled_template:
+            message = self._compile()[0].render(self.message_template)
+        else:
+            message = json.dumps(self.message_template)
         topic = f"{self.fleetname}/{self.versions}/{self.manufacturer}/{self.robot_id}/instantActions"
         mqtt_client.publish(topic, message, qos=0, retain=False)
         self._save_to_database()  # Veritabanına kaydet
         self.logger.info(f"Instant actions message published.")
 
+    def publish_action(self, mqtt_client, robot_id, action_name, action_id, blocking_type="HARD", action_parameters=None):
+        """Publishes a single action such as cancelOrder without touching the configured action list."""
+        actions, compiled = self.message_template["actions"], self._compiled
+        self.message_template["actions"] = [{
+            "actionName": action_name,
+            "actionId": action_id,
+            "blockingType": blocking_type,
+            "actionParameters": action_parameters or []
+        }]
+        self._compiled = None
+        try:
+            self.publish_instant_actions(mqtt_client, robot_id)
+        finally:
+            self.message_template["actions"], self._compiled = actions, compiled
+
     def add_action(self, action_name, action_id, blocking_type, action_parameters):
         action = {
             "actionName": action_name,
@@ -92,6 +124,7 @@ class InstantActionsPublisher:
             "actionParameters": action_parameters
         }
         self.message_template["actions"].append(action)
+        self._compiled = None
 
     def update_action(self, index, action_name=None, action_id=None, blocking_type=None, action_parameters=None):
         try:
@@ -104,11 +137,13 @@ class InstantActionsPublisher:
                 action["blockingType"] = blocking_type
             if action_parameters:
                 action["actionParameters"] = action_parameters
+            self._compiled = None
         except IndexError:
             self.logger.error(f"Action index {index} is out of range.")
 
     def remove_action(self, index):
         try:
             self.message_template["actions"].pop(index)
+            self._compiled = None
         except IndexError:
             self.logger.error(f"Action index {index} is out of range.")
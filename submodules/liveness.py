@@ -0,0 +1,288 @@
+import time
+import logging
+import threading
+
+
+class TimerWheel:
+    """Hierarchical timing wheel; schedule, cancel and per-tick expiry are O(1)."""
+
+    def __init__(self, tick=0.1, slots=64, levels=4, start=None):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.wheels = [[{} for _ in range(slots)] for _ in range(levels)]
+        self.timers = {}
+        start = time.time() if start is None else start
+        self.current_tick = int(start / tick)
+
+    def __len__(self):
+        return len(self.timers)
+
+    def __contains__(self, key):
+        return key in self.timers
+
+    def schedule(self, key, expires_at):
+        self.cancel(key)
+        self._place(key, max(int(expires_at / self.tick), self.current_tick + 1))
+
+    def cancel(self, key):
+        location = self.timers.pop(key, None)
+        if location is not None:
+            level, slot = location
+            del self.wheels[level][slot][key]
+
+    def _place(self, key, expiry_tick):
+        delta = expiry_tick - self.current_tick
+        span = self.slots
+        level = 0
+        while delta >= span and level < self.levels - 1:
+            span *= self.slots
+            level += 1
+        # Timers beyond the wheel horizon are parked in the farthest slot and re-placed on cascade.
+        slot_tick = min(expiry_tick, self.current_tick + span - 1)
+        slot = (slot_tick // (self.slots ** level)) % self.slots
+        self.wheels[level][slot][key] = expiry_tick
+        self.timers[key] = (level, slot)
+
+    def _cascade(self, level):
+        slot = (self.current_tick // (self.slots ** level)) % self.slots
+        bucket = self.wheels[level][slot]
+        self.wheels[level][slot] = {}
+        for key, expiry_tick in bucket.items():
+            del self.timers[key]
+            self._place(key, expiry_tick)
+
+    def advance(self, now=None):
+        """Moves the wheel to `now` and returns the keys whose timers expired."""
+        now = time.time() if now is None else now
+        target_tick = int(now / self.tick)
+        expired = []
+        while self.current_tick < target_tick:
+            self.current_tick += 1
+            level = 1
+            while level < self.levels and self.current_tick % (self.slots ** level) == 0:
+                self._cascade(level)
+                level += 1
+
+            slot = self.current_tick % self.slots
+            bucket = self.wheels[0][slot]
+            if not bucket:
+                continue
+            self.wheels[0][slot] = {}
+            for key, expiry_tick in bucket.items():
+                del self.timers[key]
+                if expiry_tick <= self.current_tick:
+                    expired.append(key)
+                else:
+                    self._place(key, expiry_tick)
+        return expired
+
+
+class LivenessMonitor:
+    def __init__(self, timeout_factor=3.0, default_timeout=90.0, min_timeout=2.0, tick=0.1, check_interval=0.5,
+                 manufacturer_timeout_factors=None):
+        self.timeout_factor = timeout_factor
+        self.manufacturer_timeout_factors = dict(manufacturer_timeout_factors or {})
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.check_interval = check_interval
+
+        self.wheel = TimerWheel(tick=tick)
+        self.last_seen = {}
+        self.online = {}
+        self.reasons = {}
+        self.timeouts = {}
+        self.intervals = {}
+        self.callbacks = []
+        self.lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        self.logger = logging.getLogger('LivenessMonitor')
+        logging.basicConfig(level=logging.WARN)
+
+    def register_callback(self, callback):
+        """callback(robot_id, online, reason, timestamp) is invoked on every transition."""
+        self.callbacks.append(callback)
+
+    def get_timeout(self, robot_id):
+        return self.timeouts.get(robot_id, self.default_timeout)
+
+    def update_factsheet(self, factsheet_message):
+        robot_id = factsheet_message.get("serialNumber")
+        timing = factsheet_message.get("protocolLimits", {}).get("timing", {})
+        interval = timing.get("defaultStateInterval")
+        if not robot_id or not interval:
+            return
+        with self.lock:
+            self.intervals[robot_id] = (factsheet_message.get("manufacturer"), interval)
+            self._set_timeout(robot_id)
+
+    def _set_timeout(self, robot_id):
+        manufacturer, interval = self.intervals[robot_id]
+        factor = self.manufacturer_timeout_factors.get(manufacturer, self.timeout_factor)
+        self.timeouts[robot_id] = max(self.min_timeout, interval * factor)
+        if robot_id in self.wheel:
+            self.wheel.schedule(robot_id, self.last_seen[robot_id] + self.timeouts[robot_id])
+
+    def configure(self, timeout_factor=None, default_timeout=None, min_timeout=None, check_interval=None,
+                  manufacturer_timeout_factors=None):
+        """Applies new timeout settings at runtime and recomputes the timeout of every robot with a factsheet."""
+        with self.lock:
+            if timeout_factor is not None:
+                self.timeout_factor = timeout_factor
+            if default_timeout is not None:
+                self.default_timeout = default_timeout
+            if min_timeout is not None:
+                self.min_timeout = min_timeout
+            if check_interval is not None:
+                self.check_interval = check_interval
+            if manufacturer_timeout_factors is not None:
+                self.manufacturer_timeout_factors = dict(manufacturer_timeout_factors)
+            for robot_id in self.intervals:
+                self._set_timeout(robot_id)
+
+    def record_message(self, robot_id, now=None):
+        """Marks a robot as seen; O(1), the wheel timer is only re-armed when it fires."""
+        if not robot_id:
+            return
+        now = time.time() if now is None else now
+        transition = None
+        with self.lock:
+            self.last_seen[robot_id] = now
+            if not self.online.get(robot_id, False):
+                self.online[robot_id] = True
+                self.reasons[robot_id] = "MESSAGE"
+                transition = (robot_id, True, "MESSAGE", now)
+            if robot_id not in self.wheel:
+                self.wheel.schedule(robot_id, now + self.get_timeout(robot_id))
+        if transition:
+            self._notify(*transition)
+
+    def process_connection_message(self, connection_message, now=None):
+        robot_id = connection_message.get("serialNumber")
+        connection_state = connection_message.get("connectionState")
+        if not robot_id:
+            return
+        if connection_state == "ONLINE":
+            self.record_message(robot_id, now)
+            return
+
+        now = time.time() if now is None else now
+        transition = None
+        with self.lock:
+            self.last_seen[robot_id] = now
+            self.wheel.cancel(robot_id)
+            if self.online.get(robot_id, True) or self.reasons.get(robot_id) != connection_state:
+                transition = (robot_id, False, connection_state, now)
+            self.online[robot_id] = False
+            self.reasons[robot_id] = connection_state
+        if transition:
+            self._notify(*transition)
+
+    def check(self, now=None):
+        """Advances the timer wheel and marks robots that went silent as offline."""
+        now = time.time() if now is None else now
+        transitions = []
+        with self.lock:
+            for robot_id in self.wheel.advance(now):
+                deadline = self.last_seen[robot_id] + self.get_timeout(robot_id)
+                if deadline > now:
+                    self.wheel.schedule(robot_id, deadline)
+                elif self.online.get(robot_id, False):
+                    self.online[robot_id] = False
+                    self.reasons[robot_id] = "TIMEOUT"
+                    transitions.append((robot_id, False, "TIMEOUT", now))
+        for transition in transitions:
+            self._notify(*transition)
+        return transitions
+
+    def _notify(self, robot_id, online, reason, timestamp):
+        if online:
+            self.logger.info(f"AGV {robot_id} is online ({reason})")
+        else:
+            self.logger.warning(f"AGV {robot_id} is offline ({reason})")
+        for callback in self.callbacks:
+            try:
+                callback(robot_id, online, reason, timestamp)
+            except Exception as e:
+                self.logger.error(f"Liveness callback failed: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="LivenessMonitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.check_interval):
+            self.check()
+
+    def is_online(self, robot_id):
+        return self.online.get(robot_id, False)
+
+    def get_online_robots(self):
+        with self.lock:
+            return [robot_id for robot_id, online in self.online.items() if online]
+
+    def get_offline_robots(self):
+        with self.lock:
+            return [robot_id for robot_id, online in self.online.items() if not online]
+
+    def get_connectivity(self):
+        with self.lock:
+            return {
+                robot_id: {
+                    "online": online,
+                    "reason": self.reasons.get(robot_id),
+                    "lastSeen": self.last_seen.get(robot_id),
+                    "timeout": self.get_timeout(robot_id)
+                }
+                for robot_id, online in self.online.items()
+            }
+
+
+def benchmark(robot_count=5000, seconds=120, state_interval=1.0):
+    monitor = LivenessMonitor(default_timeout=3.0 * state_interval)
+    monitor.logger.setLevel(logging.ERROR)
+    robots = [f"agv_{i:05d}" for i in range(robot_count)]
+    silent = set(robots[::10])
+    start_time = time.time()
+    messages = 0
+    record_elapsed = 0.0
+    check_elapsed = 0.0
+
+    for second in range(seconds):
+        now = start_time + second * state_interval
+        start = time.perf_counter()
+        for robot_id in robots:
+            if second > seconds // 2 and robot_id in silent:
+                continue
+            monitor.record_message(robot_id, now)
+            messages += 1
+        record_elapsed += time.perf_counter() - start
+
+        start = time.perf_counter()
+        monitor.check(now)
+        check_elapsed += time.perf_counter() - start
+
+    result = {
+        "robots": robot_count,
+        "messages": messages,
+        "perMessageMicroseconds": record_elapsed / messages * 1e6,
+        "perCheckMilliseconds": check_elapsed / seconds * 1e3,
+        "offline": len(monitor.get_offline_robots())
+    }
+    print(f"Liveness benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
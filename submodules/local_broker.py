@@ -0,0 +1,245 @@
+import threading
+import logging
+from collections import deque
+
+
+def topic_matches(subscription, topic):
+    """MQTT topic filter matching with '+' and '#' wildcards."""
+    filter_parts = subscription.split('/')
+    topic_parts = topic.split('/')
+    for index, part in enumerate(filter_parts):
+        if part == '#':
+            return True
+        if index >= len(topic_parts):
+            return False
+        if part != '+' and part != topic_parts[index]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+class LocalMessage:
+    """Same attributes as paho's MQTTMessage, as far as the handlers use them."""
+
+    def __init__(self, topic, payload, qos=0, retain=False):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+
+class LocalBroker:
+    """In-process broker for tests and simulation; clients find it by (host, port) on connect."""
+
+    brokers = {}
+
+    def __init__(self, host="localhost", port=1883, synchronous=True):
+        self.host = host
+        self.port = port
+        # Synchronous brokers deliver inside publish(); otherwise messages wait in the client inbox.
+        self.synchronous = synchronous
+        self.subscriptions = {}
+        self.retained = {}
+        self._route_cache = {}
+        self.lock = threading.RLock()
+        self.published = 0
+        self.delivered = 0
+
+        self.logger = logging.getLogger('LocalBroker')
+        logging.basicConfig(level=logging.WARN)
+
+        LocalBroker.brokers[(host, port)] = self
+
+    @classmethod
+    def lookup(cls, host, port):
+        return cls.brokers.get((host, port))
+
+    def close(self):
+        with self.lock:
+            for client in list(self.subscriptions):
+                client._broker_closed()
+            self.subscriptions.clear()
+            self._route_cache.clear()
+        if LocalBroker.brokers.get((self.host, self.port)) is self:
+            del LocalBroker.brokers[(self.host, self.port)]
+
+    def attach(self, client):
+        with self.lock:
+            self.subscriptions.setdefault(client, {})
+
+    def detach(self, client):
+        with self.lock:
+            self.subscriptions.pop(client, None)
+            self._route_cache.clear()
+
+    def subscribe(self, client, topic, qos=0):
+        with self.lock:
+            self.subscriptions.setdefault(client, {})[topic] = qos
+            self._route_cache.clear()
+            retained = [message for name, message in self.retained.items() if topic_matches(topic, name)]
+        for message in retained:
+            client._enqueue(message)
+
+    def unsubscribe(self, client, topic):
+        with self.lock:
+            self.subscriptions.get(client, {}).pop(topic, None)
+            self._route_cache.clear()
+
+    def _routes(self, topic):
+        routes = self._route_cache.get(topic)
+        if routes is None:
+            routes = []
+            for client, filters in self.subscriptions.items():
+                matched = [qos for name, qos in filters.items() if topic_matches(name, topic)]
+                if matched:
+                    routes.append((client, max(matched)))
+            self._route_cache[topic] = routes
+        return routes
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self.lock:
+            self.published += 1
+            if retain:
+                if payload:
+                    self.retained[topic] = LocalMessage(topic, payload, qos, True)
+                else:
+                    self.retained.pop(topic, None)
+            routes = self._routes(topic)
+            self.delivered += len(routes)
+        for client, subscribed_qos in routes:
+            client._enqueue(LocalMessage(topic, payload, min(qos, subscribed_qos), False))
+
+    def get_stats(self):
+        return {
+            "clients": len(self.subscriptions),
+            "published": self.published,
+            "delivered": self.delivered,
+            "retained": len(self.retained)
+        }
+
+
+class LocalMessageInfo:
+    rc = 0
+
+    def __init__(self, mid):
+        self.mid = mid
+
+    def wait_for_publish(self, timeout=None):
+        return True
+
+    def is_published(self):
+        return True
+
+
+class LocalClient:
+    """Stand-in for paho.mqtt.client.Client that talks to a LocalBroker."""
+
+    def __init__(self, callback_api_version=None, client_id="", userdata=None):
+        self.client_id = client_id
+        self.userdata = userdata
+        self.on_connect = None
+        self.on_message = None
+        self.on_disconnect = None
+        self.broker = None
+        self.inbox = deque()
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.mid = 0
+
+    def user_data_set(self, userdata):
+        self.userdata = userdata
+
+    def connect(self, host, port=1883, keepalive=60):
+        broker = LocalBroker.lookup(host, port)
+        if broker is None:
+            raise ConnectionRefusedError(f"No local broker at {host}:{port}")
+        self.broker = broker
+        broker.attach(self)
+        if self.on_connect is not None:
+            self.on_connect(self, self.userdata, {}, 0, None)
+        return 0
+
+    def disconnect(self):
+        if self.broker is not None:
+            self.broker.detach(self)
+            self.broker = None
+            if self.on_disconnect is not None:
+                self.on_disconnect(self, self.userdata, {}, 0, None)
+        self.loop_stop()
+        return 0
+
+    def _broker_closed(self):
+        self.broker = None
+
+    def subscribe(self, topic, qos=0):
+        self.broker.subscribe(self, topic, qos)
+        self.mid += 1
+        return 0, self.mid
+
+    def unsubscribe(self, topic):
+        self.broker.unsubscribe(self, topic)
+        self.mid += 1
+        return 0, self.mid
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.mid += 1
+        if self.broker is not None:
+            self.broker.publish(topic, payload if payload is not None else b"", qos, retain)
+        return LocalMessageInfo(self.mid)
+
+    def _enqueue(self, message):
+        if self.broker is not None and self.broker.synchronous and not self.running:
+            self._dispatch(message)
+            return
+        with self.condition:
+            self.inbox.append(message)
+            self.condition.notify()
+
+    def _dispatch(self, message):
+        if self.on_message is not None:
+            self.on_message(self, self.userdata, message)
+
+    def loop(self, timeout=1.0):
+        """Delivers every queued message; returns how many were handled."""
+        handled = 0
+        while True:
+            with self.condition:
+                if not self.inbox:
+                    return handled
+                message = self.inbox.popleft()
+            self._dispatch(message)
+            handled += 1
+
+    def _run(self):
+        while self.running:
+            with self.condition:
+                while self.running and not self.inbox:
+                    self.condition.wait(0.5)
+            self.loop()
+
+    def loop_start(self):
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=f"LocalClient-{self.client_id}", daemon=True)
+        self.thread.start()
+
+    def loop_stop(self):
+        if self.thread is None:
+            return
+        self.running = False
+        with self.condition:
+            self.condition.notify()
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def loop_forever(self):
+        self.loop_start()
+        try:
+            while self.thread is not None:
+                self.thread.join(0.5)
+        except KeyboardInterrupt:
+            self.loop_stop()
@@ -0,0 +1,428 @@
+import os
+import json
+import math
+import time
+import heapq
+import hashlib
+import logging
+
+import numpy as np
+
+CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.map_cache')
+
+UNKNOWN_MAP = "UNKNOWN_MAP"
+NOT_LOCALIZED = "NOT_LOCALIZED"
+LOW_LOCALIZATION_SCORE = "LOW_LOCALIZATION_SCORE"
+POSITION_JUMP = "POSITION_JUMP"
+OFF_MAP = "OFF_MAP"
+IN_OBSTACLE = "IN_OBSTACLE"
+OFF_NETWORK = "OFF_NETWORK"
+OFF_PATH = "OFF_PATH"
+
+
+def _read_pgm(path):
+    """Binary (P5) or ASCII (P2) PGM as written by ROS map_saver."""
+    with open(path, 'rb') as image_file:
+        data = image_file.read()
+    tokens = []
+    position = 0
+    while len(tokens) < 4:
+        while data[position:position + 1].isspace():
+            position += 1
+        if data[position:position + 1] == b'#':
+            position = data.index(b'\n', position) + 1
+            continue
+        end = position
+        while not data[end:end + 1].isspace():
+            end += 1
+        tokens.append(data[position:end])
+        position = end
+    magic, width, height, max_value = tokens[0], int(tokens[1]), int(tokens[2]), int(tokens[3])
+    if magic == b'P5':
+        dtype = np.uint8 if max_value < 256 else np.dtype('>u2')
+        pixels = np.frombuffer(data, dtype=dtype, count=width * height, offset=position + 1)
+    elif magic == b'P2':
+        pixels = np.array(data[position:].split()[:width * height], dtype=np.int32)
+    else:
+        raise ValueError(f"Unsupported PGM format {magic!r} in {path}")
+    return pixels.reshape(height, width).astype(np.float32) / max_value
+
+
+def _segment_distances(points, segments, chunk=65536):
+    """Distance from every point to the nearest segment, chunked to bound memory."""
+    distances = np.full(len(points), np.inf, dtype=np.float32)
+    if not len(segments):
+        return distances
+    a = segments[:, 0, :]
+    ab = segments[:, 1, :] - a
+    length_squared = np.maximum((ab ** 2).sum(axis=1), 1e-12)
+    for start in range(0, len(points), chunk):
+        p = points[start:start + chunk, None, :]
+        t = np.clip(((p - a) * ab).sum(axis=2) / length_squared, 0.0, 1.0)
+        nearest = a + t[..., None] * ab
+        distances[start:start + chunk] = np.sqrt(((p - nearest) ** 2).sum(axis=2)).min(axis=1)
+    return distances
+
+
+class GridMap:
+    """One mapId rasterized: occupancy and distance to the node/edge network, both indexed by cell."""
+
+    def __init__(self, map_id, origin, resolution, occupied, nodes=None, edges=None, path_tolerance=None,
+                 path_distance=None):
+        self.map_id = map_id
+        self.origin_x, self.origin_y = float(origin[0]), float(origin[1])
+        self.resolution = float(resolution)
+        # Row 0 is the lowest y, unlike image files.
+        self.occupied = occupied
+        self.height, self.width = occupied.shape
+        self.nodes = {node["node_id"]: (float(node["x"]), float(node["y"])) for node in nodes or []}
+        self.edges = np.array([[self.nodes[start], self.nodes[end]] for start, end in edges or []],
+                              dtype=np.float64).reshape(-1, 2, 2)
+        # Map edges can be driven both ways.
+        self.links = {node_id: [] for node_id in self.nodes}
+        for start, end in edges or []:
+            length = math.dist(self.nodes[start], self.nodes[end])
+            self.links[start].append((end, length))
+            self.links[end].append((start, length))
+        self.path_tolerance = path_tolerance
+        self.path_distance = path_distance
+        if self.path_distance is None and path_tolerance is not None and len(self.edges):
+            self.path_distance = self.build_path_distance()
+
+    def build_path_distance(self, piece_length=2.0):
+        """Distance to the nearest edge, exact up to twice path_tolerance and inf beyond.
+
+        Edges are cut into short pieces and each piece only fills the cells of its padded bounding
+        box, so the cost follows the network length instead of cells times edges.
+        """
+        reach = 2.0 * self.path_tolerance
+        field = np.full((self.height, self.width), np.inf, dtype=np.float32)
+        for (ax, ay), (bx, by) in self.edges:
+            pieces = max(1, int(math.ceil(math.hypot(bx - ax, by - ay) / piece_length)))
+            for k in range(pieces):
+                t0, t1 = k / pieces, (k + 1) / pieces
+                segment = np.array([[[ax + t0 * (bx - ax), ay + t0 * (by - ay)],
+                                     [ax + t1 * (bx - ax), ay + t1 * (by - ay)]]])
+                c0 = max(0, int((segment[0, :, 0].min() - reach - self.origin_x) / self.resolution))
+                c1 = min(self.width, int((segment[0, :, 0].max() + reach - self.origin_x) / self.resolution) + 1)
+                r0 = max(0, int((segment[0, :, 1].min() - reach - self.origin_y) / self.resolution))
+                r1 = min(self.height, int((segment[0, :, 1].max() + reach - self.origin_y) / self.resolution) + 1)
+                if c0 >= c1 or r0 >= r1:
+                    continue
+                columns, rows = np.meshgrid(np.arange(c0, c1), np.arange(r0, r1))
+                centers = np.stack([
+                    self.origin_x + (columns.ravel() + 0.5) * self.resolution,
+                    self.origin_y + (rows.ravel() + 0.5) * self.resolution
+                ], axis=1)
+                distances = _segment_distances(centers, segment).reshape(r1 - r0, c1 - c0)
+                np.minimum(field[r0:r1, c0:c1], distances, out=field[r0:r1, c0:c1])
+        return field
+
+    def route(self, start, goal):
+        """Shortest node sequence from start to goal over the map edges, or None when there is none."""
+        if start not in self.links or goal not in self.links:
+            return None
+        distances = {start: 0.0}
+        previous = {}
+        queue = [(0.0, start)]
+        while queue:
+            distance, node_id = heapq.heappop(queue)
+            if node_id == goal:
+                path = [goal]
+                while path[-1] != start:
+                    path.append(previous[path[-1]])
+                return path[::-1]
+            if distance > distances[node_id]:
+                continue
+            for neighbour, length in self.links[node_id]:
+                candidate = distance + length
+                if candidate < distances.get(neighbour, math.inf):
+                    distances[neighbour] = candidate
+                    previous[neighbour] = node_id
+                    heapq.heappush(queue, (candidate, neighbour))
+        return None
+
+    def cell(self, x, y):
+        column = int(math.floor((x - self.origin_x) / self.resolution))
+        row = int(math.floor((y - self.origin_y) / self.resolution))
+        if 0 <= row < self.height and 0 <= column < self.width:
+            return row, column
+        return None
+
+
+def _rasterize(definition):
+    resolution = definition.get("resolution", 0.1)
+    origin = definition.get("origin", [0.0, 0.0])
+    if definition.get("ros_yaml"):
+        import yaml
+        with open(definition["ros_yaml"], 'r') as yaml_file:
+            metadata = yaml.safe_load(yaml_file)
+        image = metadata["image"]
+        if not os.path.isabs(image):
+            image = os.path.join(os.path.dirname(definition["ros_yaml"]), image)
+        pixels = _read_pgm(image)
+        occupancy = pixels if metadata.get("negate", 0) else 1.0 - pixels
+        occupied = np.flipud(occupancy > metadata.get("occupied_thresh", 0.65))
+        return metadata["origin"][:2], metadata["resolution"], np.ascontiguousarray(occupied)
+
+    width = int(math.ceil(definition["width"] / resolution))
+    height = int(math.ceil(definition["height"] / resolution))
+    occupied = np.zeros((height, width), dtype=bool)
+    for x_min, y_min, x_max, y_max in definition.get("obstacles", []):
+        c0 = max(0, int(math.floor((x_min - origin[0]) / resolution)))
+        c1 = min(width, int(math.ceil((x_max - origin[0]) / resolution)))
+        r0 = max(0, int(math.floor((y_min - origin[1]) / resolution)))
+        r1 = min(height, int(math.ceil((y_max - origin[1]) / resolution)))
+        occupied[r0:r1, c0:c1] = True
+    return origin, resolution, occupied
+
+
+def _definition_digest(definition):
+    digest = hashlib.sha1(json.dumps(definition, sort_keys=True).encode())
+    if definition.get("ros_yaml"):
+        import yaml
+        with open(definition["ros_yaml"], 'rb') as yaml_file:
+            raw = yaml_file.read()
+        digest.update(raw)
+        image = yaml.safe_load(raw)["image"]
+        if not os.path.isabs(image):
+            image = os.path.join(os.path.dirname(definition["ros_yaml"]), image)
+        with open(image, 'rb') as image_file:
+            digest.update(image_file.read())
+    return digest.hexdigest()
+
+
+def load_map(definition, cache_directory=CACHE_DIRECTORY):
+    """Builds a GridMap, reusing the rasterized arrays from the cache when the definition is unchanged."""
+    map_id = definition["map_id"]
+    path_tolerance = definition.get("path_tolerance")
+    cache_path = None
+    if cache_directory is not None:
+        cache_path = os.path.join(cache_directory, f"{map_id}-{_definition_digest(definition)}.npz")
+        try:
+            with np.load(cache_path) as cached:
+                return GridMap(map_id, cached["origin"], float(cached["resolution"]), cached["occupied"],
+                               definition.get("nodes"), definition.get("edges"), path_tolerance,
+                               cached["path_distance"] if cached["path_distance"].size else None)
+        except (OSError, KeyError, ValueError):
+            pass
+
+    origin, resolution, occupied = _rasterize(definition)
+    grid_map = GridMap(map_id, origin, resolution, occupied, definition.get("nodes"), definition.get("edges"),
+                       path_tolerance)
+    if cache_path is not None:
+        try:
+            os.makedirs(cache_directory, exist_ok=True)
+            temporary = f"{cache_path}.{os.getpid()}.tmp.npz"
+            np.savez(temporary, origin=np.array(origin, dtype=np.float64), resolution=resolution, occupied=occupied,
+                     path_distance=grid_map.path_distance if grid_map.path_distance is not None else np.zeros(0))
+            os.replace(temporary, cache_path)
+        except OSError as e:
+            logging.getLogger('MapRegistry').warning(f"Could not write map cache for {map_id}: {e}")
+    return grid_map
+
+
+class _OrderPath:
+    """Node positions and allowed deviations of one order, indexed by node sequenceId."""
+
+    def __init__(self, order, default_deviation):
+        nodes = sorted((n for n in order.get("nodes", []) if n.get("nodePosition")),
+                       key=lambda n: n.get("sequenceId", 0))
+        self.order_id = order.get("orderId")
+        self.index = {node.get("sequenceId", 0): i for i, node in enumerate(nodes)}
+        self.xy = np.array([[n["nodePosition"]["x"], n["nodePosition"]["y"]] for n in nodes],
+                           dtype=np.float64).reshape(-1, 2)
+        self.deviation = np.array([n["nodePosition"].get("allowedDeviationXy") or default_deviation for n in nodes],
+                                  dtype=np.float64)
+
+    def deviation_at(self, sequence_id, x, y, left_node):
+        """Returns (distance, allowed) from the last node, or from the edge to the next node once left."""
+        i = self.index.get(sequence_id)
+        if i is None:
+            return None
+        ax, ay = self.xy[i]
+        if not left_node or i + 1 >= len(self.xy):
+            return math.hypot(x - ax, y - ay), self.deviation[i]
+        bx, by = self.xy[i + 1]
+        dx, dy = bx - ax, by - ay
+        length_squared = dx * dx + dy * dy
+        t = 0.0 if length_squared == 0.0 else min(1.0, max(0.0, ((x - ax) * dx + (y - ay) * dy) / length_squared))
+        return math.hypot(x - ax - t * dx, y - ay - t * dy), max(self.deviation[i], self.deviation[i + 1])
+
+
+class MapRegistry:
+    """Checks reported positions against preloaded maps and the robot's order, without the database."""
+
+    def __init__(self, maps=None, cache_directory=CACHE_DIRECTORY, min_localization_score=0.5, max_speed=2.0,
+                 jump_tolerance=1.0, default_deviation=0.5, node_tolerance=0.1):
+        self.cache_directory = cache_directory
+        self.min_localization_score = min_localization_score
+        self.max_speed = max_speed
+        self.jump_tolerance = jump_tolerance
+        self.default_deviation = default_deviation
+        self.node_tolerance = node_tolerance
+        self.maps = {}
+        self.orders = {}
+        self.last_positions = {}
+
+        self.logger = logging.getLogger('MapRegistry')
+        logging.basicConfig(level=logging.WARN)
+
+        for definition in maps or []:
+            self.add_map(definition)
+
+    def add_map(self, definition):
+        start = time.perf_counter()
+        try:
+            grid_map = load_map(definition, self.cache_directory)
+        except Exception as e:
+            self.logger.error(f"Failed to load map {definition.get('map_id')}: {e}")
+            return None
+        self.maps[grid_map.map_id] = grid_map
+        self.logger.info(f"Loaded map {grid_map.map_id} ({grid_map.width}x{grid_map.height} cells) "
+                         f"in {(time.perf_counter() - start) * 1e3:.1f} ms")
+        return grid_map
+
+    def register_order(self, robot_id, order):
+        self.orders[robot_id] = _OrderPath(order, self.default_deviation)
+
+    def on_order_published(self, robot_id, order):
+        self.register_order(robot_id, order)
+
+    def remove_robot(self, robot_id):
+        self.orders.pop(robot_id, None)
+        self.last_positions.pop(robot_id, None)
+
+    def check_state(self, state_message, now=None):
+        """Alerts for one state message; every check is a constant number of array lookups."""
+        position = state_message.get("agvPosition")
+        if not position:
+            return []
+        serial_number = state_message.get("serialNumber")
+        now = time.time() if now is None else now
+        x, y = position.get("x", 0.0), position.get("y", 0.0)
+        map_id = position.get("mapId")
+        alerts = []
+
+        def alert(alert_type, **details):
+            alerts.append({"type": alert_type, "serialNumber": serial_number, "mapId": map_id, **details})
+
+        if not position.get("positionInitialized", True):
+            alert(NOT_LOCALIZED)
+            return alerts
+        score = position.get("localizationScore")
+        if score is not None and score < self.min_localization_score:
+            alert(LOW_LOCALIZATION_SCORE, localizationScore=score)
+
+        previous = self.last_positions.get(serial_number)
+        self.last_positions[serial_number] = (x, y, map_id, now)
+        if previous is not None and previous[2] == map_id:
+            jump = math.hypot(x - previous[0], y - previous[1])
+            if jump > self.max_speed * max(0.0, now - previous[3]) + self.jump_tolerance:
+                # The robot relocalized, or its localization is wrong.
+                alert(POSITION_JUMP, distance=jump, previous={"x": previous[0], "y": previous[1]})
+
+        grid_map = self.maps.get(map_id)
+        if grid_map is None:
+            if self.maps:
+                alert(UNKNOWN_MAP)
+        else:
+            cell = grid_map.cell(x, y)
+            if cell is None:
+                alert(OFF_MAP, x=x, y=y)
+            else:
+                if grid_map.occupied[cell]:
+                    alert(IN_OBSTACLE, x=x, y=y)
+                if grid_map.path_distance is not None:
+                    distance = float(grid_map.path_distance[cell])
+                    if distance > grid_map.path_tolerance:
+                        alert(OFF_NETWORK, distance=distance, allowed=grid_map.path_tolerance)
+
+        path = self.orders.get(serial_number)
+        if path is not None and path.order_id == state_message.get("orderId"):
+            left_node = (state_message.get("distanceSinceLastNode") or 0.0) > self.node_tolerance
+            deviation = path.deviation_at(state_message.get("lastNodeSequenceId", 0), x, y, left_node)
+            if deviation is not None and deviation[0] > deviation[1]:
+                alert(OFF_PATH, deviation=deviation[0], allowed=float(deviation[1]),
+                      lastNodeId=state_message.get("lastNodeId"))
+        return alerts
+
+    def get_stats(self):
+        return {
+            "maps": {map_id: {"cells": m.width * m.height, "resolution": m.resolution, "edges": len(m.edges)}
+                     for map_id, m in self.maps.items()},
+            "trackedOrders": len(self.orders),
+            "trackedRobots": len(self.last_positions)
+        }
+
+
+def benchmark(size=200.0, resolution=0.1, robots=500, messages=100000, seed=43):
+    """Map preload with and without the cache, and per-state check cost on a 2000x2000 cell map."""
+    import random
+    import tempfile
+
+    rng = random.Random(seed)
+    # Aisle network: a lattice of nodes every spacing metres, connected to their right and upper neighbours.
+    spacing = 10.0
+    steps = int(size / spacing)
+    nodes = [{"node_id": f"n_{i}_{j}", "x": (i + 0.5) * spacing, "y": (j + 0.5) * spacing}
+             for i in range(steps) for j in range(steps)]
+    edges = [[f"n_{i}_{j}", f"n_{i + 1}_{j}"] for i in range(steps - 1) for j in range(steps)]
+    edges += [[f"n_{i}_{j}", f"n_{i}_{j + 1}"] for i in range(steps) for j in range(steps - 1)]
+    edge_count = len(edges)
+    by_id = {node["node_id"]: node for node in nodes}
+    obstacles = []
+    for _ in range(200):
+        x, y = rng.uniform(0, size), rng.uniform(0, size)
+        obstacles.append([x, y, x + rng.uniform(1, 5), y + rng.uniform(1, 5)])
+    definition = {"map_id": "bench_map", "width": size, "height": size, "resolution": resolution,
+                  "obstacles": obstacles, "nodes": nodes, "edges": edges, "path_tolerance": 1.0}
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        registry = MapRegistry([definition], cache_directory=directory)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        registry = MapRegistry([definition], cache_directory=directory)
+        warm = time.perf_counter() - start
+
+    for r in range(robots):
+        a, b = (by_id[node_id] for node_id in edges[r % edge_count])
+        registry.register_order(f"agv_{r}", {"orderId": f"order_{r}", "nodes": [
+            {"nodeId": a["node_id"], "sequenceId": 0, "nodePosition": {"x": a["x"], "y": a["y"], "allowedDeviationXy": 0.5}},
+            {"nodeId": b["node_id"], "sequenceId": 2, "nodePosition": {"x": b["x"], "y": b["y"], "allowedDeviationXy": 0.5}}
+        ]})
+    states = []
+    for i in range(messages):
+        r = i % robots
+        a, b = (by_id[node_id] for node_id in edges[r % edge_count])
+        t = (i // robots) * robots / messages
+        states.append({
+            "serialNumber": f"agv_{r}", "orderId": f"order_{r}", "lastNodeId": a["node_id"], "lastNodeSequenceId": 0,
+            "distanceSinceLastNode": 1.0,
+            "agvPosition": {"x": a["x"] + t * (b["x"] - a["x"]) + rng.gauss(0, 0.3),
+                            "y": a["y"] + t * (b["y"] - a["y"]) + rng.gauss(0, 0.3),
+                            "theta": 0.0, "mapId": "bench_map", "positionInitialized": True,
+                            "localizationScore": rng.uniform(0.3, 1.0)}
+        })
+
+    alerts = 0
+    start = time.perf_counter()
+    for i, state in enumerate(states):
+        alerts += len(registry.check_state(state, now=i / robots))
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "cells": registry.maps["bench_map"].width * registry.maps["bench_map"].height,
+        "coldLoadSeconds": cold,
+        "cachedLoadSeconds": warm,
+        "perStateMicroseconds": elapsed / messages * 1e6,
+        "statesPerSecond": messages / elapsed,
+        "alerts": alerts
+    }
+    print(f"Map registry benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,262 @@
+import re
+import time
+import logging
+import datetime
+
+logger = logging.getLogger('Migrations')
+
+# Arbitrary application-wide key so concurrent fleet managers serialise their migrations.
+MIGRATION_LOCK_ID = 505001
+
+INITIAL_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS connection (
+        id SERIAL PRIMARY KEY,
+        header_id INTEGER,
+        timestamp TIMESTAMP,
+        version VARCHAR(50),
+        manufacturer VARCHAR(100),
+        serial_number VARCHAR(100),
+        connection_state VARCHAR(50)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS factsheet (
+        id SERIAL PRIMARY KEY,
+        header_id INTEGER,
+        timestamp TIMESTAMP,
+        version VARCHAR(50),
+        manufacturer VARCHAR(100),
+        serial_number VARCHAR(100),
+        series_name VARCHAR(100),
+        agv_kinematic VARCHAR(50),
+        agv_class VARCHAR(50),
+        max_load_mass INTEGER,
+        localization_types TEXT[],
+        navigation_types TEXT[],
+        speed_min REAL,
+        speed_max REAL,
+        acceleration_max REAL,
+        deceleration_max REAL,
+        height_min REAL,
+        height_max REAL,
+        width REAL,
+        length REAL,
+        -- Protocol Limits
+        msg_len INTEGER,
+        topic_serial_len INTEGER,
+        topic_elem_len INTEGER,
+        id_len INTEGER,
+        id_numerical_only BOOLEAN,
+        enum_len INTEGER,
+        load_id_len INTEGER,
+        order_nodes_max INTEGER,
+        order_edges_max INTEGER,
+        node_actions_max INTEGER,
+        edge_actions_max INTEGER,
+        actions_parameters_max INTEGER,
+        instant_actions_max INTEGER,
+        trajectory_knot_vector_max INTEGER,
+        trajectory_control_points_max INTEGER,
+        state_node_states_max INTEGER,
+        state_edge_states_max INTEGER,
+        state_loads_max INTEGER,
+        state_action_states_max INTEGER,
+        state_errors_max INTEGER,
+        state_information_max INTEGER,
+        error_references_max INTEGER,
+        information_references_max INTEGER,
+        min_order_interval REAL,
+        min_state_interval REAL,
+        default_state_interval REAL,
+        visualization_interval REAL,
+        -- Protocol Features
+        optional_parameters JSONB,
+        agv_actions JSONB,
+        -- AGV Geometry
+        wheel_definitions JSONB,
+        envelopes_2d JSONB,
+        -- Load Specification
+        load_positions TEXT[],
+        load_sets JSONB
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS instant_actions (
+        id SERIAL PRIMARY KEY,
+        header_id INTEGER,
+        timestamp TIMESTAMP,
+        version VARCHAR(50),
+        manufacturer VARCHAR(100),
+        serial_number VARCHAR(100),
+        actions JSONB
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS orders (
+        id SERIAL PRIMARY KEY,
+        header_id INTEGER,
+        timestamp TIMESTAMP,
+        version VARCHAR(50),
+        manufacturer VARCHAR(100),
+        serial_number VARCHAR(100),
+        order_id VARCHAR(100),
+        order_update_id INTEGER,
+        zone_set_id VARCHAR(100),
+        nodes JSONB,
+        edges JSONB
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS state (
+        id SERIAL PRIMARY KEY,
+        header_id INTEGER,
+        timestamp TIMESTAMP,
+        version VARCHAR(50),
+        manufacturer VARCHAR(100),
+        serial_number VARCHAR(100),
+        order_id VARCHAR(100),
+        order_update_id INTEGER,
+        zone_set_id VARCHAR(100),
+        last_node_id VARCHAR(100),
+        last_node_sequence_id INTEGER,
+        driving BOOLEAN,
+        paused BOOLEAN,
+        new_base_request BOOLEAN,
+        distance_since_last_node REAL,
+        operating_mode VARCHAR(50),
+        node_states JSONB,
+        edge_states JSONB,
+        agv_position JSONB,
+        velocity JSONB,
+        loads JSONB,
+        action_states JSONB,
+        battery_state JSONB,
+        errors JSONB,
+        information JSONB,
+        safety_state JSONB
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS anomaly_events (
+        id SERIAL PRIMARY KEY,
+        timestamp TIMESTAMP,
+        manufacturer VARCHAR(100),
+        serial_number VARCHAR(100),
+        event_type VARCHAR(50),
+        severity VARCHAR(20),
+        details JSONB
+    );
+    """
+]
+
+TIME_SERIES_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS state_serial_timestamp_idx ON state (serial_number, timestamp);",
+    # BRIN keeps append-only time scans cheap without the write cost of a B-tree on every row.
+    "CREATE INDEX IF NOT EXISTS state_timestamp_brin_idx ON state USING BRIN (timestamp);",
+    "CREATE INDEX IF NOT EXISTS connection_serial_timestamp_idx ON connection (serial_number, timestamp);",
+    "CREATE INDEX IF NOT EXISTS orders_serial_timestamp_idx ON orders (serial_number, timestamp);",
+    "CREATE INDEX IF NOT EXISTS orders_order_id_idx ON orders (order_id, order_update_id);",
+    "CREATE INDEX IF NOT EXISTS instant_actions_serial_timestamp_idx ON instant_actions (serial_number, timestamp);",
+    "CREATE INDEX IF NOT EXISTS factsheet_serial_timestamp_idx ON factsheet (serial_number, timestamp);",
+    "CREATE INDEX IF NOT EXISTS anomaly_events_serial_timestamp_idx ON anomaly_events (serial_number, timestamp);"
+]
+
+HISTORY_QUERY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS state_order_id_idx ON state (order_id, serial_number, timestamp);",
+]
+
+# Publishers resume from MAX(header_id) at startup; an index turns that into a single lookup.
+HEADER_ID_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS orders_header_id_idx ON orders (header_id);",
+    "CREATE INDEX IF NOT EXISTS instant_actions_header_id_idx ON instant_actions (header_id);",
+]
+
+# (version, description, steps); a step is an SQL string or a callable taking a cursor.
+MIGRATIONS = [
+    (1, "initial tables", INITIAL_TABLES),
+    (2, "time-series indexes", TIME_SERIES_INDEXES),
+    (3, "history query indexes", HISTORY_QUERY_INDEXES),
+    (4, "header id indexes", HEADER_ID_INDEXES),
+]
+
+
+def sqlite_statement(step):
+    """PostgreSQL DDL rewritten for the embedded SQLite backend; None when SQLite has no equivalent."""
+    if "USING BRIN" in step:
+        # SQLite rowids are already in insert (time) order, which is what the BRIN index exploits.
+        return None
+    step = step.replace("SERIAL PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT")
+    step = step.replace("TEXT[]", "TEXT")
+    return re.sub(r"\bJSONB\b", "TEXT", step)
+
+
+def _current_version(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        version = cursor.fetchone()[0]
+        conn.commit()
+        return version
+    except Exception:
+        conn.rollback()
+        return None
+
+
+def _create_version_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(200),
+            applied_at TIMESTAMP
+        );
+    """)
+
+
+def apply_migrations(conn, migrations=MIGRATIONS):
+    """Brings the schema to the latest version; a single SELECT when it is already current."""
+    latest = migrations[-1][0] if migrations else 0
+    current = _current_version(conn)
+    if current is not None and current >= latest:
+        return current
+
+    sqlite = getattr(conn, "dialect", "postgres") == "sqlite"
+    autocommit = conn.autocommit
+    conn.autocommit = False
+    try:
+        for version, description, steps in migrations:
+            if current is not None and version <= current:
+                continue
+            start = time.perf_counter()
+            cursor = conn.cursor()
+            try:
+                if not sqlite:
+                    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+                _create_version_table(cursor)
+                cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+                if cursor.fetchone():
+                    conn.commit()
+                    continue
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                        continue
+                    if sqlite:
+                        step = sqlite_statement(step)
+                        if step is None:
+                            continue
+                    cursor.execute(step)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description, applied_at) VALUES (%s, %s, %s)",
+                    (version, description, datetime.datetime.now())
+                )
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Migration {version} ({description}) failed: {e}")
+                raise
+            logger.info(f"Applied migration {version} ({description}) in {time.perf_counter() - start:.3f}s")
+    finally:
+        conn.autocommit = autocommit
+    return latest
+
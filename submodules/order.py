@@ -1,21 +1,46 @@
 import json
 import datetime
 import logging
+import threading
+from submodules.database_writer import DatabaseWriter
+from submodules.compiled_template import CompiledTemplate
+from submodules.zones import BLOCKED
+
+ORDER_COLUMNS = (
+    "header_id", "timestamp", "version", "manufacturer", "serial_number", "order_id", "zone_set_id",
+    "order_update_id", "nodes", "edges"
+)
+
+ORDER_DYNAMIC_FIELDS = ("headerId", "timestamp", "serialNumber", "orderId", "orderUpdateId")
 
 class OrderPublisher:
-    def __init__(self, fleetname, version, versions, manufacturer, db_conn):
+    def __init__(self, fleetname, version, versions, manufacturer, db_conn, db_writer=None, compiled_template=False,
+                 trajectory_analyzer=None, zone_manager=None, validator=None):
         self.fleetname = fleetname
         self.version = version
         self.manufacturer = manufacturer
         self.versions = versions
         self.db_conn = db_conn  
+        self.db_writer = db_writer if db_writer is not None else DatabaseWriter(db_conn)
+        self.publish_listeners = []
+        self.use_compiled_template = compiled_template
+        self._compiled = None
+        self.trajectory_analyzer = trajectory_analyzer
+        self.zone_manager = zone_manager
+        self._zone_check = None
+        self.validator = validator
+        self._validation_issues = None
+        self.last_validation_issues = []
+        # The order is built in place on message_template, so callers on different threads hold this from
+        # new_order() through publish_order(); otherwise two orders interleave into one.
+        self.lock = threading.RLock()
 
         self.logger = logging.getLogger('OrderPublisher')
         logging.basicConfig(level=logging.WARN)
 
         # Header ID'yi veritabanından yükle
         self.message_template = {
-            "headerId": self._load_last_header_id_from_db(),
+            "headerId": self._load_last_header_id_from_db() if db_conn is not None else 0,
             "timestamp": None,
             "version": self.version,
             "manufacturer": self.manufacturer,
@@ -26,7 +51,7 @@ class OrderPublisher:
             "nodes": [
                 {
                     "nodeId": "node_1",
-                    "sequenceId": 1,
+                    "sequenceId": 0,
                     "nodeDescription": "First node",
                     "released": True,
                     "nodePosition": {
@@ -50,12 +75,28 @@ class OrderPublisher:
                             ]
                         }
                     ]
+                },
+                {
+                    "nodeId": "node_2",
+                    "sequenceId": 2,
+                    "nodeDescription": "Second node",
+                    "released": True,
+                    "nodePosition": {
+                        "x": 10.0,
+                        "y": 0.0,
+                        "theta": 0.0,
+                        "mapId": "map_1",
+                        "allowedDeviationXy": 0.1,
+                        "allowedDeviationTheta": 0.1,
+                        "mapDescription": "Ground floor"
+                    },
+                    "actions": []
                 }
             ],
             "edges": [
                 {
                     "edgeId": "edge_1",
-                    "sequenceId": 2,
+                    "sequenceId": 1,
                     "edgeDescription": "Edge to node 2",
                     "released": True,
                     "startNodeId": "node_1",
@@ -69,7 +110,7 @@ class OrderPublisher:
                     "maxRotationSpeed": 0.5,
                     "length": 10.0,
                     "trajectory": {
-                        "degree": 3,
+                        "degree": 2,
                         "knotVector": [0, 0, 0, 1, 1, 1],
                         "controlPoints": [
                             {"x": 0.0, "y": 0.0, "weight": 1.0},
@@ -93,6 +134,10 @@ class OrderPublisher:
             self.logger.error(f"Failed to load last headerId from database: {e}")
             return 0
 
+    def sync_header_id(self):
+        """Continues after the last stored headerId once the database connects after startup."""
+        self.message_template["headerId"] = max(self.message_template["headerId"], self._load_last_header_id_from_db())
+
     def _update_timestamp(self):
         self.message_template["timestamp"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
 
@@ -103,39 +148,108 @@ class OrderPublisher:
         self._increment_header_id()  
         self._update_timestamp()  
 
-        try:
-            cursor = self.db_conn.cursor()
-            insert_query = """
-                INSERT INTO orders (header_id, timestamp, version, manufacturer, serial_number, order_id, zone_set_id, order_update_id, nodes, edges)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            cursor.execute(insert_query, (
-                self.message_template["headerId"],
-                datetime.datetime.now(),
-                self.version,
-                self.manufacturer,
-                self.robot_id,
-                self.message_template["orderId"],
-                self.message_template["zoneSetId"],
-                self.message_template["orderUpdateId"],
+        self.db_writer.insert("orders", ORDER_COLUMNS, (
+            self.message_template["headerId"],
+            datetime.datetime.now(),
+            self.version,
+            self.manufacturer,
+            self.robot_id,
+            self.message_template["orderId"],
+            self.message_template["zoneSetId"],
+            self.message_template["orderUpdateId"],
+            *self._encoded_nodes_and_edges()
+        ))
+
+    def invalidate_compiled_template(self):
+        """Must be called after changing message_template outside the add/update/remove methods."""
+        self._compiled = None
+        self._zone_check = None
+        self._validation_issues = None
+
+    def _validate(self):
+        """Runs the pre-publish validator on the current order; cached until the order changes."""
+        if self.validator is None:
+            return True
+        if self._validation_issues is None:
+            self._validation_issues = self.validator.validate(self.message_template)
+            # Sanitizing may have reordered nodes and edges.
+            self._compiled = None
+        self.last_validation_issues = self._validation_issues
+        for issue in self._validation_issues:
+            self.logger.error(f"Order {self.message_template['orderId']} not published, {issue['type']} at "
+                              f"{issue['path']}: {issue['message']}")
+        return not self._validation_issues
+
+    def _check_zones(self):
+        """Stamps the active zoneSetId for the order's map and validates it; cached until the order changes."""
+        if self.zone_manager is None:
+            return True
+        if self._zone_check is not None and self._zone_check[0] == self.zone_manager.revision:
+            return self._zone_check[1]
+
+        nodes = self.message_template["nodes"]
+        map_id = nodes[0].get("nodePosition", {}).get("mapId") if nodes else None
+        zone_set_id = self.zone_manager.expected_zone_set_id(map_id)
+        if zone_set_id is not None and zone_set_id != self.message_template["zoneSetId"]:
+            self.message_template["zoneSetId"] = zone_set_id
+            self._compiled = None
+
+        allowed = True
+        for violation in self.zone_manager.validate_order(self.message_template):
+            if violation["type"] == BLOCKED:
+                self.logger.error(f"Order {self.message_template['orderId']} enters blocked zone: {violation}")
+                allowed = False
+            else:
+                self.logger.warning(f"Order {self.message_template['orderId']} zone violation: {violation}")
+        self._zone_check = (self.zone_manager.revision, allowed)
+        return allowed
+
+    def _compile(self):
+        if self._compiled is None:
+            self._compiled = (
+                CompiledTemplate(self.message_template, ORDER_DYNAMIC_FIELDS),
                 json.dumps(self.message_template["nodes"]),
-                json.dumps(self.message_template["edges"]),
-                    ))
+                json.dumps(self.message_template["edges"])
+            )
+        return self._compiled
 
-            self.db_conn.commit()
-        except Exception as e:
-            self.logger.error(f"Failed to save data to database: {e}")
-            self.db_conn.rollback()
+    def _encoded_nodes_and_edges(self):
+        if self.use_compiled_template:
+            _, nodes, edges = self._compile()
+            return nodes, edges
+        return json.dumps(self.message_template["nodes"]), json.dumps(self.message_template["edges"])
 
     def publish_order(self, mqtt_client, robot_id):
+        if not self._check_zones():
+            return False
         self._update_timestamp()
         self.robot_id = robot_id
         self.message_template["serialNumber"] = robot_id        
-        message = json.dumps(self.message_template)
+        if not self._validate():
+            return False
+        if self.use_compiled_template:
+            message = self._compile()[0].render(self.message_template)
+        else:
+            message = json.dumps(self.message_template)
         topic = f"{self.fleetname}/{self.versions}/{self.manufacturer}/{robot_id}/order"
         mqtt_client.publish(topic, message, qos=0, retain=False)
         self._save_to_database()
+        for listener in self.publish_listeners:
+            listener(robot_id, self.message_template)
         self.logger.info(f"Order message published.")
+        return True
+
+    def add_publish_listener(self, listener):
+        """Registers a callback(robot_id, order) invoked after every published order."""
+        self.publish_listeners.append(listener)
+
+    def new_order(self, order_id, order_update_id=0):
+        """Starts a fresh order: clears nodes and edges and sets the order identifiers."""
+        self.message_template["orderId"] = order_id
+        self.message_template["orderUpdateId"] = order_update_id
+        self.message_template["nodes"] = []
+        self.message_template["edges"] = []
+        self.invalidate_compiled_template()
 
     def add_node(self, node_id, sequence_id, node_description, node_position, actions, released=True):
         node = {
@@ -147,6 +261,7 @@ class OrderPublisher:
             "released": released
         }
         self.message_template["nodes"].append(node)
+        self.invalidate_compiled_template()
 
     def update_node(self, index, **kwargs):
         try:
@@ -154,26 +269,41 @@ class OrderPublisher:
             for key, value in kwargs.items():
                 if key in node:
                     node[key] = value
+            self.invalidate_compiled_template()
         except IndexError:
             self.logger.error(f"Node index {index} is out of range.")
 
     def remove_node(self, index):
         try:
             self.message_template["nodes"].pop(index)
+            self.invalidate_compiled_template()
         except IndexError:
             self.logger.error(f"Node index {index} is out of range.")
 
-    def add_edge(self, edge_id, sequence_id, start_node_id, end_node_id, edge_description, actions, **kwargs):
+    def add_edge(self, edge_id, sequence_id, start_node_id, end_node_id, edge_description, actions, released=True,
+                 **kwargs):
         edge = {
             "edgeId": edge_id,
             "sequenceId": sequence_id,
             "edgeDescription": edge_description,
+            "released": released,
             "startNodeId": start_node_id,
             "endNodeId": end_node_id,
             "actions": actions,
             **kwargs
         }
+        if self.trajectory_analyzer is not None:
+            self.trajectory_analyzer.fill_edge(
+                edge, self._node_position(start_node_id), self._node_position(end_node_id)
+            )
         self.message_template["edges"].append(edge)
+        self.invalidate_compiled_template()
+
+    def _node_position(self, node_id):
+        for node in self.message_template["nodes"]:
+            if node["nodeId"] == node_id:
+                return node.get("nodePosition")
+        return None
 
     def update_edge(self, index, **kwargs):
         try:
@@ -181,11 +311,13 @@ class OrderPublisher:
             for key, value in kwargs.items():
                 if key in edge:
                     edge[key] = value
+            self.invalidate_compiled_template()
         except IndexError:
             self.logger.error(f"Edge index {index} is out of range.")
 
     def remove_edge(self, index):
         try:
             self.message_template["edges"].pop(index)
+            self.invalidate_compiled_template()
         except IndexError:
             self.logger.error(f"Edge index {index} is out of range.")
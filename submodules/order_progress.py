@@ -0,0 +1,256 @@
+import math
+import time
+import logging
+
+
+class _ActiveOrder:
+    """Precomputed suffix tables for one published order."""
+
+    def __init__(self, order, default_speed, offset_distance=0.0, offset_time=0.0):
+        self.order_id = order.get("orderId")
+        self.order_update_id = order.get("orderUpdateId", 0)
+
+        nodes = sorted(order.get("nodes", []), key=lambda n: n.get("sequenceId", 0))
+        edges = sorted(order.get("edges", []), key=lambda e: e.get("sequenceId", 0))
+
+        self.node_ids = [node.get("nodeId") for node in nodes]
+        self.node_sequence_ids = [node.get("sequenceId", 0) for node in nodes]
+        self.node_index = {seq: i for i, seq in enumerate(self.node_sequence_ids)}
+
+        count = len(nodes)
+        # edge_length[i] / edge_speed[i] describe the edge leaving node i
+        self.edge_length = [0.0] * count
+        self.edge_speed = [default_speed] * count
+        for i in range(count - 1):
+            edge = edges[i] if i < len(edges) else {}
+            length = edge.get("length")
+            if length is None:
+                length = self._node_distance(nodes[i], nodes[i + 1])
+            speed = edge.get("maxSpeed") or default_speed
+            self.edge_length[i] = float(length)
+            self.edge_speed[i] = float(speed)
+
+        # remaining_distance[i] / remaining_time[i] from node i to the last node
+        self.remaining_distance = [0.0] * count
+        self.remaining_time = [0.0] * count
+        for i in range(count - 2, -1, -1):
+            self.remaining_distance[i] = self.remaining_distance[i + 1] + self.edge_length[i]
+            self.remaining_time[i] = self.remaining_time[i + 1] + self.edge_length[i] / self.edge_speed[i]
+
+        self.offset_distance = offset_distance
+        self.offset_time = offset_time
+        self.total_distance = offset_distance + (self.remaining_distance[0] if count else 0.0)
+        self.total_time = offset_time + (self.remaining_time[0] if count else 0.0)
+
+    @staticmethod
+    def _node_distance(start_node, end_node):
+        start = start_node.get("nodePosition")
+        end = end_node.get("nodePosition")
+        if not start or not end:
+            return 0.0
+        return math.hypot(end.get("x", 0.0) - start.get("x", 0.0), end.get("y", 0.0) - start.get("y", 0.0))
+
+    def traversed_until(self, sequence_id):
+        index = self.node_index.get(sequence_id)
+        if index is None:
+            return None, None
+        distance = self.total_distance - self.remaining_distance[index]
+        duration = self.total_time - self.remaining_time[index]
+        return distance, duration
+
+
+class OrderProgressTracker:
+    def __init__(self, default_speed=1.0, history=None, speed_window=30.0, min_observed_speed=0.05):
+        self.default_speed = default_speed
+        # With a StateHistory, a second ETA uses the speed the robot actually made over speed_window seconds.
+        self.history = history
+        self.speed_window = speed_window
+        self.min_observed_speed = min_observed_speed
+        self.active_orders = {}
+        self.progress = {}
+
+        self.logger = logging.getLogger('OrderProgressTracker')
+        logging.basicConfig(level=logging.WARN)
+
+    def register_order(self, robot_id, order):
+        """Stores the order sent to a robot; order updates are stitched onto the previous base."""
+        previous = self.active_orders.get(robot_id)
+        offset_distance, offset_time = 0.0, 0.0
+        if previous is not None and previous.order_id == order.get("orderId"):
+            nodes = order.get("nodes", [])
+            if nodes:
+                first_sequence_id = min(node.get("sequenceId", 0) for node in nodes)
+                distance, duration = previous.traversed_until(first_sequence_id)
+                if distance is not None:
+                    offset_distance, offset_time = distance, duration
+
+        active = _ActiveOrder(order, self.default_speed, offset_distance, offset_time)
+        self.active_orders[robot_id] = active
+        self.progress[robot_id] = {
+            "orderId": active.order_id,
+            "orderUpdateId": active.order_update_id,
+            "lastNodeId": None,
+            "totalDistance": active.total_distance,
+            "remainingDistance": active.total_distance - active.offset_distance,
+            "percentComplete": self._percent(active, active.total_distance - active.offset_distance),
+            "etaSeconds": active.total_time - active.offset_time,
+            "eta": None,
+            "observedSpeed": None,
+            "observedEtaSeconds": None,
+            "driving": False,
+            "completed": False,
+            "updated": time.time()
+        }
+        self.logger.info(f"Tracking order {active.order_id} for AGV {robot_id}")
+
+    def on_order_published(self, robot_id, order):
+        self.register_order(robot_id, order)
+
+    def remove_order(self, robot_id):
+        self.active_orders.pop(robot_id, None)
+        self.progress.pop(robot_id, None)
+
+    @staticmethod
+    def _percent(active, remaining):
+        if active.total_distance <= 0.0:
+            return 100.0 if remaining <= 0.0 else 0.0
+        return 100.0 * (active.total_distance - remaining) / active.total_distance
+
+    def update_from_state(self, state_message, now=None):
+        """Updates progress for one AGV from a state message in O(1)."""
+        robot_id = state_message.get("serialNumber", "")
+        active = self.active_orders.get(robot_id)
+        if active is None:
+            return None
+
+        progress = self.progress[robot_id]
+        if state_message.get("orderId") != active.order_id:
+            progress["orderMismatch"] = state_message.get("orderId")
+            return progress
+
+        index = active.node_index.get(state_message.get("lastNodeSequenceId", 0))
+        if index is None:
+            # The robot has not reached the first node of this order (update) yet.
+            index = 0
+            distance_since = 0.0
+        else:
+            distance_since = state_message.get("distanceSinceLastNode") or 0.0
+            distance_since = min(distance_since, active.edge_length[index])
+
+        remaining = active.remaining_distance[index] - distance_since
+        eta_seconds = active.remaining_time[index] - distance_since / active.edge_speed[index]
+        now = time.time() if now is None else now
+
+        progress["lastNodeId"] = active.node_ids[index] if active.node_ids else None
+        progress["remainingDistance"] = remaining
+        progress["percentComplete"] = self._percent(active, remaining)
+        progress["etaSeconds"] = eta_seconds
+        progress["eta"] = now + eta_seconds
+        if self.history is not None:
+            speed = self.history.average_speed(robot_id, self.speed_window, now)
+            progress["observedSpeed"] = speed
+            progress["observedEtaSeconds"] = (
+                remaining / speed if speed is not None and speed >= self.min_observed_speed else None
+            )
+        progress["driving"] = state_message.get("driving", False)
+        progress["completed"] = remaining <= 0.0 and not state_message.get("nodeStates")
+        progress["updated"] = now
+        progress.pop("orderMismatch", None)
+        return progress
+
+    def get_progress(self, robot_id):
+        progress = self.progress.get(robot_id)
+        return dict(progress) if progress is not None else None
+
+    def get_fleet_progress(self):
+        return {robot_id: dict(progress) for robot_id, progress in self.progress.items()}
+
+    def get_robots_by_eta(self, limit=None, include_completed=False):
+        """Returns (robot_id, etaSeconds) pairs, soonest arrival first."""
+        ranking = sorted(
+            (
+                (robot_id, progress["etaSeconds"])
+                for robot_id, progress in self.progress.items()
+                if include_completed or not progress["completed"]
+            ),
+            key=lambda item: item[1]
+        )
+        return ranking if limit is None else ranking[:limit]
+
+    def get_fleet_summary(self):
+        active = [p for p in self.progress.values() if not p["completed"]]
+        return {
+            "trackedOrders": len(self.progress),
+            "activeOrders": len(active),
+            "completedOrders": len(self.progress) - len(active),
+            "remainingDistance": sum(p["remainingDistance"] for p in active),
+            "meanPercentComplete": (
+                sum(p["percentComplete"] for p in active) / len(active) if active else 100.0
+            ),
+            "latestEtaSeconds": max((p["etaSeconds"] for p in active), default=0.0)
+        }
+
+
+def _build_benchmark_order(robot_index, node_count):
+    nodes, edges = [], []
+    for i in range(node_count):
+        nodes.append({
+            "nodeId": f"node_{i}",
+            "sequenceId": 2 * i,
+            "released": True,
+            "nodePosition": {"x": float(i), "y": float(robot_index), "mapId": "map_1"},
+            "actions": []
+        })
+        if i:
+            edges.append({
+                "edgeId": f"edge_{i}",
+                "sequenceId": 2 * i - 1,
+                "released": True,
+                "startNodeId": f"node_{i - 1}",
+                "endNodeId": f"node_{i}",
+                "maxSpeed": 1.5,
+                "length": 1.0,
+                "actions": []
+            })
+    return {"orderId": f"order_{robot_index}", "orderUpdateId": 0, "nodes": nodes, "edges": edges}
+
+
+def benchmark(robot_count=500, node_count=50, rounds=20):
+    tracker = OrderProgressTracker()
+    states = []
+    for robot_index in range(robot_count):
+        robot_id = f"agv_{robot_index:04d}"
+        tracker.register_order(robot_id, _build_benchmark_order(robot_index, node_count))
+        for step in range(rounds):
+            node = step % node_count
+            states.append({
+                "serialNumber": robot_id,
+                "orderId": f"order_{robot_index}",
+                "lastNodeSequenceId": 2 * node,
+                "distanceSinceLastNode": 0.5,
+                "driving": True,
+                "nodeStates": [{}]
+            })
+
+    start = time.perf_counter()
+    for state in states:
+        tracker.update_from_state(state)
+    elapsed = time.perf_counter() - start
+
+    query_start = time.perf_counter()
+    tracker.get_fleet_summary()
+    tracker.get_robots_by_eta(limit=10)
+    query_elapsed = time.perf_counter() - query_start
+
+    result = {
+        "robots": robot_count,
+        "messages": len(states),
+        "perMessageMicroseconds": elapsed / len(states) * 1e6,
+        "fleetQueryMilliseconds": query_elapsed * 1e3
+    }
+    print(f"Order progress benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,318 @@
+import json
+import time
+import logging
+from collections import OrderedDict
+from submodules import schema_cache
+
+SCHEMA = "SCHEMA"
+EMPTY_ORDER = "EMPTY_ORDER"
+SEQUENCE_PARITY = "SEQUENCE_PARITY"
+DUPLICATE_SEQUENCE_ID = "DUPLICATE_SEQUENCE_ID"
+SEQUENCE_GAP = "SEQUENCE_GAP"
+UNKNOWN_NODE = "UNKNOWN_NODE"
+DISCONNECTED_EDGE = "DISCONNECTED_EDGE"
+RELEASE_ORDER = "RELEASE_ORDER"
+EMPTY_BASE = "EMPTY_BASE"
+DUPLICATE_ACTION_ID = "DUPLICATE_ACTION_ID"
+
+
+class OrderValidationError(ValueError):
+    def __init__(self, issues):
+        super().__init__("; ".join(f"{issue['type']}: {issue['message']}" for issue in issues))
+        self.issues = issues
+
+
+def _issue(issue_type, message, path=()):
+    return {"type": issue_type, "message": message, "path": list(path)}
+
+
+def sanitize_order(order):
+    """Puts nodes and edges in sequenceId order and adds the empty actions lists the schema requires, in place."""
+    for key in ("nodes", "edges"):
+        elements = order.get(key)
+        if not isinstance(elements, list):
+            continue
+        for element in elements:
+            if isinstance(element, dict) and element.get("actions") is None:
+                element["actions"] = []
+        if all(isinstance(element, dict) and isinstance(element.get("sequenceId"), int) for element in elements):
+            elements.sort(key=lambda element: element["sequenceId"])
+    return order
+
+
+def _element_fingerprint(element):
+    """Canonical JSON of a node or edge with the per-order values blanked where the schema only checks the type.
+
+    sequenceId, released and actionId change with every order while the rest of an element is
+    the same map data; blanking them lets the cache recognise an element it has validated before.
+    """
+    shaped = dict(element)
+    sequence_id = shaped.get("sequenceId")
+    if type(sequence_id) is int and sequence_id >= 0:
+        shaped["sequenceId"] = 0
+    if isinstance(shaped.get("released"), bool):
+        shaped["released"] = True
+    actions = shaped.get("actions")
+    if isinstance(actions, list):
+        shaped["actions"] = [dict(action, actionId="") if isinstance(action, dict)
+                             and isinstance(action.get("actionId"), str) else action for action in actions]
+    return json.dumps(shaped, sort_keys=True)
+
+
+def check_graph(order):
+    """Graph consistency of an order in one pass over its nodes, edges and actions; returns a list of issues.
+
+    Nodes carry even and edges odd sequenceIds, and together they must form one unbroken
+    node-edge-node chain. Every edge joins the nodes on either side of it. The released
+    elements (the base) are a non-empty prefix of the chain that ends on a node. actionIds are
+    unique across the order. nodeIds and edgeIds may repeat, since a route may pass a node twice.
+    """
+    issues = []
+    nodes = order.get("nodes") or []
+    edges = order.get("edges") or []
+    if not nodes:
+        return [_issue(EMPTY_ORDER, "An order needs at least one node.", ("nodes",))]
+
+    chain = {}
+    node_sequence_ids = []
+    node_ids = set()
+    action_ids = {}
+    for key, elements, parity in (("nodes", nodes, 0), ("edges", edges, 1)):
+        for index, element in enumerate(elements):
+            sequence_id = element.get("sequenceId")
+            path = (key, index)
+            if key == "edges":
+                # Nodes come first, so node_ids is complete by now.
+                for end in ("startNodeId", "endNodeId"):
+                    if element.get(end) not in node_ids:
+                        issues.append(_issue(UNKNOWN_NODE, f"edge {element.get('edgeId')} {end} {element.get(end)} "
+                                                           f"is not a node of this order.", path + (end,)))
+            if not isinstance(sequence_id, int):
+                continue
+            if sequence_id % 2 != parity:
+                issues.append(_issue(SEQUENCE_PARITY, f"{key[:-1]} {element.get(f'{key[:-1]}Id')} has sequenceId "
+                                                      f"{sequence_id}; {key} use {'odd' if parity else 'even'} ids.",
+                                     path + ("sequenceId",)))
+            if sequence_id in chain:
+                issues.append(_issue(DUPLICATE_SEQUENCE_ID, f"sequenceId {sequence_id} is used more than once.",
+                                     path + ("sequenceId",)))
+            else:
+                chain[sequence_id] = (key, element, index)
+            if key == "nodes":
+                node_sequence_ids.append(sequence_id)
+                node_ids.add(element.get("nodeId"))
+            for action_index, action in enumerate(element.get("actions") or []):
+                action_id = action.get("actionId") if isinstance(action, dict) else None
+                if action_id is None:
+                    continue
+                if action_id in action_ids:
+                    issues.append(_issue(DUPLICATE_ACTION_ID, f"actionId {action_id} is used more than once.",
+                                         path + ("actions", action_index, "actionId")))
+                action_ids[action_id] = path
+
+    if not chain:
+        return issues
+    first = min(node_sequence_ids) if node_sequence_ids else min(chain)
+    last = first + len(chain) - 1
+    released_until = None
+    horizon_started = None
+    for sequence_id in range(first, last + 1):
+        entry = chain.get(sequence_id)
+        if entry is None:
+            issues.append(_issue(SEQUENCE_GAP, f"No node or edge has sequenceId {sequence_id}; "
+                                               f"the order must be one chain from {first}."))
+            continue
+        key, element, index = entry
+        if key == "edges":
+            before, after = chain.get(sequence_id - 1), chain.get(sequence_id + 1)
+            for end, neighbour in (("startNodeId", before), ("endNodeId", after)):
+                node_id = element.get(end)
+                connected = neighbour is not None and neighbour[0] == "nodes" and neighbour[1].get("nodeId") == node_id
+                if node_id in node_ids and not connected:
+                    expected = neighbour[1].get("nodeId") if neighbour is not None else None
+                    issues.append(_issue(DISCONNECTED_EDGE, f"edge {element.get('edgeId')} {end} is {node_id} but "
+                                                            f"the adjacent node is {expected}.", ("edges", index, end)))
+        if element.get("released", True):
+            if horizon_started is not None:
+                issues.append(_issue(RELEASE_ORDER, f"sequenceId {sequence_id} is released after the horizon "
+                                                    f"began at sequenceId {horizon_started}."))
+            released_until = (sequence_id, key)
+        elif horizon_started is None:
+            horizon_started = sequence_id
+
+    if released_until is None:
+        issues.append(_issue(EMPTY_BASE, "The base is empty; the first node must be released."))
+    elif released_until[1] != "nodes":
+        issues.append(_issue(RELEASE_ORDER, f"The base ends on edge sequenceId {released_until[0]}; "
+                                            f"it must end on a node."))
+    # Sequence ids past the chain length mean a gap somewhere, reported above; anything lower than
+    # the first node is an edge in front of it.
+    for sequence_id in chain:
+        if sequence_id < first or sequence_id > last:
+            issues.append(_issue(SEQUENCE_GAP, f"sequenceId {sequence_id} lies outside the chain {first}..{last}."))
+    return issues
+
+
+class OrderValidator:
+    """Pre-publish checks for orders: order.schema through the shared cached validator, then check_graph.
+
+    jsonschema costs close to a millisecond per node, while orders on one site keep reusing the
+    same nodes and edges. So the envelope is validated on its own, and each node and edge against
+    its item schema, with valid elements remembered by _element_fingerprint in an LRU of
+    element_cache_size entries.
+    """
+
+    def __init__(self, check_schema=True, sanitize=True, max_schema_errors=10, element_cache_size=4096):
+        self.check_schema = check_schema
+        self.sanitize = sanitize
+        self.max_schema_errors = max_schema_errors
+        self.element_cache_size = element_cache_size
+        self.element_cache = OrderedDict()
+        self._validators = None
+        self.validated = 0
+        self.rejected = 0
+        self.element_hits = 0
+        self.element_misses = 0
+        self.issue_counts = {}
+
+        self.logger = logging.getLogger('OrderValidator')
+        logging.basicConfig(level=logging.WARN)
+
+    def _schema_validators(self):
+        if self._validators is None:
+            order_validator = schema_cache.get_validator("order")
+            schema = order_validator.schema
+            validators = {}
+            for key in ("nodes", "edges"):
+                # The item schemas refer to the root definitions, so those travel with them.
+                item_schema = dict(schema["properties"][key]["items"], definitions=schema.get("definitions", {}))
+                item_schema["$schema"] = schema.get("$schema")
+                validators[key] = type(order_validator)(item_schema)
+            self._validators = (order_validator, validators)
+        return self._validators
+
+    def _schema_issues(self, order):
+        order_validator, item_validators = self._schema_validators()
+        issues = []
+        envelope = dict(order)
+        elements = {}
+        for key in ("nodes", "edges"):
+            if isinstance(order.get(key), list):
+                elements[key] = order[key]
+                envelope[key] = []
+        for error in order_validator.iter_errors(envelope):
+            issues.append(_issue(SCHEMA, error.message, error.absolute_path))
+        for key, items in elements.items():
+            for index, element in enumerate(items):
+                try:
+                    fingerprint = (key, _element_fingerprint(element))
+                except (TypeError, ValueError, AttributeError) as e:
+                    issues.append(_issue(SCHEMA, f"Not JSON serializable: {e}", (key, index)))
+                    continue
+                if fingerprint in self.element_cache:
+                    self.element_cache.move_to_end(fingerprint)
+                    self.element_hits += 1
+                    continue
+                self.element_misses += 1
+                errors = list(item_validators[key].iter_errors(element))
+                if not errors:
+                    self.element_cache[fingerprint] = True
+                    if len(self.element_cache) > self.element_cache_size:
+                        self.element_cache.popitem(last=False)
+                    continue
+                for error in errors:
+                    issues.append(_issue(SCHEMA, error.message, (key, index, *error.absolute_path)))
+            if len(issues) >= self.max_schema_errors:
+                break
+        return issues[:self.max_schema_errors]
+
+    def validate(self, order):
+        """Returns the list of issues, empty for a valid order; sanitizes the order first when enabled."""
+        if self.sanitize:
+            sanitize_order(order)
+        issues = self._schema_issues(order) if self.check_schema else []
+        issues.extend(check_graph(order))
+        self.validated += 1
+        if issues:
+            self.rejected += 1
+            for issue in issues:
+                self.issue_counts[issue["type"]] = self.issue_counts.get(issue["type"], 0) + 1
+        return issues
+
+    def check(self, order):
+        """Raises OrderValidationError for an invalid order."""
+        issues = self.validate(order)
+        if issues:
+            raise OrderValidationError(issues)
+        return order
+
+    def get_stats(self):
+        return {"validated": self.validated, "rejected": self.rejected, "issues": dict(self.issue_counts),
+                "elementCacheHits": self.element_hits, "elementCacheMisses": self.element_misses}
+
+
+def _benchmark_order(node_count, order_id="order_1"):
+    nodes = [{
+        "nodeId": f"node_{i}", "sequenceId": 2 * i, "released": i < node_count // 2,
+        "nodePosition": {"x": float(i), "y": 0.0, "theta": 0.0, "mapId": "map_1"},
+        "actions": [{"actionId": f"{order_id}_action_{i}", "actionType": "PICK", "blockingType": "HARD"}]
+    } for i in range(node_count)]
+    edges = [{
+        "edgeId": f"edge_{i}", "sequenceId": 2 * i + 1, "released": i + 1 < node_count // 2,
+        "startNodeId": f"node_{i}", "endNodeId": f"node_{i + 1}", "maxSpeed": 1.5, "actions": []
+    } for i in range(node_count - 1)]
+    return {"headerId": 1, "timestamp": "2024-01-01T00:00:00Z", "version": "2.0.0", "manufacturer": "robots",
+            "serialNumber": "001", "orderId": order_id, "orderUpdateId": 0, "nodes": nodes, "edges": edges}
+
+
+def benchmark(node_counts=(10, 100, 1000), repeats=200):
+    """Validation time against order size, cold and with the element cache warm, and which faults are caught.
+
+    Each run builds a fresh order over the same nodes with its own actionIds, like a dispatcher
+    sending new orders across one site; the plain column is a whole-order jsonschema pass.
+    """
+    schema_cache.get_validator("order")
+    timings = {}
+    for node_count in node_counts:
+        runs = max(1, repeats * 10 // node_count)
+        orders = [_benchmark_order(node_count, f"order_{run}") for run in range(runs)]
+        plain = schema_cache.get_validator("order")
+        start = time.perf_counter()
+        for order in orders[:max(1, runs // 10)]:
+            plain.is_valid(order)
+        plain_time = (time.perf_counter() - start) / max(1, runs // 10)
+        validator = OrderValidator()
+        start = time.perf_counter()
+        issues = validator.validate(orders[0])
+        cold_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for order in orders:
+            validator.validate(order)
+        warm_time = (time.perf_counter() - start) / runs
+        start = time.perf_counter()
+        for order in orders:
+            check_graph(order)
+        graph_time = (time.perf_counter() - start) / runs
+        timings[node_count] = {"plainJsonschemaMicroseconds": plain_time * 1e6,
+                               "coldMicroseconds": cold_time * 1e6, "warmMicroseconds": warm_time * 1e6,
+                               "graphMicroseconds": graph_time * 1e6, "issues": len(issues)}
+
+    faults = {}
+    broken = _benchmark_order(5)
+    broken["edges"][1]["endNodeId"] = "node_9"
+    faults["unknownNode"] = [issue["type"] for issue in check_graph(broken)]
+    broken = _benchmark_order(5)
+    broken["edges"][0]["sequenceId"] = 2
+    faults["sequenceReuse"] = [issue["type"] for issue in check_graph(broken)]
+    broken = _benchmark_order(5)
+    broken["nodes"][4]["released"] = True
+    faults["releasedHorizon"] = [issue["type"] for issue in check_graph(broken)]
+    broken = _benchmark_order(5)
+    broken["nodes"][1]["actions"][0]["actionId"] = broken["nodes"][0]["actions"][0]["actionId"]
+    faults["duplicateAction"] = [issue["type"] for issue in check_graph(broken)]
+    print(f"Order validation benchmark: {timings} {faults}")
+    return timings, faults
+
+
+if __name__ == '__main__':
+    benchmark()
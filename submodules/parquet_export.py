@@ -0,0 +1,328 @@
+import os
+import json
+import time
+import logging
+import datetime
+
+ERROR_LEVELS = {"WARNING": 1, "FATAL": 2}
+
+
+def _json(value):
+    # psycopg2 decodes JSONB already; the SQLite backend hands back the stored text.
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+    return value
+
+
+def _timestamp(value):
+    if isinstance(value, str):
+        try:
+            return datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return value
+
+
+def _bool(value):
+    # The SQLite backend hands BOOLEAN columns back as 0/1, which Arrow refuses for a bool column.
+    return None if value is None else bool(value)
+
+
+def _flatten_state(row):
+    position = _json(row["agv_position"]) or {}
+    velocity = _json(row["velocity"]) or {}
+    battery = _json(row["battery_state"]) or {}
+    safety = _json(row["safety_state"]) or {}
+    errors = _json(row["errors"]) or []
+    return {
+        "id": row["id"],
+        "timestamp": _timestamp(row["timestamp"]),
+        "header_id": row["header_id"],
+        "manufacturer": row["manufacturer"],
+        "serial_number": row["serial_number"],
+        "order_id": row["order_id"],
+        "order_update_id": row["order_update_id"],
+        "last_node_id": row["last_node_id"],
+        "last_node_sequence_id": row["last_node_sequence_id"],
+        "driving": _bool(row["driving"]),
+        "paused": _bool(row["paused"]),
+        "operating_mode": row["operating_mode"],
+        "position_x": position.get("x"),
+        "position_y": position.get("y"),
+        "position_theta": position.get("theta"),
+        "map_id": position.get("mapId"),
+        "position_initialized": _bool(position.get("positionInitialized")),
+        "localization_score": position.get("localizationScore"),
+        "velocity_vx": velocity.get("vx"),
+        "velocity_vy": velocity.get("vy"),
+        "velocity_omega": velocity.get("omega"),
+        "battery_charge": battery.get("batteryCharge"),
+        "battery_voltage": battery.get("batteryVoltage"),
+        "battery_health": battery.get("batteryHealth"),
+        "charging": _bool(battery.get("charging")),
+        "reach": battery.get("reach"),
+        "e_stop": safety.get("eStop"),
+        "field_violation": _bool(safety.get("fieldViolation")),
+        "error_count": len(errors),
+        "max_error_level": max((ERROR_LEVELS.get(e.get("errorLevel"), 0) for e in errors), default=0),
+        "error_types": [e.get("errorType") for e in errors],
+        "node_state_count": len(_json(row["node_states"]) or []),
+        "edge_state_count": len(_json(row["edge_states"]) or []),
+        "action_state_count": len(_json(row["action_states"]) or []),
+        "load_count": len(_json(row["loads"]) or []),
+    }
+
+
+def _flatten_order(row):
+    nodes = _json(row["nodes"]) or []
+    edges = _json(row["edges"]) or []
+    return {
+        "id": row["id"],
+        "timestamp": _timestamp(row["timestamp"]),
+        "header_id": row["header_id"],
+        "manufacturer": row["manufacturer"],
+        "serial_number": row["serial_number"],
+        "order_id": row["order_id"],
+        "order_update_id": row["order_update_id"],
+        "zone_set_id": row["zone_set_id"],
+        "node_count": len(nodes),
+        "edge_count": len(edges),
+        "released_node_count": sum(1 for node in nodes if node.get("released")),
+        "first_node_id": nodes[0].get("nodeId") if nodes else None,
+        "last_node_id": nodes[-1].get("nodeId") if nodes else None,
+        "total_length": sum(edge.get("length") or 0.0 for edge in edges),
+    }
+
+
+def _flatten_connection(row):
+    return {
+        "id": row["id"],
+        "timestamp": _timestamp(row["timestamp"]),
+        "header_id": row["header_id"],
+        "manufacturer": row["manufacturer"],
+        "serial_number": row["serial_number"],
+        "connection_state": row["connection_state"],
+    }
+
+
+# table -> (source columns, flatten function, output column types)
+EXPORT_TABLES = {
+    "state": (
+        ("id", "timestamp", "header_id", "manufacturer", "serial_number", "order_id", "order_update_id",
+         "last_node_id", "last_node_sequence_id", "driving", "paused", "operating_mode", "agv_position",
+         "velocity", "battery_state", "safety_state", "errors", "node_states", "edge_states", "action_states",
+         "loads"),
+        _flatten_state,
+        {
+            "id": "int64", "timestamp": "timestamp", "header_id": "int64", "manufacturer": "string",
+            "serial_number": "string", "order_id": "string", "order_update_id": "int64", "last_node_id": "string",
+            "last_node_sequence_id": "int64", "driving": "bool", "paused": "bool", "operating_mode": "string",
+            "position_x": "float64", "position_y": "float64", "position_theta": "float64", "map_id": "string",
+            "position_initialized": "bool", "localization_score": "float64", "velocity_vx": "float64",
+            "velocity_vy": "float64", "velocity_omega": "float64", "battery_charge": "float64",
+            "battery_voltage": "float64", "battery_health": "float64", "charging": "bool", "reach": "float64",
+            "e_stop": "string", "field_violation": "bool", "error_count": "int32", "max_error_level": "int8",
+            "error_types": "list<string>", "node_state_count": "int32", "edge_state_count": "int32",
+            "action_state_count": "int32", "load_count": "int32",
+        }
+    ),
+    "orders": (
+        ("id", "timestamp", "header_id", "manufacturer", "serial_number", "order_id", "order_update_id",
+         "zone_set_id", "nodes", "edges"),
+        _flatten_order,
+        {
+            "id": "int64", "timestamp": "timestamp", "header_id": "int64", "manufacturer": "string",
+            "serial_number": "string", "order_id": "string", "order_update_id": "int64", "zone_set_id": "string",
+            "node_count": "int32", "edge_count": "int32", "released_node_count": "int32",
+            "first_node_id": "string", "last_node_id": "string", "total_length": "float64",
+        }
+    ),
+    "connection": (
+        ("id", "timestamp", "header_id", "manufacturer", "serial_number", "connection_state"),
+        _flatten_connection,
+        {
+            "id": "int64", "timestamp": "timestamp", "header_id": "int64", "manufacturer": "string",
+            "serial_number": "string", "connection_state": "string",
+        }
+    ),
+}
+
+
+def _arrow_type(pa, name):
+    if name == "timestamp":
+        return pa.timestamp("us")
+    if name == "list<string>":
+        return pa.list_(pa.string())
+    if name == "bool":
+        return pa.bool_()
+    return getattr(pa, name)()
+
+
+class ParquetExporter:
+    """Copies history tables into date-partitioned Parquet files, resuming from a per-table id watermark.
+
+    Rows are read with keyset pagination (WHERE id > watermark ORDER BY id LIMIT chunk_size), so memory
+    stays at one chunk and each query is an index range scan, whatever the table size.
+    """
+
+    def __init__(self, db_conn, directory, chunk_size=50000, compression="zstd", tables=None):
+        self.db_conn = db_conn
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.tables = tables or list(EXPORT_TABLES)
+        self.watermark_path = os.path.join(directory, "_watermarks.json")
+
+        self.logger = logging.getLogger('ParquetExporter')
+        logging.basicConfig(level=logging.WARN)
+
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet export needs the optional pyarrow package (pip install pyarrow).")
+        os.makedirs(directory, exist_ok=True)
+
+    def load_watermarks(self):
+        try:
+            with open(self.watermark_path, 'r') as watermark_file:
+                return json.load(watermark_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_watermark(self, table, last_id):
+        watermarks = self.load_watermarks()
+        watermarks[table] = last_id
+        temporary = f"{self.watermark_path}.tmp"
+        with open(temporary, 'w') as watermark_file:
+            json.dump(watermarks, watermark_file)
+        os.replace(temporary, self.watermark_path)
+
+    def _fetch_chunk(self, table, columns, after_id):
+        cursor = self.db_conn.cursor()
+        try:
+            cursor.execute(
+                f"SELECT {', '.join(columns)} FROM {table} WHERE id > %s ORDER BY id LIMIT %s",
+                (after_id, self.chunk_size)
+            )
+            rows = cursor.fetchall()
+            self.db_conn.commit()
+        except Exception:
+            self.db_conn.rollback()
+            raise
+        return [dict(zip(columns, row)) for row in rows]
+
+    def _write_partitions(self, table, records):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        column_types = EXPORT_TABLES[table][2]
+        schema = pa.schema([(name, _arrow_type(pa, kind)) for name, kind in column_types.items()])
+        partitions = {}
+        for record in records:
+            timestamp = record["timestamp"]
+            day = timestamp.date().isoformat() if timestamp is not None else "unknown"
+            partitions.setdefault(day, []).append(record)
+
+        written = []
+        for day, partition in partitions.items():
+            directory = os.path.join(self.directory, f"table={table}", f"date={day}")
+            os.makedirs(directory, exist_ok=True)
+            # Named after the chunk's first id: a rerun after a crash restarts from the same watermark
+            # and overwrites these files instead of duplicating their rows.
+            path = os.path.join(directory, f"part-{records[0]['id']:012d}.parquet")
+            arrays = {name: [record[name] for record in partition] for name in column_types}
+            pq.write_table(pa.table(arrays, schema=schema), path, compression=self.compression)
+            written.append(path)
+        return written
+
+    def export_table(self, table, max_chunks=None):
+        """Exports rows added since the last run; returns the number of rows written."""
+        columns, flatten, _ = EXPORT_TABLES[table]
+        watermark = self.load_watermarks().get(table, 0)
+        exported = 0
+        chunks = 0
+        while max_chunks is None or chunks < max_chunks:
+            rows = self._fetch_chunk(table, columns, watermark)
+            if not rows:
+                break
+            self._write_partitions(table, [flatten(row) for row in rows])
+            watermark = rows[-1]["id"]
+            self._save_watermark(table, watermark)
+            exported += len(rows)
+            chunks += 1
+            if len(rows) < self.chunk_size:
+                break
+        if exported:
+            self.logger.info(f"Exported {exported} {table} rows up to id {watermark}.")
+        return exported
+
+    def export_all(self):
+        return {table: self.export_table(table) for table in self.tables}
+
+
+def benchmark(rows=200000, chunk_size=20000):
+    """Exports a synthetic SQLite state table and reports throughput and peak Python memory."""
+    import tempfile
+    import tracemalloc
+    from submodules.storage import SQLiteConnection
+    from submodules.migrations import apply_migrations
+    from submodules.database_writer import DatabaseWriter
+    from submodules.state import STATE_COLUMNS
+
+    with tempfile.TemporaryDirectory() as directory:
+        conn = SQLiteConnection(os.path.join(directory, "bench.db"))
+        apply_migrations(conn)
+        writer = DatabaseWriter(conn, batch_size=5000)
+        start_day = datetime.datetime(2024, 1, 1)
+        for i in range(rows):
+            writer.insert("state", STATE_COLUMNS, (
+                i, start_day + datetime.timedelta(seconds=i), "2.0.0", "robots", f"agv_{i % 50:03d}", "order_001",
+                0, "zone_set_001", "node_1", 0, True, False, False, 0.5, "AUTOMATIC", "[]", "[]",
+                json.dumps({"x": i * 0.01, "y": 2.0, "theta": 0.0, "mapId": "map_1", "positionInitialized": True}),
+                json.dumps({"vx": 1.0, "vy": 0.0, "omega": 0.0}), "[]", "[]",
+                json.dumps({"batteryCharge": 80.0, "charging": False}),
+                json.dumps([{"errorType": "obstacle", "errorLevel": "WARNING"}] if i % 100 == 0 else []), "[]",
+                json.dumps({"eStop": "NONE", "fieldViolation": False})
+            ))
+        writer.flush()
+
+        exporter = ParquetExporter(conn, os.path.join(directory, "export"), chunk_size=chunk_size, tables=["state"])
+        tracemalloc.start()
+        start = time.perf_counter()
+        exported = exporter.export_table("state")
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        incremental = exporter.export_table("state")
+
+    result = {
+        "rows": exported,
+        "rowsPerSecond": exported / elapsed,
+        "peakPythonMemoryMB": peak / 2 ** 20,
+        "rowsOnSecondRun": incremental
+    }
+    print(f"Parquet export benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    import sys
+    import yaml
+    from submodules import storage
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(root, 'config', 'config.yaml'), 'r') as config_file:
+        config = yaml.safe_load(config_file)
+    if len(sys.argv) > 1 and sys.argv[1] == "--benchmark":
+        benchmark()
+    else:
+        export_config = dict(config.get('parquet_export', {}))
+        directory = sys.argv[1] if len(sys.argv) > 1 else export_config.pop('directory', 'export')
+        export_config.pop('directory', None)
+        conn = storage.connect(config.get('storage', {}), config['postgres'])
+        if conn is None:
+            sys.exit(1)
+        print(ParquetExporter(conn, directory, **export_config).export_all())
@@ -0,0 +1,358 @@
+import io
+import os
+import sys
+import json
+import time
+import pstats
+import signal
+import cProfile
+import logging
+import datetime
+import threading
+from collections import deque, Counter
+
+CPROFILE = "cprofile"
+SAMPLING = "sample"
+
+
+class _Trace:
+    __slots__ = ("topic", "size", "started", "last", "stages", "profile")
+
+    def __init__(self, topic, size, profile=None):
+        self.topic = topic
+        self.size = size
+        self.started = self.last = time.perf_counter()
+        self.stages = []
+        # The profile begin() enabled on this thread; end() disables that one even if a snapshot ended meanwhile.
+        self.profile = profile
+
+    def mark(self, name):
+        """Closes the stage that ran since the previous mark."""
+        now = time.perf_counter()
+        self.stages.append((name, now - self.last))
+        self.last = now
+
+
+class _NullTrace:
+    __slots__ = ()
+
+    def mark(self, name):
+        pass
+
+
+NULL_TRACE = _NullTrace()
+
+
+class IngestProfiler:
+    """Opt-in timing of the MQTT ingest path.
+
+    Every message gets per-stage timings; those slower than slow_threshold are kept, with topic,
+    payload size and a payload preview, in a ring buffer. cProfile or stack-sampling snapshots of
+    the ingest path can be taken at runtime through a signal or the HTTP endpoint.
+    """
+
+    def __init__(self, enabled=False, slow_threshold=0.05, capture_size=256, payload_preview=512, signals=True,
+                 http_host="127.0.0.1", http_port=None, sample_interval=0.005, profile_seconds=10.0,
+                 output_directory="profiles"):
+        self.enabled = enabled
+        self.slow_threshold = slow_threshold
+        self.payload_preview = payload_preview
+        self.sample_interval = sample_interval
+        self.profile_seconds = profile_seconds
+        self.output_directory = output_directory
+        self.slow_messages = deque(maxlen=capture_size)
+        self.messages = 0
+        self.slow_count = 0
+        self.slowest = 0.0
+        self.ingesting = {}
+        self.snapshots = []
+        self.lock = threading.Lock()
+        self._profile = None
+        self._profile_users = 0
+        self._snapshot_lock = threading.Lock()
+        self._http_server = None
+
+        self.logger = logging.getLogger('IngestProfiler')
+        logging.basicConfig(level=logging.WARN)
+
+        if enabled and signals:
+            self.install_signals()
+        if enabled and http_port is not None:
+            self.start_http(http_host, http_port)
+
+    def begin(self, topic, size):
+        if not self.enabled:
+            return NULL_TRACE
+        self.ingesting[threading.get_ident()] = True
+        profile = None
+        if self._profile is not None:
+            with self.lock:
+                profile = self._profile
+                if profile is not None:
+                    self._profile_users += 1
+            if profile is not None:
+                profile.enable()
+        return _Trace(topic, size, profile)
+
+    def end(self, trace, payload=None):
+        if trace is NULL_TRACE:
+            return
+        if trace.profile is not None:
+            trace.profile.disable()
+            with self.lock:
+                self._profile_users -= 1
+        self.ingesting[threading.get_ident()] = False
+        elapsed = time.perf_counter() - trace.started
+        self.messages += 1
+        if elapsed > self.slowest:
+            self.slowest = elapsed
+        if elapsed < self.slow_threshold:
+            return
+        if not trace.stages:
+            trace.mark("total")
+        preview = payload[:self.payload_preview] if payload is not None else b""
+        if isinstance(preview, bytes):
+            preview = preview.decode("utf-8", errors="replace")
+        with self.lock:
+            self.slow_count += 1
+            self.slow_messages.append({
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "topic": trace.topic,
+                "payloadBytes": trace.size,
+                "seconds": elapsed,
+                "stages": {name: seconds for name, seconds in trace.stages},
+                "payloadPreview": preview,
+                "thread": threading.current_thread().name
+            })
+        self.logger.warning(f"Slow message on {trace.topic} ({trace.size} bytes): {elapsed * 1e3:.1f} ms")
+
+    def get_slow_messages(self, limit=None):
+        with self.lock:
+            messages = list(self.slow_messages)
+        messages.reverse()
+        return messages if limit is None else messages[:limit]
+
+    def get_stats(self):
+        return {
+            "enabled": self.enabled,
+            "messages": self.messages,
+            "slowMessages": self.slow_count,
+            "slowThresholdSeconds": self.slow_threshold,
+            "slowestSeconds": self.slowest,
+            "snapshots": list(self.snapshots)
+        }
+
+    def _output_path(self, suffix):
+        os.makedirs(self.output_directory, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self.output_directory, f"ingest-{stamp}.{suffix}")
+
+    def snapshot(self, mode=CPROFILE, seconds=None):
+        """Profiles the ingest path for `seconds` and writes the result; returns a summary dict.
+
+        Blocks for the duration, so triggers run it on their own thread. Only one snapshot runs at a time.
+        """
+        seconds = self.profile_seconds if seconds is None else seconds
+        if not self._snapshot_lock.acquire(blocking=False):
+            return {"error": "A snapshot is already running."}
+        try:
+            if mode == CPROFILE:
+                result = self._cprofile_snapshot(seconds)
+            elif mode == SAMPLING:
+                result = self._sampling_snapshot(seconds)
+            else:
+                return {"error": f"Unknown profiling mode: {mode}"}
+        finally:
+            self._snapshot_lock.release()
+        self.snapshots.append(result["path"])
+        self.logger.warning(f"{mode} snapshot of the ingest path written to {result['path']}")
+        return result
+
+    def _cprofile_snapshot(self, seconds):
+        # Enabled by begin() and disabled by end(), so only time spent handling messages is profiled.
+        self._profile = cProfile.Profile()
+        time.sleep(seconds)
+        with self.lock:
+            profile, self._profile = self._profile, None
+        # Messages still in flight disable the profile themselves; wait for them before reading it.
+        deadline = time.monotonic() + 5.0
+        while self._profile_users and time.monotonic() < deadline:
+            time.sleep(0.001)
+        path = self._output_path("prof")
+        profile.dump_stats(path)
+        report = io.StringIO()
+        pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(30)
+        with open(path[:-len("prof")] + "txt", "w") as report_file:
+            report_file.write(report.getvalue())
+        return {"mode": CPROFILE, "seconds": seconds, "path": path, "report": report.getvalue()}
+
+    def _sampling_snapshot(self, seconds):
+        """Samples the stacks of threads that are inside the ingest path; writes folded stacks for flame graphs."""
+        stacks = Counter()
+        samples = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            frames = sys._current_frames()
+            for ident, busy in list(self.ingesting.items()):
+                frame = frames.get(ident)
+                if not busy or frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                stacks[";".join(reversed(stack))] += 1
+                samples += 1
+            time.sleep(self.sample_interval)
+
+        path = self._output_path("folded")
+        with open(path, "w") as folded_file:
+            for stack, count in stacks.most_common():
+                folded_file.write(f"{stack} {count}\n")
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        top = [{"frame": frame, "samples": count, "share": count / samples} for frame, count in leaves.most_common(20)]
+        return {"mode": SAMPLING, "seconds": seconds, "path": path, "samples": samples, "top": top}
+
+    def trigger(self, mode=CPROFILE, seconds=None):
+        """Starts a snapshot in the background; used by the signal handlers."""
+        thread = threading.Thread(target=self.snapshot, args=(mode, seconds), name="IngestProfilerSnapshot",
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def install_signals(self):
+        """SIGUSR1 takes a cProfile snapshot, SIGUSR2 a sampling one; only possible from the main thread."""
+        if not hasattr(signal, "SIGUSR1") or threading.current_thread() is not threading.main_thread():
+            self.logger.warning("Profiling signals are not available here; use the HTTP endpoint.")
+            return False
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.trigger(CPROFILE))
+        signal.signal(signal.SIGUSR2, lambda signum, frame: self.trigger(SAMPLING))
+        return True
+
+    def start_http(self, host="127.0.0.1", port=8765):
+        """GET /slow, GET /stats and GET /profile?mode=cprofile|sample&seconds=N (returns when done)."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import urlparse, parse_qs
+
+        profiler = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                if url.path == "/slow":
+                    limit = int(query["limit"][0]) if "limit" in query else None
+                    self._reply(200, profiler.get_slow_messages(limit))
+                elif url.path == "/stats":
+                    self._reply(200, profiler.get_stats())
+                elif url.path == "/profile":
+                    seconds = float(query["seconds"][0]) if "seconds" in query else None
+                    result = profiler.snapshot(query.get("mode", [CPROFILE])[0], seconds)
+                    self._reply(409 if "error" in result else 200, result)
+                else:
+                    self._reply(404, {"error": f"Unknown path {url.path}"})
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                profiler.logger.info(format % args)
+
+        try:
+            self._http_server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            self.logger.error(f"Could not start profiling endpoint on {host}:{port}: {e}")
+            return None
+        self._http_server.daemon_threads = True
+        threading.Thread(target=self._http_server.serve_forever, name="IngestProfilerHTTP", daemon=True).start()
+        self.logger.info(f"Profiling endpoint on http://{host}:{port}")
+        return self._http_server
+
+    def stop_http(self):
+        if self._http_server is not None:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+            self._http_server = None
+
+
+def benchmark(messages=20000, node_count=200, repeats=3):
+    """Overhead of the stage timings on the state validation path, disabled vs enabled, and a sampling run."""
+    import tempfile
+    from submodules import schema_cache
+
+    state = {
+        "headerId": 1, "timestamp": "2024-01-01T00:00:00Z", "version": "2.0.0", "manufacturer": "robots",
+        "serialNumber": "001", "orderId": "order_1", "orderUpdateId": 0, "lastNodeId": "node_0",
+        "lastNodeSequenceId": 0, "driving": True, "operatingMode": "AUTOMATIC",
+        "nodeStates": [{"nodeId": f"node_{i}", "sequenceId": 2 * i, "released": True} for i in range(node_count)],
+        "edgeStates": [], "actionStates": [], "errors": [],
+        "batteryState": {"batteryCharge": 80.0, "charging": False},
+        "safetyState": {"eStop": "NONE", "fieldViolation": False}
+    }
+    payload = json.dumps(state).encode()
+    small = json.dumps(dict(state, nodeStates=[])).encode()
+    schema_cache.get_validator("state")
+
+    def ingest(profiler, data):
+        trace = profiler.begin("uagv/v2/robots/001/state", len(data))
+        message = json.loads(data)
+        trace.mark("decode")
+        schema_cache.validate("state", message)
+        trace.mark("validate")
+        profiler.end(trace, data)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, profiler in (("disabled", IngestProfiler()),
+                               ("enabled", IngestProfiler(enabled=True, signals=False, slow_threshold=0.001,
+                                                          output_directory=directory))):
+            profiler.logger.setLevel(logging.ERROR)
+            best = float("inf")
+            for _ in range(repeats):
+                start = time.perf_counter()
+                for i in range(messages):
+                    ingest(profiler, payload if i % 100 == 0 else small)
+                best = min(best, time.perf_counter() - start)
+            results[f"{name}MicrosecondsPerMessage"] = best / messages * 1e6
+        results["slowCaptured"] = profiler.slow_count
+
+        # The hooks alone, without the work they time; the same calls on_message makes for a state message.
+        for name, hooks in (("disabled", IngestProfiler()), ("enabled", IngestProfiler(enabled=True, signals=False))):
+            start = time.perf_counter()
+            for _ in range(messages):
+                trace = hooks.begin("uagv/v2/robots/001/state", 1000)
+                for stage in ("decode", "filter", "state", "print", "order_progress", "maps", "deadlock", "zones",
+                              "anomalies", "charging", "handler"):
+                    trace.mark(stage)
+                hooks.end(trace, small)
+            results[f"{name}HookMicroseconds"] = (time.perf_counter() - start) / messages * 1e6
+
+        stop = threading.Event()
+
+        def worker():
+            while not stop.is_set():
+                ingest(profiler, payload)
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        sampled = profiler.snapshot(SAMPLING, 1.0)
+        profiled = profiler.snapshot(CPROFILE, 1.0)
+        stop.set()
+        thread.join()
+        results["samples"] = sampled["samples"]
+        results["topSampledFrame"] = sampled["top"][0]["frame"] if sampled["top"] else None
+        results["cprofileReportLines"] = len(profiled["report"].splitlines())
+    print(f"Ingest profiler benchmark: {results}")
+    return results
+
+
+if __name__ == '__main__':
+    benchmark()
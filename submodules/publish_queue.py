@@ -0,0 +1,291 @@
+import time
+import logging
+import threading
+from collections import deque, OrderedDict
+
+import numpy as np
+
+
+class _Entry:
+    __slots__ = ("topic", "payload", "qos", "retain", "robot", "enqueued", "sent", "attempts", "info")
+
+    def __init__(self, topic, payload, qos, retain, robot, enqueued):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.robot = robot
+        self.enqueued = enqueued
+        self.sent = None
+        self.attempts = 0
+        self.info = None
+
+
+class PublishQueue:
+    """Outbound pipeline in front of an MQTT client, with per-robot queues.
+
+    publish() has the client's signature, so the publishers use the queue in place of the client.
+    Messages for one robot go out in order, at most max_inflight_per_robot unacknowledged at a
+    time. An unsent message on a coalesced topic (orders by default) is replaced by a newer one.
+    A token bucket bounds the global send rate. Delivery is confirmed by polling the message info's
+    is_published(), which paho sets on PUBACK/PUBCOMP, so it works the same behind ShardedFleet.
+    """
+
+    def __init__(self, mqtt_client, qos=1, coalesce=("order",), max_inflight=100, max_inflight_per_robot=1,
+                 ack_timeout=5.0, max_retries=3, rate=200.0, burst=50, tick=0.005, latency_samples=10000,
+                 clock=time.monotonic):
+        self.mqtt_client = mqtt_client
+        self.clock = clock
+        self.qos = qos
+        self.coalesce = set(coalesce)
+        self.max_inflight = max_inflight
+        self.max_inflight_per_robot = max_inflight_per_robot
+        self.ack_timeout = ack_timeout
+        self.max_retries = max_retries
+        self.rate = rate
+        self.burst = burst
+        self.tick = tick
+
+        self.queues = {}
+        self.pending_by_topic = {}
+        self.ready = OrderedDict()
+        self.inflight = {}
+        self.inflight_per_robot = {}
+        self.tokens = float(burst)
+        self.last_refill = None
+        self.queue_delays = deque(maxlen=latency_samples)
+        self.ack_latencies = deque(maxlen=latency_samples)
+        self.counters = {"enqueued": 0, "sent": 0, "acknowledged": 0, "superseded": 0, "retries": 0,
+                         "failed": 0, "sendErrors": 0}
+        self.lock = threading.RLock()
+        self.condition = threading.Condition(self.lock)
+        self._thread = None
+        self._running = False
+
+        self.logger = logging.getLogger('PublishQueue')
+        logging.basicConfig(level=logging.WARN)
+
+    @staticmethod
+    def _robot(topic):
+        parts = topic.split('/')
+        return parts[3] if len(parts) > 3 else topic
+
+    def publish(self, topic, payload=None, qos=None, retain=False):
+        """Queues a message; sends right away when the robot, the in-flight window and the rate allow."""
+        now = self.clock()
+        # The publishers hard-code qos=0 for direct publishing; the configured QoS is the floor here.
+        qos = self.qos if qos is None else max(qos, self.qos)
+        with self.lock:
+            self.counters["enqueued"] += 1
+            pending = self.pending_by_topic.get(topic)
+            if pending is not None and topic.rsplit('/', 1)[-1] in self.coalesce:
+                # Keeps its place in the queue; only the newest content goes out.
+                pending.payload, pending.qos, pending.retain = payload, qos, retain
+                self.counters["superseded"] += 1
+                return pending
+            robot = self._robot(topic)
+            entry = _Entry(topic, payload, qos, retain, robot, now)
+            self.queues.setdefault(robot, deque()).append(entry)
+            self.pending_by_topic[topic] = entry
+            self._mark_ready(robot)
+            self.pump(now)
+            self.condition.notify()
+            return entry
+
+    def _mark_ready(self, robot):
+        if self.queues.get(robot) and self.inflight_per_robot.get(robot, 0) < self.max_inflight_per_robot:
+            self.ready[robot] = None
+
+    def _refill(self, now):
+        if self.last_refill is not None:
+            self.tokens = min(float(self.burst), self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def _send(self, entry, now):
+        entry.attempts += 1
+        try:
+            info = self.mqtt_client.publish(entry.topic, entry.payload, qos=entry.qos, retain=entry.retain)
+        except Exception as e:
+            self.logger.error(f"Publish to {entry.topic} raised: {e}")
+            info = None
+        if info is None or getattr(info, "rc", 0) != 0:
+            return False
+        entry.info = info
+        entry.sent = now
+        self.counters["sent"] += 1
+        return True
+
+    def _complete(self, entry, now):
+        del self.inflight[id(entry)]
+        self.inflight_per_robot[entry.robot] -= 1
+        self._mark_ready(entry.robot)
+
+    def _check_inflight(self, now):
+        for entry in list(self.inflight.values()):
+            if entry.info.is_published():
+                self.ack_latencies.append(now - entry.sent)
+                self.counters["acknowledged"] += 1
+                self._complete(entry, now)
+            elif now - entry.sent >= self.ack_timeout:
+                if entry.attempts > self.max_retries:
+                    self.logger.error(f"No acknowledgement for {entry.topic} after {entry.attempts} attempts; dropped.")
+                    self.counters["failed"] += 1
+                    self._complete(entry, now)
+                elif self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    self.counters["retries"] += 1
+                    if not self._send(entry, now):
+                        self.counters["sendErrors"] += 1
+                        entry.sent = now
+
+    def pump(self, now=None):
+        """Confirms acknowledgements, retries timeouts and sends queued messages; returns how many were sent."""
+        now = self.clock() if now is None else now
+        sent = 0
+        with self.lock:
+            self._refill(now)
+            self._check_inflight(now)
+            while self.ready and len(self.inflight) < self.max_inflight and self.tokens >= 1.0:
+                robot, _ = self.ready.popitem(last=False)
+                queue = self.queues[robot]
+                entry = queue[0]
+                self.tokens -= 1.0
+                if not self._send(entry, now):
+                    # Client not connected or its buffer is full; the message stays first in line.
+                    self.counters["sendErrors"] += 1
+                    self.ready[robot] = None
+                    break
+                queue.popleft()
+                if not queue:
+                    del self.queues[robot]
+                if self.pending_by_topic.get(entry.topic) is entry:
+                    del self.pending_by_topic[entry.topic]
+                self.queue_delays.append(now - entry.enqueued)
+                sent += 1
+                if entry.qos == 0 and entry.info.is_published():
+                    self.counters["acknowledged"] += 1
+                    self._mark_ready(robot)
+                    continue
+                self.inflight[id(entry)] = entry
+                self.inflight_per_robot[robot] = self.inflight_per_robot.get(robot, 0) + 1
+                self._mark_ready(robot)
+        return sent
+
+    def _run(self):
+        with self.condition:
+            while self._running:
+                self.pump()
+                busy = self.inflight or self.ready
+                self.condition.wait(self.tick if busy else 0.5)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="PublishQueue", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Gives queued and in-flight messages up to timeout seconds, then stops the pump thread."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if not self.inflight and not self.ready:
+                    break
+            time.sleep(self.tick)
+        with self.condition:
+            self._running = False
+            self.condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @staticmethod
+    def _percentiles(samples):
+        if not samples:
+            return None
+        values = np.fromiter(samples, dtype=np.float64)
+        p50, p90, p99 = np.percentile(values, (50, 90, 99)).tolist()
+        return {"p50": p50, "p90": p90, "p99": p99, "max": float(values.max()), "samples": len(values)}
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                **self.counters,
+                "queued": sum(len(queue) for queue in self.queues.values()),
+                "inflight": len(self.inflight),
+                "queueDelaySeconds": self._percentiles(self.queue_delays),
+                "ackLatencySeconds": self._percentiles(self.ack_latencies)
+            }
+
+
+class _BenchmarkInfo:
+    rc = 0
+
+    def __init__(self, acked_at, clock):
+        self.acked_at = acked_at
+        self.clock = clock
+
+    def is_published(self):
+        return self.acked_at is not None and self.clock[0] >= self.acked_at
+
+
+class _BenchmarkClient:
+    """Broker stand-in with random acknowledgement delays and a share of lost acknowledgements."""
+
+    def __init__(self, clock, rng, loss=0.01, mean_delay=0.02):
+        self.clock = clock
+        self.rng = rng
+        self.loss = loss
+        self.mean_delay = mean_delay
+        self.published = []
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.published.append((self.clock[0], topic))
+        lost = qos > 0 and self.rng.random() < self.loss
+        return _BenchmarkInfo(None if lost else self.clock[0] + self.rng.expovariate(1.0 / self.mean_delay), self.clock)
+
+
+def benchmark(robots=500, updates_per_robot=10, rate=500.0, seconds=20.0, tick=0.005, seed=44):
+    """A dispatch burst of order updates in simulated time: coalescing, rate limit, retries and ack latency."""
+    import random
+    import json
+
+    rng = random.Random(seed)
+    clock = [0.0]
+    client = _BenchmarkClient(clock, rng)
+    queue = PublishQueue(client, qos=1, rate=rate, burst=50, ack_timeout=0.5, max_retries=3,
+                         clock=lambda: clock[0])
+    for update in range(updates_per_robot):
+        for robot in range(robots):
+            queue.publish(f"uagv/v2/robots/agv_{robot:04d}/order",
+                          json.dumps({"orderId": f"order_{robot}", "orderUpdateId": update}))
+            queue.publish(f"uagv/v2/robots/agv_{robot:04d}/instantActions", json.dumps({"actions": []}))
+    start = time.perf_counter()
+    while clock[0] < seconds:
+        clock[0] += tick
+        queue.pump()
+    elapsed = time.perf_counter() - start
+
+    stats = queue.get_stats()
+    sent_times = [t for t, _ in client.published]
+    window = max(sent_times) - min(sent_times) if sent_times else 0.0
+    result = {
+        "enqueued": stats["enqueued"],
+        "sent": stats["sent"],
+        "superseded": stats["superseded"],
+        "retries": stats["retries"],
+        "failed": stats["failed"],
+        "left": stats["queued"] + stats["inflight"],
+        "sendRatePerSecond": len(sent_times) / window if window else None,
+        "rateLimit": rate,
+        "ackLatencyMilliseconds": {k: v * 1e3 for k, v in stats["ackLatencySeconds"].items() if k != "samples"},
+        "queueDelayP99Seconds": stats["queueDelaySeconds"]["p99"],
+        "pumpMicroseconds": elapsed / (seconds / tick) * 1e6
+    }
+    print(f"Publish queue benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
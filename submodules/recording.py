@@ -0,0 +1,408 @@
+import os
+import json
+import time
+import zlib
+import struct
+import logging
+import threading
+
+BLOCK_MAGIC = b"VDAB"
+# magic, compressed length, record count, first and last receive time
+BLOCK_HEADER = struct.Struct("<4sIIdd")
+# offset, compressed length, record count, first and last receive time
+INDEX_ENTRY = struct.Struct("<QIIdd")
+# receive time, topic length, payload length
+RECORD_HEADER = struct.Struct("<dHI")
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+
+
+class ReplayMessage:
+    """Stands in for paho's MQTTMessage when recorded traffic is fed back through on_message."""
+
+    __slots__ = ("topic", "payload", "timestamp", "qos", "retain", "mid")
+    replayed = True
+
+    def __init__(self, topic, payload, timestamp):
+        self.topic = topic
+        self.payload = payload
+        self.timestamp = timestamp
+        self.qos = 0
+        self.retain = False
+        self.mid = 0
+
+
+class TrafficRecorder:
+    """Appends raw inbound MQTT traffic to compressed, indexed segment files.
+
+    Records (receive time, topic, payload bytes) are batched into zlib blocks of about
+    block_bytes, written at least every flush_interval seconds. Each segment has an .idx sidecar
+    with the offset and time range of every block, so a time window is found without
+    decompressing the rest. A segment is closed after segment_bytes or segment_seconds, and the
+    oldest segments are deleted beyond max_total_bytes.
+    """
+
+    def __init__(self, directory="recordings", block_bytes=262144, flush_interval=1.0, segment_bytes=64 * 2 ** 20,
+                 segment_seconds=3600.0, max_total_bytes=10 * 2 ** 30, compression_level=6):
+        self.directory = directory
+        self.block_bytes = block_bytes
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.max_total_bytes = max_total_bytes
+        self.compression_level = compression_level
+
+        self.buffer = []
+        self.buffer_bytes = 0
+        self.block_first = None
+        self.block_last = None
+        self.segment = None
+        self.index = None
+        self.segment_path = None
+        self.segment_started = None
+        self.segment_size = 0
+        self.counters = {"records": 0, "rawBytes": 0, "compressedBytes": 0, "blocks": 0, "segments": 0,
+                         "deletedSegments": 0, "writeErrors": 0}
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self._thread = None
+        self._running = threading.Event()
+
+        self.logger = logging.getLogger('TrafficRecorder')
+        logging.basicConfig(level=logging.WARN)
+
+        os.makedirs(directory, exist_ok=True)
+
+    def record(self, topic, payload, now=None):
+        """Called on the network thread for every inbound message; only appends to the open block."""
+        now = time.time() if now is None else now
+        topic_bytes = topic.encode("utf-8")
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        entry = RECORD_HEADER.pack(now, len(topic_bytes), len(payload)) + topic_bytes + payload
+        with self.lock:
+            self.buffer.append(entry)
+            self.buffer_bytes += len(entry)
+            if self.block_first is None:
+                self.block_first = now
+            self.block_last = now
+            full = self.buffer_bytes >= self.block_bytes
+        if full:
+            self.flush()
+
+    def _take_block(self):
+        with self.lock:
+            if not self.buffer:
+                return None
+            block = (b"".join(self.buffer), len(self.buffer), self.block_first, self.block_last)
+            self.buffer = []
+            self.buffer_bytes = 0
+            self.block_first = self.block_last = None
+            return block
+
+    def flush(self):
+        """Compresses and writes the open block; returns the number of records written."""
+        # Taken under write_lock so two flushers cannot write their blocks out of order; record()
+        # only needs self.lock and keeps appending meanwhile.
+        with self.write_lock:
+            block = self._take_block()
+            if block is None:
+                return 0
+            raw, count, first, last = block
+            compressed = zlib.compress(raw, self.compression_level)
+            try:
+                if self.segment is None or self.segment_size >= self.segment_bytes or (
+                        first - self.segment_started >= self.segment_seconds):
+                    self._open_segment(first)
+                offset = self.segment_size
+                self.segment.write(BLOCK_HEADER.pack(BLOCK_MAGIC, len(compressed), count, first, last))
+                self.segment.write(compressed)
+                self.segment.flush()
+                self.index.write(INDEX_ENTRY.pack(offset, len(compressed), count, first, last))
+                self.index.flush()
+                self.segment_size += BLOCK_HEADER.size + len(compressed)
+            except OSError as e:
+                self.counters["writeErrors"] += 1
+                self.logger.error(f"Failed to write traffic block of {count} records: {e}")
+                return 0
+            self.counters["records"] += count
+            self.counters["rawBytes"] += len(raw)
+            self.counters["compressedBytes"] += len(compressed)
+            self.counters["blocks"] += 1
+        return count
+
+    def _open_segment(self, first):
+        self._close_segment()
+        name = f"traffic-{int(first * 1000):013d}"
+        self.segment_path = os.path.join(self.directory, name + SEGMENT_SUFFIX)
+        self.segment = open(self.segment_path, "ab")
+        self.index = open(os.path.join(self.directory, name + INDEX_SUFFIX), "ab")
+        self.segment_size = self.segment.tell()
+        self.segment_started = first
+        self.counters["segments"] += 1
+        self._enforce_retention()
+
+    def _close_segment(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.index.close()
+            self.segment = self.index = None
+
+    def _enforce_retention(self):
+        segments = list_segments(self.directory)
+        sizes = [os.path.getsize(path) for path in segments]
+        total = sum(sizes)
+        for path, size in zip(segments, sizes):
+            if total <= self.max_total_bytes or path == self.segment_path:
+                break
+            for file_path in (path, path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX):
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+            total -= size
+            self.counters["deletedSegments"] += 1
+            self.logger.info(f"Deleted traffic segment {path} to stay under {self.max_total_bytes} bytes")
+
+    def _run(self):
+        while not self._running.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        """Flushes the open block every flush_interval seconds from a background thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="TrafficRecorder", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._running.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self.write_lock:
+            self._close_segment()
+
+    def get_stats(self):
+        with self.write_lock:
+            stats = dict(self.counters)
+        stats["compressionRatio"] = stats["rawBytes"] / stats["compressedBytes"] if stats["compressedBytes"] else None
+        return stats
+
+
+def list_segments(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+
+def _read_index(segment_path):
+    """Block table of a segment from its .idx, or by walking the block headers when the index is missing or short."""
+    index_path = segment_path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+    blocks = []
+    if os.path.exists(index_path):
+        with open(index_path, "rb") as index_file:
+            data = index_file.read()
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        blocks = [INDEX_ENTRY.unpack_from(data, offset) for offset in range(0, usable, INDEX_ENTRY.size)]
+    size = os.path.getsize(segment_path)
+    offset = blocks[-1][0] + BLOCK_HEADER.size + blocks[-1][1] if blocks else 0
+    if offset >= size:
+        return blocks
+    # Blocks past the end of the index, e.g. after a crash between the two writes.
+    with open(segment_path, "rb") as segment:
+        segment.seek(offset)
+        while offset + BLOCK_HEADER.size <= size:
+            header = segment.read(BLOCK_HEADER.size)
+            magic, length, count, first, last = BLOCK_HEADER.unpack(header)
+            if magic != BLOCK_MAGIC or offset + BLOCK_HEADER.size + length > size:
+                break
+            blocks.append((offset, length, count, first, last))
+            segment.seek(length, os.SEEK_CUR)
+            offset += BLOCK_HEADER.size + length
+    return blocks
+
+
+class TrafficReplayer:
+    """Reads recorded traffic back by time window and feeds it to an on_message(client, userdata, msg) callback."""
+
+    def __init__(self, directory="recordings"):
+        self.directory = directory
+
+        self.logger = logging.getLogger('TrafficReplayer')
+        logging.basicConfig(level=logging.WARN)
+
+    def time_range(self):
+        """(first, last) receive time over all segments, or None for an empty recording."""
+        first = last = None
+        for path in list_segments(self.directory):
+            blocks = _read_index(path)
+            if blocks:
+                first = blocks[0][3] if first is None else min(first, blocks[0][3])
+                last = blocks[-1][4] if last is None else max(last, blocks[-1][4])
+        return None if first is None else (first, last)
+
+    def iter_records(self, start=None, end=None, topics=None):
+        """Yields (receive_time, topic, payload) in recorded order; topics filters on the last topic level."""
+        start = float("-inf") if start is None else start
+        end = float("inf") if end is None else end
+        topics = set(topics) if topics else None
+        for path in list_segments(self.directory):
+            blocks = [block for block in _read_index(path) if block[4] >= start and block[3] <= end]
+            if not blocks:
+                continue
+            with open(path, "rb") as segment:
+                for offset, length, count, first, last in blocks:
+                    segment.seek(offset + BLOCK_HEADER.size)
+                    try:
+                        raw = zlib.decompress(segment.read(length))
+                    except zlib.error as e:
+                        self.logger.error(f"Skipping corrupt block at {offset} in {path}: {e}")
+                        continue
+                    position = 0
+                    for _ in range(count):
+                        received, topic_length, payload_length = RECORD_HEADER.unpack_from(raw, position)
+                        position += RECORD_HEADER.size
+                        topic = raw[position:position + topic_length].decode("utf-8")
+                        position += topic_length
+                        payload = raw[position:position + payload_length]
+                        position += payload_length
+                        if received < start or received > end:
+                            continue
+                        if topics is not None and topic.rsplit('/', 1)[-1] not in topics:
+                            continue
+                        yield received, topic, payload
+
+    def state_at(self, timestamp, lookback=300.0, topics=("connection", "state")):
+        """The newest message per topic at or before timestamp, decoded; the fleet as it looked at that moment."""
+        latest = {}
+        for received, topic, payload in self.iter_records(timestamp - lookback, timestamp, topics):
+            latest[topic] = (received, payload)
+        view = {}
+        for topic, (received, payload) in latest.items():
+            try:
+                view[topic] = {"receivedAt": received, "message": json.loads(payload)}
+            except ValueError:
+                view[topic] = {"receivedAt": received, "message": None}
+        return view
+
+    def replay(self, on_message, start=None, end=None, speed=1.0, topics=None, userdata=None):
+        """Feeds the window to on_message at `speed` times the recorded pace, or as fast as possible for None.
+
+        Returns counts, wall time and, when paced, how far delivery fell behind the recorded timeline.
+        """
+        messages = 0
+        payload_bytes = 0
+        max_lag = 0.0
+        origin = None
+        wall_start = time.perf_counter()
+        first = last = None
+        for received, topic, payload in self.iter_records(start, end, topics):
+            if origin is None:
+                origin = received
+                first = received
+            last = received
+            if speed is not None:
+                due = wall_start + (received - origin) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    max_lag = max(max_lag, -delay)
+            on_message(None, userdata, ReplayMessage(topic, payload, received))
+            messages += 1
+            payload_bytes += len(payload)
+        wall = time.perf_counter() - wall_start
+        return {
+            "messages": messages,
+            "payloadBytes": payload_bytes,
+            "recordedSeconds": (last - first) if first is not None else 0.0,
+            "wallSeconds": wall,
+            "messagesPerSecond": messages / wall if wall > 0 else None,
+            "speed": speed,
+            "maxLagSeconds": max_lag if speed is not None else None
+        }
+
+
+def _benchmark_traffic(robot_count, seconds, start_time):
+    """Synthetic state and visualization traffic shaped like the simulator's; receive times 1 Hz / 2 Hz."""
+    traffic = []
+    for step in range(int(seconds * 2)):
+        now = start_time + step * 0.5
+        for robot in range(robot_count):
+            serial = f"agv_{robot:04d}"
+            position = {"x": round(robot * 0.1 + step * 0.05, 3), "y": float(robot % 40), "theta": 0.0,
+                        "mapId": "map_1", "positionInitialized": True}
+            header = {"headerId": step, "timestamp": f"2024-01-01T00:00:{step % 60:02d}.000Z", "version": "2.0.0",
+                      "manufacturer": "robots", "serialNumber": serial}
+            traffic.append((now, f"uagv/v2/robots/{serial}/visualization", json.dumps(
+                {**header, "agvPosition": position, "velocity": {"vx": 0.5, "vy": 0.0, "omega": 0.0}}).encode()))
+            if step % 2 == 0:
+                traffic.append((now, f"uagv/v2/robots/{serial}/state", json.dumps({
+                    **header, "orderId": f"order_{robot}", "orderUpdateId": 0, "lastNodeId": "node_1",
+                    "lastNodeSequenceId": 0, "driving": True, "operatingMode": "AUTOMATIC",
+                    "nodeStates": [{"nodeId": f"node_{k}", "sequenceId": 2 * k, "released": True}
+                                   for k in range(2, 6)],
+                    "edgeStates": [{"edgeId": f"edge_{k}", "sequenceId": 2 * k - 1, "released": True}
+                                   for k in range(2, 6)],
+                    "agvPosition": position, "velocity": {"vx": 0.5, "vy": 0.0, "omega": 0.0},
+                    "actionStates": [], "errors": [], "information": [], "loads": [],
+                    "batteryState": {"batteryCharge": round(90 - step * 0.01, 2), "charging": False},
+                    "safetyState": {"eStop": "NONE", "fieldViolation": False}
+                }).encode()))
+    return traffic
+
+
+def benchmark(robot_count=200, seconds=120, paced_seconds=2.0):
+    """Records two minutes of 200-robot traffic, then replays: window seek, max-speed pipeline and paced 1x."""
+    import tempfile
+    from submodules import schema_cache
+
+    start_time = 1_700_000_000.0
+    traffic = _benchmark_traffic(robot_count, seconds, start_time)
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = TrafficRecorder(directory, segment_seconds=30.0)
+        started = time.perf_counter()
+        for received, topic, payload in traffic:
+            recorder.record(topic, payload, received)
+        recorder.close()
+        record_seconds = time.perf_counter() - started
+        stats = recorder.get_stats()
+
+        replayer = TrafficReplayer(directory)
+        middle = start_time + seconds / 2
+        started = time.perf_counter()
+        window = sum(1 for _ in replayer.iter_records(middle, middle + 10.0))
+        seek_seconds = time.perf_counter() - started
+        view = replayer.state_at(middle)
+
+        def pipeline(client, userdata, msg):
+            # The fixed part of FleetManager.on_message: decode and schema validation.
+            message = json.loads(msg.payload)
+            schema_cache.validate(msg.topic.rsplit('/', 1)[-1], message)
+
+        schema_cache.get_validator("state")
+        schema_cache.get_validator("visualization")
+        fast = replayer.replay(pipeline, start_time, start_time + 30.0, speed=None)
+        paced = replayer.replay(lambda client, userdata, msg: None, middle, middle + paced_seconds, speed=1.0)
+
+    result = {
+        "messages": len(traffic),
+        "recordMicrosecondsPerMessage": record_seconds / len(traffic) * 1e6,
+        "compressionRatio": stats["compressionRatio"],
+        "bytesPerMessage": stats["compressedBytes"] / len(traffic),
+        "segments": stats["segments"],
+        "seek10sWindowMilliseconds": seek_seconds * 1e3,
+        "windowMessages": window,
+        "stateAtTopics": len(view),
+        "maxSpeedPipelinePerSecond": fast["messagesPerSecond"],
+        "pacedWallSeconds": paced["wallSeconds"],
+        "pacedMaxLagMilliseconds": paced["maxLagSeconds"] * 1e3
+    }
+    print(f"Traffic recording benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
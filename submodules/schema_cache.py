@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+SCHEMA_DIRECTORY = os.path.join(os.path.dirname(__file__), 'schemas')
+CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.schema_cache')
+
+logger = logging.getLogger('SchemaCache')
+
+_validators = {}
+_lock = threading.Lock()
+load_times = {}
+
+
+class SchemaValidationError(ValueError):
+    """Raised for a message that does not match its schema; keeps jsonschema out of the import path."""
+
+    def __init__(self, message, path=()):
+        super().__init__(message)
+        self.message = message
+        self.path = path
+
+
+def _cache_path(name):
+    return os.path.join(CACHE_DIRECTORY, f"{name}.json")
+
+
+def _is_checked(name, digest):
+    """True when a schema with this digest already passed check_schema; the cache holds only the digest."""
+    try:
+        with open(_cache_path(name), 'r', encoding='utf-8') as cache_file:
+            entry = json.load(cache_file)
+    except (OSError, ValueError):
+        return False
+    return isinstance(entry, dict) and entry.get("digest") == digest
+
+
+def _write_cache(name, digest):
+    try:
+        os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+        temporary = f"{_cache_path(name)}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as cache_file:
+            json.dump({"digest": digest}, cache_file)
+        os.replace(temporary, _cache_path(name))
+    except OSError as e:
+        logger.warning(f"Could not write schema cache for {name}: {e}")
+
+
+def _build_validator(name, use_disk_cache=True):
+    import jsonschema
+
+    start = time.perf_counter()
+    with open(os.path.join(SCHEMA_DIRECTORY, f"{name}.schema"), 'rb') as schema_file:
+        raw = schema_file.read()
+    # The digest covers the jsonschema version too, since check_schema results depend on it.
+    digest = hashlib.sha1(raw + _jsonschema_version().encode()).hexdigest()
+
+    schema = json.loads(raw.decode('utf-8'))
+    validator_class = jsonschema.validators.validator_for(schema)
+    if not (use_disk_cache and _is_checked(name, digest)):
+        # The expensive part of jsonschema.validate(); only done when the schema file changes.
+        validator_class.check_schema(schema)
+        if use_disk_cache:
+            _write_cache(name, digest)
+    validator = validator_class(schema)
+    load_times[name] = time.perf_counter() - start
+    return validator
+
+
+def _jsonschema_version():
+    try:
+        from importlib.metadata import version
+        return version("jsonschema")
+    except Exception:
+        return ""
+
+
+def get_validator(name):
+    """Validator for schemas/<name>.schema, built on first use and shared by all handlers."""
+    validator = _validators.get(name)
+    if validator is None:
+        with _lock:
+            validator = _validators.get(name)
+            if validator is None:
+                validator = _build_validator(name)
+                _validators[name] = validator
+    return validator
+
+
+def validate(name, instance):
+    validator = get_validator(name)
+    if validator.is_valid(instance):
+        return
+    from jsonschema.exceptions import best_match
+    # Same error jsonschema.validate() would report.
+    error = best_match(validator.iter_errors(instance))
+    raise SchemaValidationError(error.message, tuple(error.absolute_path)) from error
+
+
+def preload(names, background=True):
+    """Builds validators ahead of the first message, off the startup path when background is set."""
+    def load():
+        for name in names:
+            try:
+                get_validator(name)
+            except Exception as e:
+                logger.error(f"Failed to preload schema {name}: {e}")
+
+    if not background:
+        load()
+        return None
+    thread = threading.Thread(target=load, name="SchemaPreload", daemon=True)
+    thread.start()
+    return thread
+
+
+def clear():
+    with _lock:
+        _validators.clear()
+        load_times.clear()
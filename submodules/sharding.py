@@ -0,0 +1,232 @@
+import time
+import logging
+import threading
+
+
+class SitePartition:
+    """Latest per-robot view of one site; only touched for messages arriving from that site's broker."""
+
+    def __init__(self, site_id):
+        self.site_id = site_id
+        self.robots = {}
+        self.message_count = 0
+
+    def update(self, topic_kind, message, now):
+        serial_number = message.get("serialNumber")
+        if serial_number is None:
+            return
+        self.message_count += 1
+        robot = self.robots.get(serial_number)
+        if robot is None:
+            robot = {"serialNumber": serial_number, "manufacturer": message.get("manufacturer"),
+                     "connectionState": None, "lastSeen": None}
+            self.robots[serial_number] = robot
+        robot["lastSeen"] = now
+        if topic_kind == "connection":
+            robot["connectionState"] = message.get("connectionState")
+        elif topic_kind == "state":
+            robot["orderId"] = message.get("orderId")
+            robot["driving"] = message.get("driving", False)
+            robot["position"] = message.get("agvPosition")
+            robot["batteryCharge"] = message.get("batteryState", {}).get("batteryCharge")
+            robot["errorCount"] = len(message.get("errors", []))
+
+    def remove(self, serial_number):
+        self.robots.pop(serial_number, None)
+
+    def summary(self):
+        batteries = [r["batteryCharge"] for r in self.robots.values() if r.get("batteryCharge") is not None]
+        return {
+            "siteId": self.site_id,
+            "robots": len(self.robots),
+            "online": sum(1 for r in self.robots.values() if r["connectionState"] == "ONLINE"),
+            "driving": sum(1 for r in self.robots.values() if r.get("driving")),
+            "withErrors": sum(1 for r in self.robots.values() if r.get("errorCount")),
+            "batterySum": sum(batteries),
+            "batteryCount": len(batteries),
+            "messages": self.message_count
+        }
+
+
+class ShardedFleet:
+    """One MQTT client per site feeding a shared handler pipeline.
+
+    Exposes publish() like a single client, routing each message to the broker of the site where
+    the robot was last seen, so the publishers work unchanged in sharded mode.
+    """
+
+    def __init__(self, fleetname, versions, sites, on_connect, on_message, client_factory=None):
+        self.fleetname = fleetname
+        self.versions = versions
+        self.sites = {site["site_id"]: site for site in sites}
+        self.partitions = {site_id: SitePartition(site_id) for site_id in self.sites}
+        self.robot_sites = {}
+        self.pipeline_on_connect = on_connect
+        self.pipeline_on_message = on_message
+        # Handlers are not thread-safe; the per-site network loops take turns in the pipeline.
+        self.pipeline_lock = threading.RLock()
+        self.unrouted_publishes = 0
+
+        self.logger = logging.getLogger('ShardedFleet')
+        logging.basicConfig(level=logging.WARN)
+
+        if client_factory is None:
+            import paho.mqtt.client as mqtt
+            client_factory = lambda site_id: mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, userdata=site_id)
+        self.clients = {}
+        for site_id in self.sites:
+            client = client_factory(site_id)
+            client.user_data_set(site_id)
+            client.on_connect = self._on_connect
+            client.on_message = self._on_message
+            self.clients[site_id] = client
+
+    def manufacturers(self, site_id):
+        """Topic levels this site subscribes with; '+' unless the site is limited to some manufacturers."""
+        return self.sites[site_id].get("manufacturers") or ["+"]
+
+    def connect(self):
+        for site_id, client in self.clients.items():
+            site = self.sites[site_id]
+            try:
+                client.connect(site.get("broker_address", "localhost"), site.get("broker_port", 1883),
+                               site.get("keep_alive", 15))
+            except Exception as e:
+                self.logger.error(f"Failed to connect to broker of site {site_id}: {e}")
+
+    def _on_connect(self, client, userdata, flags, rc, *extra):
+        with self.pipeline_lock:
+            self.pipeline_on_connect(client, userdata, flags, rc, *extra)
+
+    def _on_message(self, client, userdata, msg):
+        with self.pipeline_lock:
+            self.pipeline_on_message(client, userdata, msg)
+
+    def record_message(self, site_id, topic_kind, message, now=None):
+        """Called by the pipeline after decoding; keeps the partition and the publish route current."""
+        partition = self.partitions.get(site_id)
+        if partition is None:
+            return
+        serial_number = message.get("serialNumber")
+        previous = self.robot_sites.get(serial_number)
+        if previous is not None and previous != site_id:
+            # The robot drove into another hall; it only belongs to one partition at a time.
+            self.partitions[previous].remove(serial_number)
+            self.logger.info(f"Robot {serial_number} moved from site {previous} to {site_id}")
+        self.robot_sites[serial_number] = site_id
+        partition.update(topic_kind, message, now if now is not None else time.time())
+
+    def site_of(self, serial_number):
+        return self.robot_sites.get(serial_number)
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        parts = topic.split('/')
+        serial_number = parts[3] if len(parts) > 3 else None
+        site_id = self.robot_sites.get(serial_number)
+        if site_id is not None:
+            return self.clients[site_id].publish(topic, payload, qos=qos, retain=retain)
+        # Unknown robot: publish to every site it could belong to; the others have no subscriber.
+        self.unrouted_publishes += 1
+        manufacturer = parts[2] if len(parts) > 2 else None
+        result = None
+        for site_id, client in self.clients.items():
+            manufacturers = self.manufacturers(site_id)
+            if "+" in manufacturers or manufacturer in manufacturers:
+                result = client.publish(topic, payload, qos=qos, retain=retain)
+        return result
+
+    def get_robot(self, serial_number):
+        site_id = self.robot_sites.get(serial_number)
+        if site_id is None:
+            return None
+        return dict(self.partitions[site_id].robots[serial_number], siteId=site_id)
+
+    def get_site_robots(self, site_id):
+        return list(self.partitions[site_id].robots.values())
+
+    def get_fleet_summary(self):
+        """Aggregates the per-site summaries into fleet-wide totals."""
+        sites = [partition.summary() for partition in self.partitions.values()]
+        totals = {key: sum(site[key] for site in sites)
+                  for key in ("robots", "online", "driving", "withErrors", "batterySum", "batteryCount", "messages")}
+        for site in sites + [totals]:
+            battery_count = site.pop("batteryCount")
+            battery_sum = site.pop("batterySum")
+            site["meanBatteryCharge"] = battery_sum / battery_count if battery_count else None
+        totals["sites"] = sites
+        totals["unroutedPublishes"] = self.unrouted_publishes
+        return totals
+
+    def loop_start(self):
+        for client in self.clients.values():
+            client.loop_start()
+
+    def loop_stop(self):
+        for client in self.clients.values():
+            client.loop_stop()
+
+    def loop_forever(self):
+        self.loop_start()
+        try:
+            while True:
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            self.loop_stop()
+
+
+def benchmark(site_count=3, robots_per_site=200, rounds=20):
+    """Runs several in-process brokers with simulated robots through a sharded pipeline."""
+    import json
+    from submodules.local_broker import LocalBroker, LocalClient
+
+    brokers = [LocalBroker("localhost", 21883 + i) for i in range(site_count)]
+    sites = [{"site_id": f"hall_{i}", "broker_address": "localhost", "broker_port": 21883 + i}
+             for i in range(site_count)]
+    handled = []
+
+    def on_connect(client, userdata, flags, rc, *extra):
+        client.subscribe("uagv/v2/+/+/state")
+        client.subscribe("uagv/v2/+/+/connection")
+
+    def on_message(client, userdata, msg):
+        message = json.loads(msg.payload)
+        fleet.record_message(userdata, msg.topic.rsplit('/', 1)[1], message)
+        handled.append(userdata)
+
+    fleet = ShardedFleet("uagv", "v2", sites, on_connect, on_message,
+                         client_factory=lambda site_id: LocalClient(client_id=site_id))
+    fleet.connect()
+
+    robots = []
+    for i, broker in enumerate(brokers):
+        for r in range(robots_per_site):
+            robot = LocalClient(client_id=f"agv_{i}_{r}")
+            robot.connect("localhost", broker.port)
+            robots.append((robot, f"{i:02d}{r:04d}"))
+            robot.publish(f"uagv/v2/robots/{i:02d}{r:04d}/connection",
+                          json.dumps({"serialNumber": f"{i:02d}{r:04d}", "connectionState": "ONLINE"}))
+
+    start = time.perf_counter()
+    for step in range(rounds):
+        for robot, serial_number in robots:
+            robot.publish(f"uagv/v2/robots/{serial_number}/state", json.dumps({
+                "serialNumber": serial_number, "driving": step % 2 == 0,
+                "batteryState": {"batteryCharge": 100.0 - step}, "errors": []
+            }))
+    elapsed = time.perf_counter() - start
+
+    summary = fleet.get_fleet_summary()
+    for broker in brokers:
+        broker.close()
+    result = {
+        "sites": site_count,
+        "robots": summary["robots"],
+        "online": summary["online"],
+        "messagesPerSecond": rounds * len(robots) / elapsed
+    }
+    print(f"Sharding benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
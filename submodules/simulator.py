@@ -0,0 +1,604 @@
+import json
+import time
+import logging
+import datetime
+import threading
+from collections import deque
+
+import numpy as np
+
+from submodules.local_broker import LocalClient
+
+FINISHED_STATUSES = ("FINISHED", "FAILED")
+
+
+class FleetSimulator:
+    """Simulated VDA5050 AGVs driving their orders, for load-testing the manager in one process.
+
+    Robot kinematics live in numpy arrays and are advanced for the whole fleet at once; only robots
+    that reach a node, receive a command or are due to publish are touched individually. Time is
+    simulated, commands are applied at step boundaries and all randomness comes from the seed, so a
+    run with the same seed, start_time and inputs publishes the same messages.
+    """
+
+    def __init__(self, fleetname, version, versions, manufacturer, robot_count=10, broker_address="localhost",
+                 broker_port=1883, keep_alive=15, serial_prefix="sim_", seed=0, time_step=0.1, state_interval=1.0,
+                 visualization_interval=0.5, max_speed=1.5, drain_rate=0.02, idle_drain_rate=0.002,
+                 charge_rate=0.5, map_id="map_1", area=(0.0, 0.0, 30.0, 30.0), start_time=None,
+                 max_action_states=32, client_factory=None):
+        self.fleetname = fleetname
+        self.version = version
+        self.versions = versions
+        self.manufacturer = manufacturer
+        self.robot_count = robot_count
+        self.broker_address = broker_address
+        self.broker_port = broker_port
+        self.keep_alive = keep_alive
+        self.seed = seed
+        self.time_step = time_step
+        self.state_interval = state_interval
+        self.visualization_interval = visualization_interval
+        self.max_speed = max_speed
+        self.drain_rate = drain_rate
+        self.idle_drain_rate = idle_drain_rate
+        self.charge_rate = charge_rate
+        self.map_id = map_id
+        self.start_time = start_time if start_time is not None else datetime.datetime.now(datetime.timezone.utc)
+        self.max_action_states = max_action_states
+        self.client_factory = client_factory if client_factory is not None else lambda client_id: LocalClient(
+            client_id=client_id)
+        self.client = None
+        self.sim_time = 0.0
+        self.published = 0
+        self.commands = deque()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        self.logger = logging.getLogger('FleetSimulator')
+        logging.basicConfig(level=logging.WARN)
+
+        self.rng = np.random.default_rng(seed)
+        self.serial_numbers = [f"{serial_prefix}{i:04d}" for i in range(robot_count)]
+        self.index = {serial_number: i for i, serial_number in enumerate(self.serial_numbers)}
+
+        min_x, min_y, max_x, max_y = area
+        self.x = self.rng.uniform(min_x, max_x, robot_count)
+        self.y = self.rng.uniform(min_y, max_y, robot_count)
+        self.theta = self.rng.uniform(-np.pi, np.pi, robot_count)
+        self.speed = np.zeros(robot_count)
+        self.battery = self.rng.uniform(60.0, 100.0, robot_count)
+        self.target_x = self.x.copy()
+        self.target_y = self.y.copy()
+        self.edge_speed = np.full(robot_count, max_speed)
+        self.distance_since_last_node = np.zeros(robot_count)
+        self.has_target = np.zeros(robot_count, dtype=bool)
+        self.paused = np.zeros(robot_count, dtype=bool)
+        self.charging = np.zeros(robot_count, dtype=bool)
+        # Random phases keep thousands of robots from publishing in the same step.
+        self.next_state = self.rng.uniform(0.0, state_interval, robot_count)
+        self.next_visualization = (self.rng.uniform(0.0, visualization_interval, robot_count)
+                                   if visualization_interval else np.full(robot_count, np.inf))
+
+        self.orders = [None] * robot_count
+        self.last_node_ids = [""] * robot_count
+        self.last_node_sequence_ids = [0] * robot_count
+        self.map_ids = [map_id] * robot_count
+        self.action_states = [{} for _ in range(robot_count)]
+        self.errors = [[] for _ in range(robot_count)]
+        self.header_ids = {kind: [0] * robot_count
+                           for kind in ("state", "visualization", "connection", "factsheet")}
+
+    def _topic(self, serial_number, kind):
+        return f"{self.fleetname}/{self.versions}/{self.manufacturer}/{serial_number}/{kind}"
+
+    def _timestamp(self):
+        timestamp = self.start_time + datetime.timedelta(seconds=self.sim_time)
+        return timestamp.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+    def _header(self, i, kind, timestamp):
+        self.header_ids[kind][i] += 1
+        return {
+            "headerId": self.header_ids[kind][i],
+            "timestamp": timestamp,
+            "version": self.version,
+            "manufacturer": self.manufacturer,
+            "serialNumber": self.serial_numbers[i]
+        }
+
+    def _publish(self, i, kind, message, qos=0, retain=False):
+        self.client.publish(self._topic(self.serial_numbers[i], kind), json.dumps(message), qos=qos, retain=retain)
+        self.published += 1
+
+    def connect(self, start_loop=False):
+        """Connects one client for the whole fleet and announces every robot with connection and factsheet.
+
+        A LocalClient on a synchronous broker needs no network loop; clients of a real broker do.
+        """
+        self.client = self.client_factory(f"{self.fleetname}_simulator")
+        self.client.on_message = self.on_message
+        self.client.connect(self.broker_address, self.broker_port, self.keep_alive)
+        if start_loop:
+            self.client.loop_start()
+        for kind in ("order", "instantActions"):
+            self.client.subscribe(f"{self.fleetname}/{self.versions}/{self.manufacturer}/+/{kind}", qos=0)
+        timestamp = self._timestamp()
+        for i in range(self.robot_count):
+            self._publish_connection(i, "ONLINE", timestamp)
+            self._publish_factsheet(i, timestamp)
+
+    def disconnect(self):
+        self.loop_stop()
+        if self.client is None:
+            return
+        timestamp = self._timestamp()
+        for i in range(self.robot_count):
+            self._publish_connection(i, "OFFLINE", timestamp)
+        self.client.loop_stop()
+        self.client.disconnect()
+        self.client = None
+
+    def on_message(self, client, userdata, msg):
+        # Only queued here; the next step applies it, so delivery on the publishing thread is safe.
+        parts = msg.topic.split('/')
+        i = self.index.get(parts[-2])
+        if i is None:
+            return
+        try:
+            self.commands.append((i, parts[-1], json.loads(msg.payload)))
+        except json.JSONDecodeError as e:
+            self.logger.error(f"Robot {parts[-2]} received undecodable {parts[-1]}: {e}")
+
+    def _apply_commands(self):
+        while self.commands:
+            i, kind, message = self.commands.popleft()
+            if kind == "order":
+                self._accept_order(i, message)
+            elif kind == "instantActions":
+                self._run_instant_actions(i, message)
+
+    def _reject(self, i, error_type, description, order_id):
+        self.errors[i] = [{
+            "errorType": error_type,
+            "errorLevel": "WARNING",
+            "errorDescription": description,
+            "errorReferences": [{"referenceKey": "orderId", "referenceValue": order_id}]
+        }]
+        self.next_state[i] = self.sim_time
+
+    def _accept_order(self, i, message):
+        order_id = message.get("orderId")
+        update_id = message.get("orderUpdateId", 0)
+        current = self.orders[i]
+        is_update = current is not None and current["orderId"] == order_id
+        if is_update and update_id < current["orderUpdateId"]:
+            self._reject(i, "orderUpdateError", f"orderUpdateId {update_id} is older than "
+                         f"{current['orderUpdateId']}", order_id)
+            return
+        if is_update and update_id == current["orderUpdateId"]:
+            return
+        if not is_update and current is not None and current["nodes"]:
+            self._reject(i, "orderError", f"Still executing order {current['orderId']}", order_id)
+            return
+
+        # An update replaces everything after the last reached node; a new order starts from its first node.
+        first_sequence_id = self.last_node_sequence_ids[i] if is_update else -1
+        nodes = sorted((n for n in message.get("nodes", []) if n.get("sequenceId", 0) > first_sequence_id),
+                       key=lambda n: n.get("sequenceId", 0))
+        edges = sorted((e for e in message.get("edges", []) if e.get("sequenceId", 0) > first_sequence_id),
+                       key=lambda e: e.get("sequenceId", 0))
+        self.orders[i] = {
+            "orderId": order_id,
+            "orderUpdateId": update_id,
+            "zoneSetId": message.get("zoneSetId"),
+            "nodes": nodes,
+            "edges": edges
+        }
+        if not is_update:
+            self.last_node_ids[i] = ""
+            self.last_node_sequence_ids[i] = 0
+        self.errors[i] = []
+        states = {action_id: state for action_id, state in self.action_states[i].items()
+                  if state["actionStatus"] not in FINISHED_STATUSES}
+        for element in nodes + edges:
+            for action in element.get("actions", []):
+                states[action["actionId"]] = {"actionId": action["actionId"], "actionType": action.get("actionType"),
+                                              "actionStatus": "WAITING"}
+        self.action_states[i] = states
+        self._set_target(i)
+        self.next_state[i] = self.sim_time
+
+    def _set_target(self, i):
+        order = self.orders[i]
+        node = order["nodes"][0] if order is not None and order["nodes"] else None
+        if node is None or not node.get("released", True):
+            self.has_target[i] = False
+            return
+        position = node.get("nodePosition")
+        # Nodes without a position count as reached where the robot stands.
+        self.target_x[i] = position["x"] if position else self.x[i]
+        self.target_y[i] = position["y"] if position else self.y[i]
+        edge = next((e for e in order["edges"] if e.get("endNodeId") == node["nodeId"]), None)
+        self.edge_speed[i] = min(edge.get("maxSpeed") or self.max_speed, self.max_speed) if edge else self.max_speed
+        self.has_target[i] = True
+
+    def _finish_actions(self, i, actions):
+        for action in actions:
+            state = self.action_states[i].get(action["actionId"])
+            if state is None:
+                continue
+            state["actionStatus"] = "FINISHED"
+            if action.get("actionType") == "startCharging":
+                self.charging[i] = True
+
+    def _arrive(self, i):
+        order = self.orders[i]
+        node = order["nodes"].pop(0)
+        self.last_node_ids[i] = node["nodeId"]
+        self.last_node_sequence_ids[i] = node.get("sequenceId", 0)
+        self.map_ids[i] = node.get("nodePosition", {}).get("mapId", self.map_ids[i])
+        self.distance_since_last_node[i] = 0.0
+        for edge in [e for e in order["edges"] if e.get("sequenceId", 0) < self.last_node_sequence_ids[i]]:
+            self._finish_actions(i, edge.get("actions", []))
+            order["edges"].remove(edge)
+        self._finish_actions(i, node.get("actions", []))
+        self._set_target(i)
+        self.next_state[i] = self.sim_time
+
+    def _run_instant_actions(self, i, message):
+        for action in message.get("actions", []):
+            # The publisher in this repo writes actionName; VDA5050 calls it actionType.
+            action_type = action.get("actionType") or action.get("actionName")
+            status = "FINISHED"
+            if action_type == "startPause":
+                self.paused[i] = True
+            elif action_type == "stopPause":
+                self.paused[i] = False
+            elif action_type == "cancelOrder":
+                if self.orders[i] is not None:
+                    self.orders[i]["nodes"] = []
+                    self.orders[i]["edges"] = []
+                for state in self.action_states[i].values():
+                    if state["actionStatus"] not in FINISHED_STATUSES:
+                        state["actionStatus"] = "FAILED"
+                self.has_target[i] = False
+            elif action_type == "startCharging":
+                self.charging[i] = True
+            elif action_type == "stopCharging":
+                self.charging[i] = False
+            elif action_type == "factsheetRequest":
+                self._publish_factsheet(i, self._timestamp())
+            self.action_states[i][action.get("actionId")] = {"actionId": action.get("actionId"),
+                                                             "actionType": action_type, "actionStatus": status}
+        self._trim_action_states(i)
+        self.next_state[i] = self.sim_time
+
+    def _trim_action_states(self, i):
+        states = self.action_states[i]
+        finished = [action_id for action_id, state in states.items() if state["actionStatus"] in FINISHED_STATUSES]
+        for action_id in finished[:max(0, len(states) - self.max_action_states)]:
+            del states[action_id]
+
+    def _move(self, dt):
+        moving = self.has_target & ~self.paused & ~self.charging & (self.battery > 0.0)
+        dx = self.target_x - self.x
+        dy = self.target_y - self.y
+        distance = np.hypot(dx, dy)
+        reach = self.edge_speed * dt
+        travel = np.where(moving, np.minimum(distance, reach), 0.0)
+        heading = moving & (distance > 0.0)
+        scale = np.divide(travel, distance, out=np.zeros_like(travel), where=heading)
+        self.x += dx * scale
+        self.y += dy * scale
+        self.theta = np.where(heading, np.arctan2(dy, dx), self.theta)
+        self.speed = travel / dt
+        self.distance_since_last_node += travel
+
+        self.battery -= dt * np.where(moving, self.drain_rate, self.idle_drain_rate)
+        self.battery += dt * np.where(self.charging, self.charge_rate, 0.0)
+        np.clip(self.battery, 0.0, 100.0, out=self.battery)
+        self.charging &= self.battery < 100.0
+
+        for i in np.flatnonzero(moving & (distance <= reach)):
+            self._arrive(i)
+
+    def _publish_connection(self, i, connection_state, timestamp):
+        message = self._header(i, "connection", timestamp)
+        message["connectionState"] = connection_state
+        self._publish(i, "connection", message, qos=1, retain=True)
+
+    def _publish_factsheet(self, i, timestamp):
+        message = self._header(i, "factsheet", timestamp)
+        message.update({
+            "typeSpecification": {"seriesName": "simulated", "agvKinematic": "DIFF", "agvClass": "CARRIER",
+                                  "maxLoadMass": 500.0, "localizationTypes": ["NATURAL"],
+                                  "navigationTypes": ["AUTONOMOUS"]},
+            "physicalParameters": {"speedMin": 0.0, "speedMax": self.max_speed, "accelerationMax": 1.0,
+                                   "decelerationMax": 1.0, "heightMin": 0.2, "heightMax": 0.4, "width": 0.8,
+                                   "length": 1.2},
+            "protocolLimits": {
+                "maxStringLens": {"msgLen": 65536, "topicSerialLen": 32, "topicElemLen": 32, "idLen": 64,
+                                  "idNumericalOnly": False, "enumLen": 32, "loadIdLen": 32},
+                "maxArrayLens": {"order.nodes": 1000, "order.edges": 1000, "node.actions": 16, "edge.actions": 16,
+                                 "actions.actionsParameters": 16, "instantActions": 16,
+                                 "trajectory.knotVector": 64, "trajectory.controlPoints": 64,
+                                 "state.nodeStates": 1000, "state.edgeStates": 1000, "state.loads": 1,
+                                 "state.actionStates": self.max_action_states, "state.errors": 16,
+                                 "state.information": 16, "error.errorReferences": 4,
+                                 "information.infoReferences": 4},
+                "timing": {"minOrderInterval": 0.0, "minStateInterval": self.time_step,
+                           "defaultStateInterval": self.state_interval,
+                           "visualizationInterval": self.visualization_interval or 0.0}
+            },
+            "protocolFeatures": {"optionalParameters": [], "agvActions": [
+                {"actionType": action_type, "actionScopes": ["INSTANT"]}
+                for action_type in ("startPause", "stopPause", "cancelOrder", "startCharging", "stopCharging",
+                                    "factsheetRequest")
+            ]},
+            "agvGeometry": {"wheelDefinitions": [], "envelopes2d": []},
+            "loadSpecification": {"loadPositions": [], "loadSets": []}
+        })
+        self._publish(i, "factsheet", message)
+
+    def _publish_states(self, due, timestamp):
+        xs = np.round(self.x[due], 3).tolist()
+        ys = np.round(self.y[due], 3).tolist()
+        thetas = np.round(self.theta[due], 3).tolist()
+        speeds = np.round(self.speed[due], 3).tolist()
+        batteries = np.round(self.battery[due], 2).tolist()
+        distances = np.round(self.distance_since_last_node[due], 3).tolist()
+        paused = self.paused[due].tolist()
+        charging = self.charging[due].tolist()
+        for k, i in enumerate(due.tolist()):
+            order = self.orders[i]
+            message = self._header(i, "state", timestamp)
+            message.update({
+                "orderId": order["orderId"] if order else "",
+                "orderUpdateId": order["orderUpdateId"] if order else 0,
+                "lastNodeId": self.last_node_ids[i],
+                "lastNodeSequenceId": self.last_node_sequence_ids[i],
+                "nodeStates": [{"nodeId": n["nodeId"], "sequenceId": n.get("sequenceId", 0),
+                                "released": n.get("released", True)} for n in order["nodes"]] if order else [],
+                "edgeStates": [{"edgeId": e["edgeId"], "sequenceId": e.get("sequenceId", 0),
+                                "released": e.get("released", True)} for e in order["edges"]] if order else [],
+                "driving": speeds[k] > 0.0,
+                "paused": paused[k],
+                "newBaseRequest": False,
+                "distanceSinceLastNode": distances[k],
+                "operatingMode": "AUTOMATIC",
+                "agvPosition": {"x": xs[k], "y": ys[k], "theta": thetas[k], "mapId": self.map_ids[i],
+                                "positionInitialized": True},
+                "velocity": {"vx": speeds[k], "vy": 0.0, "omega": 0.0},
+                "loads": [],
+                "actionStates": list(self.action_states[i].values()),
+                "batteryState": {"batteryCharge": batteries[k], "charging": charging[k]},
+                "errors": self.errors[i],
+                "information": [],
+                "safetyState": {"eStop": "NONE", "fieldViolation": False}
+            })
+            if order and order.get("zoneSetId"):
+                message["zoneSetId"] = order["zoneSetId"]
+            self._publish(i, "state", message)
+
+    def _publish_visualizations(self, due, timestamp):
+        xs = np.round(self.x[due], 3).tolist()
+        ys = np.round(self.y[due], 3).tolist()
+        thetas = np.round(self.theta[due], 3).tolist()
+        speeds = np.round(self.speed[due], 3).tolist()
+        for k, i in enumerate(due.tolist()):
+            message = self._header(i, "visualization", timestamp)
+            message["agvPosition"] = {"x": xs[k], "y": ys[k], "theta": thetas[k], "mapId": self.map_ids[i],
+                                      "positionInitialized": True}
+            message["velocity"] = {"vx": speeds[k], "vy": 0.0, "omega": 0.0}
+            self._publish(i, "visualization", message)
+
+    def step(self, dt=None):
+        """Applies queued commands, moves every robot by dt and publishes what is due."""
+        dt = dt if dt is not None else self.time_step
+        self._apply_commands()
+        self.sim_time += dt
+        self._move(dt)
+
+        timestamp = self._timestamp()
+        due = np.flatnonzero(self.next_state <= self.sim_time)
+        if due.size:
+            self.next_state[due] += self.state_interval
+            self.next_state[due] = np.maximum(self.next_state[due], self.sim_time + dt)
+            self._publish_states(due, timestamp)
+        due = np.flatnonzero(self.next_visualization <= self.sim_time)
+        if due.size:
+            self.next_visualization[due] += self.visualization_interval
+            self._publish_visualizations(due, timestamp)
+
+    def run(self, duration, realtime=False):
+        """Simulates duration seconds (None runs until loop_stop), as fast as possible or paced to the wall clock."""
+        steps = int(round(duration / self.time_step)) if duration is not None else None
+        start = time.perf_counter()
+        step = 0
+        while (steps is None or step < steps) and not self._stop_event.is_set():
+            self.step()
+            step += 1
+            if realtime:
+                delay = start + step * self.time_step - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        return time.perf_counter() - start
+
+    def loop_start(self, realtime=True):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, args=(None, realtime), name="FleetSimulator",
+                                        daemon=True)
+        self._thread.start()
+
+    def loop_stop(self):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def get_robot(self, serial_number):
+        i = self.index[serial_number]
+        order = self.orders[i]
+        return {
+            "serialNumber": serial_number,
+            "x": float(self.x[i]),
+            "y": float(self.y[i]),
+            "theta": float(self.theta[i]),
+            "batteryCharge": float(self.battery[i]),
+            "driving": bool(self.speed[i] > 0.0),
+            "paused": bool(self.paused[i]),
+            "charging": bool(self.charging[i]),
+            "orderId": order["orderId"] if order else None,
+            "remainingNodes": len(order["nodes"]) if order else 0,
+            "lastNodeId": self.last_node_ids[i]
+        }
+
+    def get_stats(self):
+        return {
+            "robots": self.robot_count,
+            "simTime": self.sim_time,
+            "published": self.published,
+            "driving": int(np.count_nonzero(self.speed > 0.0)),
+            "withOrder": int(np.count_nonzero(self.has_target)),
+            "charging": int(np.count_nonzero(self.charging)),
+            "meanBattery": float(self.battery.mean()) if self.robot_count else 0.0
+        }
+
+
+def _dispatch_order(order_publisher, client, serial_number, order_number, rng, node_count=4, area=30.0):
+    order_publisher.new_order(f"order_{serial_number}_{order_number}")
+    points = rng.uniform(0.0, area, (node_count, 2)).round(2).tolist()
+    for k, (x, y) in enumerate(points):
+        order_publisher.add_node(f"node_{k}", 2 * k, "", {"x": x, "y": y, "theta": 0.0, "mapId": "map_1"}, [])
+        if k:
+            order_publisher.add_edge(f"edge_{k}", 2 * k - 1, f"node_{k - 1}", f"node_{k}", "", [], released=True,
+                                     maxSpeed=1.5)
+    order_publisher.publish_order(client, serial_number)
+    return order_publisher.message_template["orderId"]
+
+
+def benchmark(robot_counts=(1000, 5000), sim_seconds=30.0, closed_loop_robots=500, seed=7):
+    """Open-loop simulator throughput, a determinism check and a closed loop through the handlers on SQLite."""
+    import os
+    import hashlib
+    import tempfile
+    from submodules.local_broker import LocalBroker
+    from submodules.storage import SQLiteConnection
+    from submodules.migrations import apply_migrations
+    from submodules.database_writer import DatabaseWriter
+    from submodules.order import OrderPublisher
+    from submodules.state import StateHandler
+    from submodules.connection import ConnectionHandler
+    from submodules.factsheet import FactsheetHandler
+    from submodules.visualization import VisualizationSubscriber
+    from submodules.schema_cache import SchemaValidationError
+
+    start_time = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    results = {}
+
+    def open_loop(robot_count, port):
+        broker = LocalBroker("localhost", port)
+        digest = hashlib.sha1()
+        observer = LocalClient(client_id="observer")
+        observer.on_message = lambda client, userdata, msg: digest.update(msg.payload)
+        observer.connect("localhost", port)
+        # Orders carry the publisher's wall-clock timestamps; only the robots' side must repeat exactly.
+        for kind in ("state", "visualization", "connection", "factsheet"):
+            observer.subscribe(f"uagv/v2/+/+/{kind}")
+        simulator = FleetSimulator("uagv", "2.0.0", "v2", "robots", robot_count, broker_port=port, seed=seed,
+                                   start_time=start_time)
+        simulator.connect()
+        publisher = OrderPublisher("uagv", "2.0.0", "v2", "robots", None, db_writer=DatabaseWriter(None),
+                                   compiled_template=True)
+        publisher.db_writer.insert = lambda table, columns, values: True
+        rng = np.random.default_rng(seed)
+        for serial_number in simulator.serial_numbers:
+            _dispatch_order(publisher, observer, serial_number, 0, rng)
+        elapsed = simulator.run(sim_seconds)
+        broker.close()
+        return simulator, elapsed, digest.hexdigest()
+
+    for n, robot_count in enumerate(robot_counts):
+        simulator, elapsed, _ = open_loop(robot_count, 31883 + n)
+        stats = simulator.get_stats()
+        results[f"openLoop{robot_count}"] = {
+            "realtimeFactor": sim_seconds / elapsed,
+            "messagesPerSecond": stats["published"] / elapsed,
+            "stepMilliseconds": elapsed / (sim_seconds / simulator.time_step) * 1e3
+        }
+
+    results["deterministic"] = open_loop(200, 31880)[2] == open_loop(200, 31880)[2]
+
+    with tempfile.TemporaryDirectory() as directory:
+        conn = SQLiteConnection(os.path.join(directory, "sim.db"))
+        apply_migrations(conn)
+        writer = DatabaseWriter(conn, batch_size=500, batch_interval=3600)
+        order_publisher = OrderPublisher("uagv", "2.0.0", "v2", "robots", conn, writer, compiled_template=True)
+        state_handler = StateHandler("uagv", "2.0.0", "v2", conn, writer)
+        connection_handler = ConnectionHandler("uagv", "2.0.0", "v2", conn, writer)
+        factsheet_handler = FactsheetHandler("uagv", "2.0.0", "v2", conn, writer)
+        visualization_subscriber = VisualizationSubscriber("uagv", "2.0.0", "v2", "robots")
+        for name in ('StateHandler', 'ConnectionHandler', 'FactsheetHandler', 'VisualizationSubscriber'):
+            logging.getLogger(name).setLevel(logging.WARN)
+
+        broker = LocalBroker("localhost", 31890)
+        manager = LocalClient(client_id="manager")
+        manager.connect("localhost", 31890)
+        for handler in (state_handler, connection_handler, factsheet_handler):
+            handler.subscribe_to_topics(manager)
+        visualization_subscriber.subscribe_to_topics(manager)
+        rng = np.random.default_rng(seed)
+        dispatched = {}
+        completed = []
+        invalid = []
+
+        def on_message(client, userdata, msg):
+            message = json.loads(msg.payload)
+            kind = msg.topic.rsplit('/', 1)[-1]
+            try:
+                if kind == "state":
+                    state_handler.process_state_message(message)
+                    serial_number = message["serialNumber"]
+                    order_id = dispatched.get(serial_number)
+                    if order_id is None or (message["orderId"] == order_id and not message["nodeStates"]):
+                        if order_id is not None:
+                            completed.append(order_id)
+                        dispatched[serial_number] = _dispatch_order(order_publisher, manager, serial_number,
+                                                                    len(completed), rng)
+                elif kind == "connection":
+                    connection_handler.process_connection_message(message)
+                elif kind == "factsheet":
+                    factsheet_handler.process_factsheet_message(message)
+                elif kind == "visualization":
+                    visualization_subscriber.process_visualization_message(message)
+            except SchemaValidationError:
+                invalid.append(kind)
+
+        manager.on_message = on_message
+        simulator = FleetSimulator("uagv", "2.0.0", "v2", "robots", closed_loop_robots, broker_port=31890,
+                                   seed=seed, start_time=start_time)
+        simulator.connect()
+        elapsed = simulator.run(sim_seconds)
+        writer.flush()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM state")
+        state_rows = cursor.fetchone()[0]
+        broker.close()
+        conn.close()
+
+    results[f"closedLoop{closed_loop_robots}"] = {
+        "realtimeFactor": sim_seconds / elapsed,
+        "messagesPerSecond": simulator.get_stats()["published"] / elapsed,
+        "ordersCompleted": len(completed),
+        "stateRows": state_rows,
+        "schemaFailures": len(invalid)
+    }
+    for name, result in results.items():
+        print(f"{name}: {result}")
+    return results
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import subprocess
+from contextlib import contextmanager
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_NAMES = ("connection", "factsheet", "state", "visualization", "order", "instantActions")
+
+
+class StartupTimer:
+    """Wall-clock time of each startup step, including steps finished on background threads."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last_mark = self.started
+        self.steps = []
+        self.lock = threading.Lock()
+
+        self.logger = logging.getLogger('StartupTimer')
+        logging.basicConfig(level=logging.WARN)
+
+    @contextmanager
+    def step(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.steps.append((name, time.perf_counter() - start, threading.current_thread().name))
+
+    def mark(self, name):
+        """Records the time since the previous mark as one step of the main startup sequence."""
+        now = time.perf_counter()
+        with self.lock:
+            self.steps.append((name, now - self.last_mark, threading.current_thread().name))
+            self.last_mark = now
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def report(self):
+        with self.lock:
+            steps = list(self.steps)
+        return {
+            "elapsedSeconds": self.elapsed(),
+            "steps": [{"step": name, "seconds": seconds, "thread": thread} for name, seconds, thread in steps]
+        }
+
+    def log(self, message):
+        with self.lock:
+            steps = ", ".join(f"{name} {seconds * 1e3:.1f} ms" for name, seconds, _ in self.steps)
+        self.logger.info(f"{message} after {self.elapsed() * 1e3:.1f} ms ({steps})")
+
+
+def _time_in_fresh_interpreter(code):
+    """Runs code in a new interpreter so module and schema caches start cold; code prints seconds."""
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIRECTORY, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def benchmark(iterations=1000):
+    from submodules import schema_cache
+
+    results = {}
+    results["importFleetManagerModule"] = _time_in_fresh_interpreter(
+        "import time; t = time.perf_counter(); import test_manager; print(time.perf_counter() - t)"
+    )
+    for module in ("psycopg2", "jsonschema", "paho.mqtt.client", "yaml", "numpy"):
+        results[f"import:{module}"] = _time_in_fresh_interpreter(
+            f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+        )
+
+    start = time.perf_counter()
+    import yaml
+    with open(os.path.join(ROOT_DIRECTORY, 'config', 'config.yaml'), 'r') as config_file:
+        config = yaml.safe_load(config_file)
+    results["loadConfig"] = time.perf_counter() - start
+
+    # Eager loading as before: parse and check every schema at construction.
+    schema_cache.clear()
+    start = time.perf_counter()
+    for name in SCHEMA_NAMES:
+        schema_cache._build_validator(name, use_disk_cache=False)
+    results["schemasEager"] = time.perf_counter() - start
+
+    schema_cache.clear()
+    for name in SCHEMA_NAMES:
+        schema_cache._build_validator(name)
+    start = time.perf_counter()
+    for name in SCHEMA_NAMES:
+        schema_cache._build_validator(name)
+    results["schemasFromDiskCache"] = time.perf_counter() - start
+
+    # Lazy loading as FleetManager does it: startup only pays for handing the schemas to the preload thread.
+    schema_cache.clear()
+    start = time.perf_counter()
+    thread = schema_cache.preload(SCHEMA_NAMES)
+    results["schemasLazy"] = time.perf_counter() - start
+    thread.join()
+    results["schemasLazyBackground"] = time.perf_counter() - start
+
+    import jsonschema
+    state = {
+        "headerId": 1, "timestamp": "2024-01-01T00:00:00Z", "version": "2.0.0", "manufacturer": "robots",
+        "serialNumber": "001", "orderId": "", "orderUpdateId": 0, "lastNodeId": "", "lastNodeSequenceId": 0,
+        "driving": False, "operatingMode": "AUTOMATIC", "nodeStates": [], "edgeStates": [], "actionStates": [],
+        "batteryState": {"batteryCharge": 80.0, "charging": False}, "errors": [],
+        "safetyState": {"eStop": "NONE", "fieldViolation": False}
+    }
+    with open(os.path.join(schema_cache.SCHEMA_DIRECTORY, 'state.schema'), 'r', encoding='utf-8') as schema_file:
+        state_schema = json.load(schema_file)
+    count = max(1, iterations // 20)
+    start = time.perf_counter()
+    for _ in range(count):
+        try:
+            jsonschema.validate(instance=state, schema=state_schema)
+        except jsonschema.exceptions.ValidationError:
+            pass
+    results["stateValidateUncachedMilliseconds"] = (time.perf_counter() - start) / count * 1e3
+    start = time.perf_counter()
+    for _ in range(iterations):
+        try:
+            schema_cache.validate("state", state)
+        except schema_cache.SchemaValidationError:
+            pass
+    results["stateValidateCachedMilliseconds"] = (time.perf_counter() - start) / iterations * 1e3
+
+    start = time.perf_counter()
+    try:
+        import psycopg2
+        from submodules.migrations import apply_migrations
+        postgres_config = config['postgres']
+        conn = psycopg2.connect(host=postgres_config['host'], port=postgres_config['port'],
+                                database=postgres_config['database'], user=postgres_config['user'],
+                                password=postgres_config['password'], connect_timeout=2)
+        apply_migrations(conn)
+        conn.close()
+        results["databaseBootstrap"] = time.perf_counter() - start
+    except Exception as e:
+        results["databaseBootstrap"] = f"unavailable: {e.__class__.__name__}"
+
+    start = time.perf_counter()
+    try:
+        import socket
+        mqtt_config = config['mqtt']
+        socket.create_connection((mqtt_config['broker_address'], mqtt_config['broker_port']), timeout=2).close()
+        results["mqttConnect"] = time.perf_counter() - start
+    except OSError as e:
+        results["mqttConnect"] = f"unavailable: {e.__class__.__name__}"
+
+    for name, value in results.items():
+        print(f"{name}: {value * 1e3:.2f} ms" if isinstance(value, float) and not name.endswith("Milliseconds")
+              else f"{name}: {value}")
+    return results
+
+
+if __name__ == '__main__':
+    benchmark()
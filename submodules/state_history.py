@@ -0,0 +1,255 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+FIELDS = ("timestamp", "x", "y", "theta", "velocity", "battery")
+TIMESTAMP, X, Y, THETA, VELOCITY, BATTERY = range(len(FIELDS))
+
+
+class _RobotBuffer:
+    """Fixed-size ring of samples, one contiguous row per field so window lookups are binary searches."""
+
+    __slots__ = ("data", "head", "count", "last")
+
+    def __init__(self, capacity):
+        self.data = np.full((len(FIELDS), capacity), np.nan)
+        self.head = 0
+        self.count = 0
+        # Values a message does not carry (a visualization has no battery) are carried forward.
+        self.last = np.full(len(FIELDS), np.nan)
+
+    def append(self, row):
+        capacity = self.data.shape[1]
+        self.data[:, self.head] = row
+        self.head = (self.head + 1) % capacity
+        self.count = min(self.count + 1, capacity)
+
+    def segments(self):
+        """Physical (start, stop) ranges in chronological order; at most two."""
+        capacity = self.data.shape[1]
+        if self.count < capacity:
+            return [(0, self.count)]
+        return [(self.head, capacity), (0, self.head)] if self.head else [(0, capacity)]
+
+    def window(self, start, end):
+        parts = []
+        for first, stop in self.segments():
+            times = self.data[TIMESTAMP, first:stop]
+            lo = first + np.searchsorted(times, start, side="left")
+            hi = first + np.searchsorted(times, end, side="right")
+            if hi > lo:
+                parts.append(self.data[:, lo:hi])
+        if not parts:
+            return np.empty((len(FIELDS), 0))
+        return parts[0].copy() if len(parts) == 1 else np.concatenate(parts, axis=1)
+
+
+class StateHistory:
+    """Recent per-AGV history of position, speed and battery, filled from state and visualization messages.
+
+    Each robot gets a ring of `capacity` samples, so memory is capacity * 48 bytes per robot and at
+    most max_robots robots are kept (least recently updated evicted first). Samples closer together
+    than min_interval are skipped, which stretches how far back the ring reaches.
+    """
+
+    def __init__(self, capacity=1024, max_robots=10000, min_interval=0.0):
+        self.capacity = capacity
+        self.max_robots = max_robots
+        self.min_interval = min_interval
+        self.buffers = OrderedDict()
+        self.samples = 0
+        self.skipped = 0
+        self.evicted = 0
+        self.lock = threading.Lock()
+
+        self.logger = logging.getLogger('StateHistory')
+        logging.basicConfig(level=logging.WARN)
+
+    def _record(self, robot_id, position, velocity, battery, now):
+        with self.lock:
+            buffer = self.buffers.get(robot_id)
+            if buffer is None:
+                buffer = _RobotBuffer(self.capacity)
+                self.buffers[robot_id] = buffer
+                if len(self.buffers) > self.max_robots:
+                    self.buffers.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self.buffers.move_to_end(robot_id)
+            last = buffer.last
+            if buffer.count and now - last[TIMESTAMP] < self.min_interval:
+                self.skipped += 1
+                return
+            if now < last[TIMESTAMP]:
+                # Out-of-order arrival; keeping the ring sorted matters more than the sample.
+                self.skipped += 1
+                return
+            last[TIMESTAMP] = now
+            if position:
+                last[X] = position.get("x", last[X])
+                last[Y] = position.get("y", last[Y])
+                last[THETA] = position.get("theta", last[THETA])
+            if velocity:
+                last[VELOCITY] = np.hypot(velocity.get("vx") or 0.0, velocity.get("vy") or 0.0)
+            if battery is not None:
+                last[BATTERY] = battery
+            buffer.append(last)
+            self.samples += 1
+
+    def record_state(self, state_message, now=None):
+        battery_state = state_message.get("batteryState") or {}
+        self._record(state_message.get("serialNumber", ""), state_message.get("agvPosition"),
+                     state_message.get("velocity"), battery_state.get("batteryCharge"),
+                     time.time() if now is None else now)
+
+    def record_visualization(self, visualization_message, now=None):
+        self._record(visualization_message.get("serialNumber", ""), visualization_message.get("agvPosition"),
+                     visualization_message.get("velocity"), None, time.time() if now is None else now)
+
+    def remove_robot(self, robot_id):
+        with self.lock:
+            self.buffers.pop(robot_id, None)
+
+    def _window(self, robot_id, seconds, now):
+        now = time.time() if now is None else now
+        with self.lock:
+            buffer = self.buffers.get(robot_id)
+            if buffer is None:
+                return None
+            return buffer.window(now - seconds, now)
+
+    def window(self, robot_id, seconds, now=None):
+        """Samples of the last `seconds` as a dict of arrays keyed by FIELDS, or None for an unknown robot."""
+        data = self._window(robot_id, seconds, now)
+        if data is None:
+            return None
+        return {field: data[index] for index, field in enumerate(FIELDS)}
+
+    def battery_rate(self, robot_id, seconds, now=None, min_samples=3):
+        """Least-squares battery slope over the window, in percent per second (negative while draining)."""
+        data = self._window(robot_id, seconds, now)
+        if data is None:
+            return None
+        valid = ~np.isnan(data[BATTERY])
+        times, charge = data[TIMESTAMP, valid], data[BATTERY, valid]
+        if len(times) < min_samples:
+            return None
+        times = times - times.mean()
+        spread = np.dot(times, times)
+        if spread <= 0.0:
+            return None
+        return float(np.dot(times, charge - charge.mean()) / spread)
+
+    def distance_travelled(self, robot_id, seconds, now=None):
+        """Path length over the window, summed over consecutive positions."""
+        data = self._window(robot_id, seconds, now)
+        if data is None or data.shape[1] < 2:
+            return None if data is None else 0.0
+        steps = np.hypot(np.diff(data[X]), np.diff(data[Y]))
+        return float(np.nansum(steps))
+
+    def average_speed(self, robot_id, seconds, now=None):
+        """Path length over elapsed time in the window; reported velocities are not needed."""
+        data = self._window(robot_id, seconds, now)
+        if data is None or data.shape[1] < 2:
+            return None
+        elapsed = data[TIMESTAMP, -1] - data[TIMESTAMP, 0]
+        if elapsed <= 0.0:
+            return None
+        return float(np.nansum(np.hypot(np.diff(data[X]), np.diff(data[Y]))) / elapsed)
+
+    def displacement(self, robot_id, seconds, now=None):
+        """Straight-line distance between the first and the last position in the window."""
+        data = self._window(robot_id, seconds, now)
+        if data is None or data.shape[1] == 0:
+            return None
+        return float(np.hypot(data[X, -1] - data[X, 0], data[Y, -1] - data[Y, 0]))
+
+    def coverage(self, robot_id, now=None):
+        """Seconds of history held for a robot, i.e. how far back a window can reach."""
+        with self.lock:
+            buffer = self.buffers.get(robot_id)
+            if buffer is None or buffer.count == 0:
+                return 0.0
+            oldest = buffer.data[TIMESTAMP, buffer.segments()[0][0]]
+        return (time.time() if now is None else now) - float(oldest)
+
+    def get_stats(self):
+        with self.lock:
+            robots = len(self.buffers)
+        return {
+            "robots": robots,
+            "capacity": self.capacity,
+            "bytesPerRobot": self.capacity * len(FIELDS) * 8,
+            "bytes": robots * self.capacity * len(FIELDS) * 8,
+            "samples": self.samples,
+            "skipped": self.skipped,
+            "evicted": self.evicted
+        }
+
+
+def benchmark(robot_count=1000, seconds=600, state_interval=1.0, queries=2000):
+    """Ten minutes of 1 Hz state for 1000 robots, then recent-window queries against a Python list scan."""
+    import random
+
+    rng = random.Random(47)
+    history = StateHistory(capacity=1024)
+    samples = int(seconds / state_interval)
+    start_time = 1_700_000_000.0
+    messages = []
+    for step in range(samples):
+        for robot in range(robot_count):
+            messages.append((start_time + step * state_interval, {
+                "serialNumber": f"agv_{robot:04d}",
+                "agvPosition": {"x": step * 0.5, "y": float(robot), "theta": 0.0},
+                "velocity": {"vx": 0.5, "vy": 0.0, "omega": 0.0},
+                "batteryState": {"batteryCharge": 100.0 - step * 0.01 * (1 + robot % 3)}
+            }))
+    started = time.perf_counter()
+    for now, message in messages:
+        history.record_state(message, now)
+    record_seconds = time.perf_counter() - started
+
+    # The same questions answered from a plain list of dicts per robot, as a reference.
+    plain = {}
+    for now, message in messages:
+        plain.setdefault(message["serialNumber"], []).append((now, message))
+    end = start_time + (samples - 1) * state_interval
+
+    robots = [f"agv_{rng.randrange(robot_count):04d}" for _ in range(queries)]
+    started = time.perf_counter()
+    rates = [history.battery_rate(robot, 600.0, end) for robot in robots]
+    ring_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    reference = []
+    for robot in robots:
+        points = [(t, m["batteryState"]["batteryCharge"]) for t, m in plain[robot] if t >= end - 600.0]
+        mean_t = sum(t for t, _ in points) / len(points)
+        mean_c = sum(c for _, c in points) / len(points)
+        reference.append(sum((t - mean_t) * (c - mean_c) for t, c in points)
+                         / sum((t - mean_t) ** 2 for t, _ in points))
+    list_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for robot in robots:
+        history.distance_travelled(robot, 30.0, end)
+    distance_seconds = time.perf_counter() - started
+
+    result = {
+        "recordMicroseconds": record_seconds / len(messages) * 1e6,
+        "batteryRateMicroseconds": ring_seconds / queries * 1e6,
+        "listScanMicroseconds": list_seconds / queries * 1e6,
+        "distance30sMicroseconds": distance_seconds / queries * 1e6,
+        "maxRateError": max(abs(a - b) for a, b in zip(rates, reference)),
+        **history.get_stats()
+    }
+    print(f"State history benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
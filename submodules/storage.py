@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import logging
+import sqlite3
+import datetime
+import threading
+
+logger = logging.getLogger('Storage')
+
+POSTGRES = "postgres"
+SQLITE = "sqlite"
+
+_translated = {}
+
+
+def dialect_of(db_conn):
+    return getattr(db_conn, "dialect", POSTGRES)
+
+
+def translate_placeholders(sql):
+    """psycopg2-style %s placeholders to sqlite3's qmark style; cached per statement."""
+    translated = _translated.get(sql)
+    if translated is None:
+        translated = sql.replace("%s", "?")
+        _translated[sql] = translated
+    return translated
+
+
+def _adapt(value):
+    if isinstance(value, (dict, list, tuple)):
+        # JSONB and TEXT[] columns are stored as JSON text.
+        return json.dumps(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    return value
+
+
+class SQLiteCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.cursor = connection.raw.cursor()
+        self.itersize = 2000
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    def execute(self, sql, params=()):
+        with self.connection.lock:
+            self.cursor.execute(translate_placeholders(sql), tuple(_adapt(value) for value in params or ()))
+        return self
+
+    def executemany(self, sql, rows):
+        with self.connection.lock:
+            self.cursor.executemany(
+                translate_placeholders(sql), [tuple(_adapt(value) for value in row) for row in rows]
+            )
+        return self
+
+    def fetchone(self):
+        with self.connection.lock:
+            return self.cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        with self.connection.lock:
+            return self.cursor.fetchmany(size or self.itersize)
+
+    def fetchall(self):
+        with self.connection.lock:
+            return self.cursor.fetchall()
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany()
+            if not rows:
+                return
+            yield from rows
+
+    def close(self):
+        self.cursor.close()
+
+
+class SQLiteConnection:
+    """Embedded backend with the subset of the psycopg2 connection API the handlers use."""
+
+    dialect = SQLITE
+
+    def __init__(self, path, synchronous="NORMAL", busy_timeout=5000):
+        self.path = path
+        self.raw = sqlite3.connect(path, check_same_thread=False)
+        # sqlite3 objects are not safe to share between the MQTT, buffer and bootstrap threads.
+        self.lock = threading.RLock()
+        with self.lock:
+            self.raw.execute("PRAGMA journal_mode=WAL")
+            self.raw.execute(f"PRAGMA synchronous={synchronous}")
+            self.raw.execute(f"PRAGMA busy_timeout={int(busy_timeout)}")
+        self.closed = 0
+
+    @property
+    def autocommit(self):
+        return self.raw.isolation_level is None
+
+    @autocommit.setter
+    def autocommit(self, value):
+        with self.lock:
+            self.raw.isolation_level = None if value else ""
+
+    def cursor(self, name=None):
+        # Named (server-side) cursors have no equivalent; SQLite cursors already stream rows.
+        return SQLiteCursor(self)
+
+    def commit(self):
+        with self.lock:
+            self.raw.commit()
+
+    def rollback(self):
+        with self.lock:
+            self.raw.rollback()
+
+    def close(self):
+        with self.lock:
+            self.raw.close()
+        self.closed = 1
+
+
+def connect(storage_config, postgres_config, read_only=False):
+    """Opens the configured backend and brings its schema up to date; returns None when unreachable.
+
+    read_only connections are for queries beside the ingest connection; they leave the schema to it.
+    """
+    from submodules.migrations import apply_migrations
+
+    backend = storage_config.get('backend', POSTGRES)
+    try:
+        if backend == SQLITE:
+            conn = SQLiteConnection(storage_config.get('sqlite_path', 'fleet.db'),
+                                    storage_config.get('sqlite_synchronous', 'NORMAL'))
+        elif backend == POSTGRES:
+            # Imported here so the driver is not on the startup path of embedded deployments.
+            import psycopg2
+            conn = psycopg2.connect(
+                host=postgres_config['host'],
+                port=postgres_config['port'],
+                database=postgres_config['database'],
+                user=postgres_config['user'],
+                password=postgres_config['password']
+            )
+        else:
+            raise ValueError(f"Unknown storage backend: {backend}")
+        if read_only:
+            if backend == SQLITE:
+                with conn.lock:
+                    conn.raw.execute("PRAGMA query_only = ON")
+            else:
+                conn.set_session(readonly=True)
+        else:
+            apply_migrations(conn)
+        logger.info(f"Connected to {backend} storage{' (read-only)' if read_only else ''}.")
+        return conn
+    except Exception as e:
+        logger.error(f"Failed to connect to {backend} storage: {e}")
+        return None
+
+
+def benchmark(robots=50, seconds_of_traffic=60, state_hz=1.0, batch_sizes=(1, 50, 500)):
+    """State ingest through DatabaseWriter on the embedded backend, per-row vs batched commits."""
+    import tempfile
+    from submodules.database_writer import DatabaseWriter
+    from submodules.migrations import apply_migrations
+    from submodules.state import STATE_COLUMNS
+
+    rows = []
+    for second in range(int(seconds_of_traffic * state_hz)):
+        for robot in range(robots):
+            rows.append((
+                second, datetime.datetime.now(), "2.0.0", "robots", f"agv_{robot:03d}", "order_001", 0, "zone_set_001",
+                "node_1", 0, True, False, False, 0.5, "AUTOMATIC", "[]", "[]",
+                json.dumps({"x": 1.0, "y": 2.0, "theta": 0.0, "mapId": "map_1", "positionInitialized": True}),
+                json.dumps({"vx": 1.0, "vy": 0.0, "omega": 0.0}), "[]", "[]",
+                json.dumps({"batteryCharge": 80.0, "charging": False}), "[]", "[]",
+                json.dumps({"eStop": "NONE", "fieldViolation": False})
+            ))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for batch_size in batch_sizes:
+            conn = SQLiteConnection(os.path.join(directory, f"bench_{batch_size}.db"))
+            apply_migrations(conn)
+            writer = DatabaseWriter(conn, batch_size=batch_size, batch_interval=3600)
+            start = time.perf_counter()
+            for row in rows:
+                writer.insert("state", STATE_COLUMNS, row)
+            writer.flush()
+            elapsed = time.perf_counter() - start
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM state")
+            assert cursor.fetchone()[0] == len(rows)
+            conn.close()
+            results[batch_size] = len(rows) / elapsed
+            print(f"SQLite state ingest, batch size {batch_size}: {len(rows) / elapsed:.0f} rows/s "
+                  f"({robots} robots at {state_hz} Hz need {robots * state_hz:.0f} rows/s)")
+    return results
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,219 @@
+import math
+import time
+import logging
+import numpy as np
+
+
+def basis_matrix(degree, knots, u):
+    """Cox-de Boor B-spline basis evaluated for all parameters at once, shape (len(u), n_ctrl)."""
+    knots = np.asarray(knots, dtype=float)
+    u = np.asarray(u, dtype=float)
+    n_ctrl = len(knots) - degree - 1
+
+    left, right = knots[:-1], knots[1:]
+    basis = ((u[:, None] >= left) & (u[:, None] < right)).astype(float)
+    # The curve end belongs to the last non-empty span instead of falling outside every span.
+    last_span = np.nonzero(right > left)[0][-1]
+    basis[u >= knots[-1], :] = 0.0
+    basis[u >= knots[-1], last_span] = 1.0
+
+    for p in range(1, degree + 1):
+        count = len(knots) - p - 1
+        k_i, k_ip = knots[:count], knots[p:p + count]
+        k_i1, k_ip1 = knots[1:count + 1], knots[p + 1:p + 1 + count]
+        denominator_left = k_ip - k_i
+        denominator_right = k_ip1 - k_i1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            term_left = np.where(denominator_left > 0, (u[:, None] - k_i) / denominator_left, 0.0)
+            term_right = np.where(denominator_right > 0, (k_ip1 - u[:, None]) / denominator_right, 0.0)
+        basis = term_left * basis[:, :count] + term_right * basis[:, 1:count + 1]
+    return basis[:, :n_ctrl]
+
+
+def validate_trajectory(trajectory):
+    degree = trajectory["degree"]
+    knots = trajectory["knotVector"]
+    control_points = trajectory["controlPoints"]
+    if degree < 1 or len(control_points) < degree + 1:
+        raise ValueError(f"NURBS of degree {degree} needs at least {degree + 1} control points")
+    if len(knots) != len(control_points) + degree + 1:
+        raise ValueError(
+            f"knotVector has {len(knots)} entries, expected {len(control_points) + degree + 1}"
+        )
+    if any(b < a for a, b in zip(knots, knots[1:])):
+        raise ValueError("knotVector must be non-decreasing")
+
+
+class TrajectoryAnalyzer:
+    def __init__(self, samples=64, max_lateral_acceleration=0.5, default_max_speed=1.5, min_speed=0.1):
+        self.samples = samples
+        self.max_lateral_acceleration = max_lateral_acceleration
+        self.default_max_speed = default_max_speed
+        self.min_speed = min_speed
+        self.cache = {}
+        self._basis_cache = {}
+
+        self.logger = logging.getLogger('TrajectoryAnalyzer')
+        logging.basicConfig(level=logging.WARN)
+
+    @staticmethod
+    def _fingerprint(trajectory):
+        return (
+            trajectory["degree"],
+            tuple(trajectory["knotVector"]),
+            tuple((p["x"], p["y"], p.get("weight", 1.0)) for p in trajectory["controlPoints"])
+        )
+
+    def _basis(self, degree, knots):
+        key = (degree, knots)
+        cached = self._basis_cache.get(key)
+        if cached is None:
+            u = np.linspace(knots[degree], knots[-degree - 1], self.samples)
+            cached = (u, basis_matrix(degree, knots, u))
+            self._basis_cache[key] = cached
+        return cached
+
+    def evaluate(self, trajectory, u=None):
+        """Points on one NURBS curve, shape (len(u), 2)."""
+        validate_trajectory(trajectory)
+        degree, knots, control = self._fingerprint(trajectory)
+        if u is None:
+            _, basis = self._basis(degree, knots)
+        else:
+            basis = basis_matrix(degree, knots, u)
+        control = np.asarray(control, dtype=float)
+        weighted = basis * control[:, 2]
+        return (weighted @ control[:, :2]) / weighted.sum(axis=1, keepdims=True)
+
+    def _analyze_group(self, degree, knots, controls):
+        """Samples every curve sharing one knot vector with a single matrix product."""
+        u, basis = self._basis(degree, knots)
+        weights = controls[:, :, 2]
+        weighted_basis = basis[None, :, :] * weights[:, None, :]
+        points = np.einsum("gsn,gnd->gsd", weighted_basis, controls[:, :, :2])
+        points /= weighted_basis.sum(axis=2)[:, :, None]
+
+        segments = np.diff(points, axis=1)
+        lengths = np.linalg.norm(segments, axis=2).sum(axis=1)
+        minimums = points.min(axis=1)
+        maximums = points.max(axis=1)
+
+        first = np.gradient(points, u, axis=1)
+        second = np.gradient(first, u, axis=1)
+        cross = first[:, :, 0] * second[:, :, 1] - first[:, :, 1] * second[:, :, 0]
+        speed_sq = (first ** 2).sum(axis=2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            curvature = np.where(speed_sq > 1e-12, np.abs(cross) / speed_sq ** 1.5, 0.0)
+            speed_profile = np.where(
+                curvature > 1e-9,
+                np.sqrt(self.max_lateral_acceleration / curvature),
+                self.default_max_speed
+            )
+        speed_profile = np.clip(speed_profile, self.min_speed, self.default_max_speed)
+
+        results = []
+        for g in range(len(controls)):
+            results.append({
+                "length": float(lengths[g]),
+                "boundingBox": {
+                    "xMin": float(minimums[g, 0]), "yMin": float(minimums[g, 1]),
+                    "xMax": float(maximums[g, 0]), "yMax": float(maximums[g, 1])
+                },
+                "maxCurvature": float(curvature[g].max()),
+                "maxSpeed": float(speed_profile[g].min()),
+                "speedProfile": speed_profile[g]
+            })
+        return results
+
+    def analyze_edges(self, edges):
+        """Analyzes many {'edgeId', 'trajectory'} dicts, batching curves that share a knot vector."""
+        results = {}
+        groups = {}
+        for edge in edges:
+            edge_id = edge["edgeId"]
+            trajectory = edge.get("trajectory")
+            if not trajectory:
+                continue
+            try:
+                validate_trajectory(trajectory)
+            except (KeyError, ValueError) as e:
+                self.logger.error(f"Invalid trajectory on edge {edge_id}: {e}")
+                continue
+            fingerprint = self._fingerprint(trajectory)
+            cached = self.cache.get(edge_id)
+            if cached is not None and cached[0] == fingerprint:
+                results[edge_id] = cached[1]
+                continue
+            degree, knots, control = fingerprint
+            groups.setdefault((degree, knots, len(control)), []).append((edge_id, fingerprint))
+
+        for (degree, knots, _), members in groups.items():
+            controls = np.array([fingerprint[2] for _, fingerprint in members], dtype=float)
+            for (edge_id, fingerprint), result in zip(members, self._analyze_group(degree, knots, controls)):
+                self.cache[edge_id] = (fingerprint, result)
+                results[edge_id] = result
+        return results
+
+    def analyze_edge(self, edge_id, trajectory):
+        return self.analyze_edges([{"edgeId": edge_id, "trajectory": trajectory}]).get(edge_id)
+
+    def fill_edge(self, edge, start_position=None, end_position=None):
+        """Fills a missing length/maxSpeed from the trajectory, or the straight line between the nodes."""
+        if "length" in edge and "maxSpeed" in edge:
+            return edge
+        result = None
+        if edge.get("trajectory"):
+            result = self.analyze_edge(edge["edgeId"], edge["trajectory"])
+        if result is not None:
+            edge.setdefault("length", result["length"])
+            edge.setdefault("maxSpeed", result["maxSpeed"])
+        elif start_position and end_position:
+            edge.setdefault("length", math.hypot(
+                end_position["x"] - start_position["x"], end_position["y"] - start_position["y"]
+            ))
+            edge.setdefault("maxSpeed", self.default_max_speed)
+        return edge
+
+    def clear_cache(self):
+        self.cache.clear()
+
+
+def _random_trajectory(rng, degree=3, control_count=7):
+    inner = np.sort(rng.uniform(0.0, 1.0, control_count - degree - 1)).tolist()
+    points = np.cumsum(rng.uniform(0.0, 2.0, (control_count, 2)), axis=0)
+    return {
+        "degree": degree,
+        "knotVector": [0.0] * (degree + 1) + inner + [1.0] * (degree + 1),
+        "controlPoints": [{"x": float(x), "y": float(y), "weight": 1.0} for x, y in points]
+    }
+
+
+def benchmark(edge_count=5000, distinct_knot_vectors=10):
+    rng = np.random.default_rng(5050)
+    knot_templates = [_random_trajectory(rng)["knotVector"] for _ in range(distinct_knot_vectors)]
+    edges = []
+    for i in range(edge_count):
+        trajectory = _random_trajectory(rng)
+        trajectory["knotVector"] = knot_templates[i % distinct_knot_vectors]
+        edges.append({"edgeId": f"edge_{i}", "trajectory": trajectory})
+
+    analyzer = TrajectoryAnalyzer()
+    start = time.perf_counter()
+    analyzer.analyze_edges(edges)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    analyzer.analyze_edges(edges)
+    warm = time.perf_counter() - start
+
+    result = {
+        "edges": edge_count,
+        "coldMilliseconds": cold * 1e3,
+        "cachedMilliseconds": warm * 1e3,
+        "coldEdgesPerSecond": edge_count / cold
+    }
+    print(f"Trajectory benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
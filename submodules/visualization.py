@@ -1,7 +1,5 @@
-import json
 import logging
-import os
-from jsonschema import validate, ValidationError
+from submodules.schema_cache import validate, SchemaValidationError
 
 class VisualizationSubscriber:
     def __init__(self, fleetname, version, versions, manufacturer):
@@ -13,19 +11,20 @@ class VisualizationSubscriber:
         self.logger = logging.getLogger('VisualizationSubscriber')
         logging.basicConfig(level=logging.WARN)
 
-        schema_path = os.path.join(os.path.dirname(__file__), 'schemas', 'visualization.schema')
-        with open(schema_path, 'r') as schema_file:
-            self.visualization_schema = json.load(schema_file)
-
-    def subscribe_to_topics(self, mqtt_client):
-        topic = f"{self.fleetname}/{self.versions}/{self.manufacturer}/+/visualization"
+    def subscribe_to_topics(self, mqtt_client, manufacturer=None):
+        topic = f"{self.fleetname}/{self.versions}/{manufacturer or self.manufacturer}/+/visualization"
         mqtt_client.subscribe(topic, qos=0)
         self.logger.info(f"Subscribed to visualization topic: {topic}")
 
+    def unsubscribe_from_topics(self, mqtt_client, manufacturer=None):
+        topic = f"{self.fleetname}/{self.versions}/{manufacturer or self.manufacturer}/+/visualization"
+        mqtt_client.unsubscribe(topic)
+        self.logger.info(f"Unsubscribed from visualization topic: {topic}")
+
     def validate_message(self, message):
         try:
-            validate(instance=message, schema=self.visualization_schema)
-        except ValidationError as e:
+            validate("visualization", message)
+        except SchemaValidationError as e:
             self.logger.error(f"Schema validation failed: {e.message}")
             raise
 
@@ -0,0 +1,297 @@
+import math
+import time
+import logging
+
+BLOCKED = "BLOCKED"
+SPEED_LIMIT = "SPEED_LIMIT"
+ONE_WAY = "ONE_WAY"
+
+
+class Zone:
+    def __init__(self, zone_id, zone_type, polygon, max_speed=None, direction=None, direction_tolerance=0.5):
+        self.zone_id = zone_id
+        self.zone_type = zone_type
+        self.polygon = [(float(x), float(y)) for x, y in polygon]
+        self.max_speed = max_speed
+        self.direction = direction
+        self.direction_tolerance = direction_tolerance
+        xs = [x for x, _ in self.polygon]
+        ys = [y for _, y in self.polygon]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+        self.edges = list(zip(self.polygon, self.polygon[1:] + self.polygon[:1]))
+
+    def contains(self, x, y):
+        x_min, y_min, x_max, y_max = self.bbox
+        if x < x_min or x > x_max or y < y_min or y > y_max:
+            return False
+        inside = False
+        for (x1, y1), (x2, y2) in self.edges:
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        return inside
+
+    def intersects_segment(self, ax, ay, bx, by):
+        x_min, y_min, x_max, y_max = self.bbox
+        if max(ax, bx) < x_min or min(ax, bx) > x_max or max(ay, by) < y_min or min(ay, by) > y_max:
+            return False
+        if self.contains(ax, ay) or self.contains(bx, by):
+            return True
+        for (x1, y1), (x2, y2) in self.edges:
+            if _segments_cross(ax, ay, bx, by, x1, y1, x2, y2):
+                return True
+        return False
+
+    def allows_heading(self, heading):
+        if self.direction is None:
+            return True
+        difference = (heading - self.direction + math.pi) % (2 * math.pi) - math.pi
+        return abs(difference) <= self.direction_tolerance
+
+
+def _orientation(ax, ay, bx, by, cx, cy):
+    value = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+    return (value > 0) - (value < 0)
+
+
+def _segments_cross(ax, ay, bx, by, cx, cy, dx, dy):
+    o1 = _orientation(ax, ay, bx, by, cx, cy)
+    o2 = _orientation(ax, ay, bx, by, dx, dy)
+    o3 = _orientation(cx, cy, dx, dy, ax, ay)
+    o4 = _orientation(cx, cy, dx, dy, bx, by)
+    return o1 != o2 and o3 != o4
+
+
+class ZoneSet:
+    """Zones of one map bucketed into a uniform grid; a point query touches one cell."""
+
+    def __init__(self, zone_set_id, map_id, zones, cell_size=5.0):
+        self.zone_set_id = zone_set_id
+        self.map_id = map_id
+        self.zones = zones
+        self.cell_size = cell_size
+        self.grid = {}
+        for zone in zones:
+            x_min, y_min, x_max, y_max = zone.bbox
+            for cx in range(self._cell(x_min), self._cell(x_max) + 1):
+                for cy in range(self._cell(y_min), self._cell(y_max) + 1):
+                    self.grid.setdefault((cx, cy), []).append(zone)
+
+    def _cell(self, value):
+        return int(math.floor(value / self.cell_size))
+
+    def zones_at(self, x, y):
+        candidates = self.grid.get((self._cell(x), self._cell(y)))
+        if not candidates:
+            return []
+        return [zone for zone in candidates if zone.contains(x, y)]
+
+    def _cells_on_segment(self, ax, ay, bx, by):
+        """Grid cells crossed by a segment (Amanatides-Woo traversal), instead of its whole bounding box."""
+        cx, cy = self._cell(ax), self._cell(ay)
+        end_x, end_y = self._cell(bx), self._cell(by)
+        dx, dy = bx - ax, by - ay
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        if dx:
+            next_x = (cx + (step_x > 0)) * self.cell_size
+            t_max_x, t_delta_x = (next_x - ax) / dx, self.cell_size / abs(dx)
+        else:
+            t_max_x, t_delta_x = math.inf, math.inf
+        if dy:
+            next_y = (cy + (step_y > 0)) * self.cell_size
+            t_max_y, t_delta_y = (next_y - ay) / dy, self.cell_size / abs(dy)
+        else:
+            t_max_y, t_delta_y = math.inf, math.inf
+
+        cells = [(cx, cy)]
+        for _ in range(abs(end_x - cx) + abs(end_y - cy)):
+            if t_max_x < t_max_y:
+                cx += step_x
+                t_max_x += t_delta_x
+            else:
+                cy += step_y
+                t_max_y += t_delta_y
+            cells.append((cx, cy))
+        return cells
+
+    def zones_on_segment(self, ax, ay, bx, by):
+        candidates = {}
+        for cell in self._cells_on_segment(ax, ay, bx, by):
+            for zone in self.grid.get(cell, ()):
+                candidates[zone.zone_id] = zone
+        return [zone for zone in candidates.values() if zone.intersects_segment(ax, ay, bx, by)]
+
+    def zones_on_polyline(self, points):
+        found = {}
+        for (ax, ay), (bx, by) in zip(points, points[1:]):
+            for zone in self.zones_on_segment(ax, ay, bx, by):
+                found[zone.zone_id] = zone
+        return list(found.values())
+
+
+class ZoneManager:
+    def __init__(self, zone_sets=None, cell_size=5.0, trajectory_analyzer=None):
+        self.cell_size = cell_size
+        self.trajectory_analyzer = trajectory_analyzer
+        self.zone_sets = {}
+        self.active = {}
+        # Bumped on every change so callers can cache validation results.
+        self.revision = 0
+
+        self.logger = logging.getLogger('ZoneManager')
+        logging.basicConfig(level=logging.WARN)
+
+        for zone_set in zone_sets or []:
+            self.add_zone_set(zone_set)
+
+    def add_zone_set(self, definition):
+        zones = [
+            Zone(
+                zone["zone_id"], zone["type"], zone["polygon"],
+                max_speed=zone.get("max_speed"),
+                direction=zone.get("direction"),
+                direction_tolerance=zone.get("direction_tolerance", 0.5)
+            )
+            for zone in definition.get("zones", [])
+        ]
+        zone_set = ZoneSet(definition["zone_set_id"], definition["map_id"], zones, self.cell_size)
+        self.zone_sets[zone_set.zone_set_id] = zone_set
+        if definition.get("active", True) or zone_set.map_id not in self.active:
+            self.active[zone_set.map_id] = zone_set.zone_set_id
+        self.revision += 1
+
+    def activate(self, map_id, zone_set_id):
+        if self.zone_sets[zone_set_id].map_id != map_id:
+            raise ValueError(f"Zone set {zone_set_id} does not belong to map {map_id}")
+        self.active[map_id] = zone_set_id
+        self.revision += 1
+
+    def expected_zone_set_id(self, map_id):
+        return self.active.get(map_id)
+
+    def matches_zone_set(self, map_id, zone_set_id):
+        """O(1) check of a robot's reported zoneSetId against the active one for its map."""
+        expected = self.active.get(map_id)
+        return expected is None or expected == zone_set_id
+
+    def zones_at(self, map_id, x, y):
+        zone_set_id = self.active.get(map_id)
+        if zone_set_id is None:
+            return []
+        return self.zone_sets[zone_set_id].zones_at(x, y)
+
+    def _edge_points(self, edge, start, end):
+        trajectory = edge.get("trajectory")
+        if trajectory and self.trajectory_analyzer is not None:
+            try:
+                return [tuple(point) for point in self.trajectory_analyzer.evaluate(trajectory)]
+            except (KeyError, ValueError) as e:
+                self.logger.error(f"Cannot evaluate trajectory of edge {edge.get('edgeId')}: {e}")
+        return [(start["x"], start["y"]), (end["x"], end["y"])]
+
+    def validate_order(self, order):
+        """Returns a list of violations; BLOCKED ones make the order unsafe to send."""
+        violations = []
+        positions = {}
+        for node in order.get("nodes", []):
+            position = node.get("nodePosition")
+            if not position:
+                continue
+            positions[node["nodeId"]] = position
+            for zone in self.zones_at(position.get("mapId"), position["x"], position["y"]):
+                if zone.zone_type == BLOCKED:
+                    violations.append({"type": BLOCKED, "zoneId": zone.zone_id, "nodeId": node["nodeId"]})
+
+        for edge in order.get("edges", []):
+            start = positions.get(edge.get("startNodeId"))
+            end = positions.get(edge.get("endNodeId"))
+            if start is None or end is None:
+                continue
+            zone_set_id = self.active.get(start.get("mapId"))
+            if zone_set_id is None:
+                continue
+            zones = self.zone_sets[zone_set_id].zones_on_polyline(self._edge_points(edge, start, end))
+            heading = math.atan2(end["y"] - start["y"], end["x"] - start["x"])
+            for zone in zones:
+                if zone.zone_type == BLOCKED:
+                    violations.append({"type": BLOCKED, "zoneId": zone.zone_id, "edgeId": edge["edgeId"]})
+                elif zone.zone_type == SPEED_LIMIT and zone.max_speed is not None \
+                        and edge.get("maxSpeed", math.inf) > zone.max_speed:
+                    violations.append({
+                        "type": SPEED_LIMIT, "zoneId": zone.zone_id, "edgeId": edge["edgeId"],
+                        "maxSpeed": zone.max_speed
+                    })
+                elif zone.zone_type == ONE_WAY and not zone.allows_heading(heading):
+                    violations.append({"type": ONE_WAY, "zoneId": zone.zone_id, "edgeId": edge["edgeId"]})
+        return violations
+
+    def check_state(self, state_message):
+        """Alerts for a reported position inside a blocked zone or a stale zoneSetId."""
+        alerts = []
+        position = state_message.get("agvPosition")
+        if not position:
+            return alerts
+        map_id = position.get("mapId")
+        zone_set_id = state_message.get("zoneSetId")
+        # A robot without an order has no zone set to report, so only a non-empty zoneSetId is compared.
+        if zone_set_id and state_message.get("orderId") and not self.matches_zone_set(map_id, zone_set_id):
+            alerts.append({
+                "type": "ZONE_SET_MISMATCH",
+                "serialNumber": state_message.get("serialNumber"),
+                "reported": zone_set_id,
+                "expected": self.active.get(map_id)
+            })
+        for zone in self.zones_at(map_id, position.get("x", 0.0), position.get("y", 0.0)):
+            if zone.zone_type == BLOCKED:
+                alerts.append({"type": BLOCKED, "serialNumber": state_message.get("serialNumber"), "zoneId": zone.zone_id})
+        return alerts
+
+
+def benchmark(zone_count=2000, queries=100000):
+    import random
+
+    random.seed(35)
+    zones = []
+    for i in range(zone_count):
+        x, y = random.uniform(0, 500), random.uniform(0, 500)
+        size = random.uniform(1, 6)
+        zones.append({
+            "zone_id": f"zone_{i}",
+            "type": BLOCKED if i % 3 == 0 else SPEED_LIMIT,
+            "max_speed": 0.5,
+            "polygon": [[x, y], [x + size, y], [x + size, y + size], [x, y + size]]
+        })
+    manager = ZoneManager([{"zone_set_id": "zone_set_bench", "map_id": "map_1", "zones": zones}])
+    points = [(random.uniform(0, 500), random.uniform(0, 500)) for _ in range(queries)]
+
+    start = time.perf_counter()
+    for x, y in points:
+        manager.zones_at("map_1", x, y)
+    point_elapsed = time.perf_counter() - start
+
+    order = {
+        "nodes": [
+            {"nodeId": f"n{i}", "nodePosition": {"x": x, "y": y, "mapId": "map_1"}}
+            for i, (x, y) in enumerate(points[:50])
+        ],
+        "edges": [
+            {"edgeId": f"e{i}", "startNodeId": f"n{i}", "endNodeId": f"n{i + 1}", "maxSpeed": 1.0}
+            for i in range(49)
+        ]
+    }
+    start = time.perf_counter()
+    for _ in range(100):
+        manager.validate_order(order)
+    order_elapsed = (time.perf_counter() - start) / 100
+
+    result = {
+        "zones": zone_count,
+        "pointQueryMicroseconds": point_elapsed / queries * 1e6,
+        "fiftyNodeOrderValidationMilliseconds": order_elapsed * 1e3
+    }
+    print(f"Zone benchmark: {result}")
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -1,6 +1,7 @@
 import json
-import psycopg2
 import os
+import socket
+import threading
 import paho.mqtt.client as mqtt
 import logging
 from submodules.connection import ConnectionHandler
@@ -9,21 +10,80 @@ from submodules.instant_actions import InstantActionsPublisher
 from submodules.order import OrderPublisher
 from submodules.state import StateHandler
 from submodules.visualization import VisualizationSubscriber
-from submodules.first_table import CreateDatabaseAndTables
+from submodules import storage
+from submodules.order_progress import OrderProgressTracker
+from submodules.anomaly_detection import AnomalyDetector
+from submodules.liveness import LivenessMonitor
+from submodules.database_writer import DatabaseWriter
+from submodules.write_ahead_buffer import WriteAheadBuffer
+from submodules.charging_scheduler import ChargingScheduler
+from submodules.history_query import FleetHistoryQuery
+from submodules.trajectory import TrajectoryAnalyzer
+from submodules.zones import ZoneManager
+from submodules.sharding import ShardedFleet
+from submodules.deduplication import HeaderIdFilter
+from submodules.schema_cache import SchemaValidationError, preload
+from submodules.startup import StartupTimer, SCHEMA_NAMES
+from submodules.local_broker import LocalBroker, LocalClient
+from submodules.simulator import FleetSimulator
+from submodules.deadlock import DeadlockDetector
+from submodules.maps import MapRegistry
+from submodules.publish_queue import PublishQueue
+from submodules.profiling import IngestProfiler, NULL_TRACE
+from submodules.ingest_queue import IngestQueue
+from submodules.state_history import StateHistory
+from submodules.order_validation import OrderValidator
+from submodules.recording import TrafficRecorder, TrafficReplayer
+from submodules.config_watcher import (ConfigWatcher, IngestGapMeter, ManufacturerPolicies, changed_keys,
+                                       membership_changes)
 import yaml
-import jsonschema
 
 class FleetManager:
+    # Section -> (component attribute, keys that can change while running). Components with a
+    # configure() method get the changed keys as arguments; the others read plain attributes on use.
+    RELOADABLE = {
+        "storage": ("db_writer", ("batch_size", "batch_interval")),
+        "ingest_queue": ("ingest_queue", ("critical_depth", "routine_depth", "telemetry_depth", "coalesce_depth",
+                                          "telemetry_share")),
+        "liveness": ("liveness_monitor", ("timeout_factor", "default_timeout", "min_timeout", "check_interval")),
+        "publish_queue": ("publish_queue", ("max_inflight", "max_inflight_per_robot", "ack_timeout", "max_retries",
+                                            "rate", "burst")),
+        "anomaly_detection": ("anomaly_detector", ("stuck_seconds", "stuck_distance", "drain_z_threshold",
+                                                   "repeated_error_count", "heartbeat_timeout",
+                                                   "heartbeat_check_interval", "drain_window")),
+        "order_progress": ("order_progress", ("default_speed", "speed_window", "min_observed_speed")),
+        "state_history": ("state_history", ("min_interval",)),
+        "deadlock": ("deadlock_detector", ("min_wait_seconds", "node_tolerance", "auto_cancel")),
+        "charging": ("charging_scheduler", ("low_threshold", "critical_threshold", "target_charge",
+                                            "forecast_horizon", "reserve_robots", "schedule_interval",
+                                            "assignment_timeout")),
+        "profiling": ("profiler", ("slow_threshold",)),
+        "config_watcher": ("config_watcher", ("interval", "settle_seconds")),
+    }
+
     def __init__(self):
         self.logger = logging.getLogger('FleetManager')
         logging.basicConfig(level=logging.INFO)
+        self.startup_timer = StartupTimer()
 
         config_path = os.path.join(os.path.dirname(__file__), 'config', 'config.yaml')
-        with open(config_path, 'r') as config_file:
-            config = yaml.safe_load(config_file)
+        with self.startup_timer.step("config"):
+            with open(config_path, 'r') as config_file:
+                config = yaml.safe_load(config_file)
+        self.config = config
+        startup_config = config.get('startup', {})
+        fast_start = startup_config.get('fast_start', False)
 
         mqtt_config = config['mqtt']
-        self.mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        # Simulated mode: broker and robots run in this process, for load tests without hardware.
+        simulator_config = dict(config.get('simulator', {}))
+        self.simulator = None
+        self.local_broker = None
+        if simulator_config.pop('enabled', False):
+            self.local_broker = LocalBroker(mqtt_config['broker_address'], mqtt_config['broker_port'])
+            self.mqtt_client = LocalClient(client_id="fleet_manager")
+        else:
+            self.mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
         self.mqtt_client.on_connect = self.on_connect
         self.mqtt_client.on_message = self.on_message
 
@@ -32,40 +92,185 @@ class FleetManager:
         self.version = fleet_info['version']
         self.versions = fleet_info['versions']
         self.manufacturer = fleet_info['manufacturer']
+        # Manufacturers whose robots this fleet manager listens to; "+" means all of them.
+        self.manufacturers = list(fleet_info.get('manufacturers', ["+"]))
+        self.subscription_lock = threading.Lock()
+        self.manufacturer_policies = ManufacturerPolicies(config.get('manufacturer_policies'))
         
         # PostgreSQL bağlantısı
-        postgres_config = config['postgres']
-        try:
-            self.conn = psycopg2.connect(
-                host=postgres_config['host'],
-                port=postgres_config['port'],
-                database=postgres_config['database'],
-                user=postgres_config['user'],
-                password=postgres_config['password']
-            )
-            self.cursor = self.conn.cursor()
-            self.logger.info("Connected to PostgreSQL database successfully.")
-            CreateDatabaseAndTables(self.conn, postgres_config['database'])
-        except Exception as e:
-            self.logger.error(f"Failed to connect to PostgreSQL database: {e}")
-            self.conn = None
-
-        self.connection_handler = ConnectionHandler(self.fleetname, self.version, self.versions, self.conn)
-        self.factsheet_handler = FactsheetHandler(self.fleetname, self.version , self.versions,self.conn)
-        self.instant_actions_publisher = InstantActionsPublisher(self.fleetname, self.version, self.versions, self.manufacturer, self.conn)
-        self.order_publisher = OrderPublisher(self.fleetname, self.version, self.versions, self.manufacturer,self.conn)
-        self.state_handler = StateHandler(self.fleetname, self.version, self.versions,self.conn)
+        self.postgres_config = config['postgres']
+        self.storage_config = dict(config.get('storage', {}))
+        sqlite_path = self.storage_config.get('sqlite_path', 'fleet.db')
+        if not os.path.isabs(sqlite_path):
+            self.storage_config['sqlite_path'] = os.path.join(os.path.dirname(__file__), sqlite_path)
+        # Fast start connects in the background; rows go to the write-ahead buffer until it is up.
+        self.conn = None
+        if not fast_start:
+            with self.startup_timer.step("database"):
+                self.conn = self._connect_database()
+
+        buffer_config = dict(config.get('write_ahead_buffer', {}))
+        buffer_directory = buffer_config.pop('directory', 'wal')
+        slow_write_threshold = buffer_config.pop('slow_write_threshold', 0.5)
+        if not os.path.isabs(buffer_directory):
+            buffer_directory = os.path.join(os.path.dirname(__file__), buffer_directory)
+        self.write_buffer = WriteAheadBuffer(buffer_directory, **buffer_config)
+        self.db_writer = DatabaseWriter(self.conn, self.write_buffer, self._connect_database, slow_write_threshold,
+                                        self.storage_config.get('batch_size', 1),
+                                        self.storage_config.get('batch_interval', 0.5))
+        self.db_writer.add_connection_listener(self._set_db_connection)
+        self.db_writer.start()
+
+        self._build_pipeline(config)
+        self.write_buffer.start(self.db_writer)
+        self.liveness_monitor.start()
+        self.anomaly_detector.start()
+
+        self.profiler = IngestProfiler(**config.get('profiling', {}))
+        self.ingest_gaps = IngestGapMeter()
+
+        # Raw inbound traffic, as received, for replay; the database only keeps a reformatted copy.
+        self.recorder = None
+        recording_config = dict(config.get('recording', {}))
+        self.recording_directory = recording_config.get('directory', 'recordings')
+        self.replay_pipeline = None
+        if recording_config.pop('enabled', False):
+            self.recorder = TrafficRecorder(**recording_config)
+            self.recorder.start()
+
+        # Connection, safety and error messages overtake routine telemetry when the pipeline falls behind.
+        self.ingest_queue = None
+        ingest_config = dict(config.get('ingest_queue', {}))
+        if ingest_config.pop('enabled', False):
+            self.ingest_queue = IngestQueue(self.process_message, **ingest_config)
+            self.ingest_queue.start()
+
+        # Queries get a read-only connection of their own; the ingest connection is the writer's alone.
+        self.history_query = FleetHistoryQuery(history=self.state_history, connection_factory=self._connect_read_only,
+                                               **config.get('history_query', {}))
+        self.db_writer.add_insert_listener(self.history_query.on_rows_inserted)
+
+        self.startup_timer.mark("components")
+        if fast_start:
+            threading.Thread(target=self._bootstrap_database, name="DatabaseBootstrap", daemon=True).start()
+
+        # Sharded mode: one client per site broker behind a router that looks like a single client.
+        self.sharded_fleet = None
+        sharding_config = config.get('sharding', {})
+        if sharding_config.get('enabled', False):
+            self.sharded_fleet = ShardedFleet(self.fleetname, self.versions, sharding_config['sites'],
+                                              self.on_connect, self.on_message)
+            self.mqtt_client = self.sharded_fleet
+
+        # Orders and instant actions go out through the queue; it wraps whichever client is in use.
+        self.publish_queue = None
+        self.outbound = self.mqtt_client
+        publish_queue_config = dict(config.get('publish_queue', {}))
+        if publish_queue_config.pop('enabled', False):
+            self.publish_queue = PublishQueue(self.mqtt_client, **publish_queue_config)
+            self.publish_queue.start()
+            self.outbound = self.publish_queue
+
+        # The broker the client is on; a reload only moves it once the new one has been reached.
+        self.broker = (mqtt_config['broker_address'], mqtt_config['broker_port'], mqtt_config['keep_alive'])
+        self.pending_broker = None
+        if self.sharded_fleet is not None:
+            self.sharded_fleet.connect()
+        else:
+            self.mqtt_client.connect(*self.broker)
+        self.startup_timer.mark("mqtt connect")
+        self.startup_timer.log("Ready for MQTT traffic")
+
+        # Validators are otherwise built on the first message of each kind.
+        if startup_config.get('preload_schemas', True):
+            preload(SCHEMA_NAMES)
+
+        self.config_watcher = None
+        watcher_config = dict(config.get('config_watcher', {}))
+        if watcher_config.pop('enabled', False):
+            self.config_watcher = ConfigWatcher(config_path, self.apply_config, config, gap_meter=self.ingest_gaps,
+                                                **watcher_config)
+            self.config_watcher.start()
+
+        if self.local_broker is not None:
+            realtime = simulator_config.pop('realtime', True)
+            self.simulator = FleetSimulator(self.fleetname, self.version, self.versions, self.manufacturer,
+                                            broker_address=mqtt_config['broker_address'],
+                                            broker_port=mqtt_config['broker_port'], **simulator_config)
+            self.simulator.connect()
+            self.simulator.loop_start(realtime)
+
+    def _build_pipeline(self, config):
+        """Handlers and detectors the messages go through; replay builds a second, isolated set."""
+        self.connection_handler = ConnectionHandler(self.fleetname, self.version, self.versions, self.conn, self.db_writer)
+        self.factsheet_handler = FactsheetHandler(self.fleetname, self.version , self.versions,self.conn, self.db_writer)
+        compiled_templates = config.get('publishing', {}).get('compiled_templates', False)
+        self.trajectory_analyzer = TrajectoryAnalyzer(**config.get('trajectory', {}))
+        zones_config = dict(config.get('zones', {}))
+        self.zone_manager = ZoneManager(zones_config.pop('zone_sets', []), trajectory_analyzer=self.trajectory_analyzer,
+                                        **zones_config)
+        self.instant_actions_publisher = InstantActionsPublisher(self.fleetname, self.version, self.versions, self.manufacturer, self.conn, self.db_writer, compiled_templates)
+        validation_config = dict(config.get('order_validation', {}))
+        self.order_validator = OrderValidator(**validation_config) if validation_config.pop('enabled', True) else None
+        self.order_publisher = OrderPublisher(self.fleetname, self.version, self.versions, self.manufacturer,self.conn, self.db_writer, compiled_templates,
+                                              self.trajectory_analyzer, self.zone_manager, self.order_validator)
+        self.state_handler = StateHandler(self.fleetname, self.version, self.versions,self.conn, self.db_writer)
         self.visualization_subscriber = VisualizationSubscriber(self.fleetname, self.version, self.versions, self.manufacturer)
-        
-        self.mqtt_client.connect(mqtt_config['broker_address'], mqtt_config['broker_port'], mqtt_config['keep_alive'])
+
+        self.state_history = StateHistory(**config.get('state_history', {}))
+
+        self.order_progress = OrderProgressTracker(history=self.state_history, **config.get('order_progress', {}))
+        self.order_publisher.add_publish_listener(self.order_progress.on_order_published)
+
+        map_config = dict(config.get('map_registry', {}))
+        self.map_registry = MapRegistry(map_config.pop('maps', []), **map_config)
+        self.order_publisher.add_publish_listener(self.map_registry.on_order_published)
+
+        self.anomaly_detector = AnomalyDetector(self.conn, db_writer=self.db_writer, history=self.state_history,
+                                                **config.get('anomaly_detection', {}))
+
+        self.liveness_monitor = LivenessMonitor(manufacturer_timeout_factors=self.manufacturer_policies.timeout_factors(),
+                                                **config.get('liveness', {}))
+
+        self.message_filter = HeaderIdFilter(**config.get('deduplication', {}))
+
+        self.deadlock_detector = DeadlockDetector(**config.get('deadlock', {}))
+
+        charging_config = dict(config.get('charging', {}))
+        self.charging_scheduler = ChargingScheduler(self.order_publisher, charging_config.pop('chargers', []),
+                                                    map_registry=self.map_registry, **charging_config)
+
+    def _bootstrap_database(self):
+        with self.startup_timer.step("database"):
+            connected = self.db_writer.reconnect()
+        if not connected:
+            self.logger.error("Database not reachable at startup; buffering writes until it is.")
+
+    def _connect_database(self):
+        return storage.connect(self.storage_config, self.postgres_config)
+
+    def _connect_read_only(self):
+        return storage.connect(self.storage_config, self.postgres_config, read_only=True)
+
+    def _set_db_connection(self, conn):
+        self.conn = conn
+        for component in (self.connection_handler, self.factsheet_handler, self.instant_actions_publisher,
+                          self.order_publisher, self.state_handler, self.anomaly_detector):
+            component.db_conn = conn
+        if conn is not None:
+            self.order_publisher.sync_header_id()
+            self.instant_actions_publisher.sync_header_id()
 
     def on_connect(self, client, userdata, flags, rc, *extra):
         if rc == 0:
             self.logger.info("Connected to MQTT broker successfully.")
-            self.connection_handler.subscribe_to_topics(self.mqtt_client)
-            self.factsheet_handler.subscribe_to_topics(self.mqtt_client)
-            self.state_handler.subscribe_to_topics(self.mqtt_client)
-            self.visualization_subscriber.subscribe_to_topics(self.mqtt_client)
+            with self.subscription_lock:
+                if self.sharded_fleet is not None:
+                    manufacturers = self.sharded_fleet.manufacturers(userdata)
+                else:
+                    manufacturers = self.manufacturers
+                for manufacturer in manufacturers:
+                    self._subscribe(client, manufacturer)
 
             self.publish_instant_actions()
             self.publish_order()
@@ -73,6 +278,120 @@ class FleetManager:
             self.logger.error(f"Failed to connect to MQTT broker. Return code: {rc}")
             
     
+    def _subscribe(self, client, manufacturer):
+        self.connection_handler.subscribe_to_topics(client, manufacturer)
+        self.factsheet_handler.subscribe_to_topics(client, manufacturer)
+        self.state_handler.subscribe_to_topics(client, manufacturer)
+        self.visualization_subscriber.subscribe_to_topics(client, None if manufacturer == "+" else manufacturer)
+
+    def _unsubscribe(self, client, manufacturer, visualization=True):
+        self.connection_handler.unsubscribe_from_topics(client, manufacturer)
+        self.factsheet_handler.unsubscribe_from_topics(client, manufacturer)
+        self.state_handler.unsubscribe_from_topics(client, manufacturer)
+        if visualization:
+            self.visualization_subscriber.unsubscribe_from_topics(client, None if manufacturer == "+" else manufacturer)
+
+    def set_manufacturers(self, manufacturers):
+        """Changes fleet membership while connected; new manufacturers are subscribed before old ones are
+        dropped, so robots in both sets are never without a subscription."""
+        with self.subscription_lock:
+            added, removed = membership_changes(self.manufacturers, manufacturers)
+            self.manufacturers = list(manufacturers)
+            for manufacturer in added:
+                self._subscribe(self.mqtt_client, manufacturer)
+            # Visualization has no wildcard subscription; "+" stands for our own manufacturer there, so
+            # its topic may still be wanted by a manufacturer that stays.
+            visualized = {self.manufacturer if manufacturer == "+" else manufacturer for manufacturer in manufacturers}
+            for manufacturer in removed:
+                self._unsubscribe(self.mqtt_client, manufacturer,
+                                  (self.manufacturer if manufacturer == "+" else manufacturer) not in visualized)
+        if added or removed:
+            self.logger.info(f"Fleet membership now {self.manufacturers}; added {added}, removed {removed}")
+        return added, removed
+
+    def apply_config(self, config, changed, old_config):
+        """Applies a reloaded config section by section; returns what was applied and what needs a restart."""
+        applied, restart = [], []
+        for section in changed:
+            old_section, new_section = old_config.get(section) or {}, config.get(section) or {}
+            keys = changed_keys(old_section, new_section)
+            if section == "fleet_info":
+                # Sharded fleets take their manufacturers from the site list, which is fixed at startup.
+                if "manufacturers" in keys and self.sharded_fleet is None:
+                    self.set_manufacturers(new_section.get("manufacturers", ["+"]))
+                    keys.remove("manufacturers")
+                    applied.append("fleet_info.manufacturers")
+                restart += [f"fleet_info.{key}" for key in keys]
+            elif section == "manufacturer_policies":
+                self.manufacturer_policies.update(new_section)
+                self.liveness_monitor.configure(manufacturer_timeout_factors=self.manufacturer_policies.timeout_factors())
+                applied.append(section)
+            elif section == "mqtt":
+                if self._reconnect_broker(new_section):
+                    applied.append(section)
+                else:
+                    restart.append(section)
+            elif section in self.RELOADABLE:
+                attribute, reloadable = self.RELOADABLE[section]
+                component = getattr(self, attribute, None)
+                settings = {key: new_section[key] for key in keys if key in reloadable and key in new_section}
+                if component is None:
+                    restart.append(section)
+                    continue
+                restart += [f"{section}.{key}" for key in keys if key not in settings]
+                if not settings:
+                    continue
+                if hasattr(component, "configure"):
+                    component.configure(**settings)
+                else:
+                    for key, value in settings.items():
+                        setattr(component, key, value)
+                applied += [f"{section}.{key}" for key in settings]
+            else:
+                restart.append(section)
+        self.config = config
+        if restart:
+            self.logger.warning(f"Config changes that take effect only after a restart: {restart}")
+        return {"applied": applied, "restartRequired": restart}
+
+    def _reconnect_broker(self, mqtt_config):
+        """Hands a reachable new broker to run(); an unreachable one leaves the running connection alone."""
+        if self.sharded_fleet is not None or self.local_broker is not None:
+            return False
+        broker = (mqtt_config['broker_address'], mqtt_config['broker_port'], mqtt_config['keep_alive'])
+        if broker == self.broker:
+            return True
+        try:
+            socket.create_connection(broker[:2], timeout=2).close()
+        except OSError as e:
+            self.logger.error(f"Staying on broker {self.broker[0]}:{self.broker[1]}; "
+                              f"{broker[0]}:{broker[1]} is unreachable: {e}")
+            return False
+        # The socket belongs to the network loop, so the switch itself happens on its thread in run().
+        self.pending_broker = broker
+        self.mqtt_client.disconnect()
+        return True
+
+    def run(self):
+        """Runs the MQTT network loop until disconnected, moving to a broker picked up by a config reload."""
+        loop_options = {}
+        while True:
+            self.mqtt_client.loop_forever(**loop_options)
+            broker, self.pending_broker = self.pending_broker, None
+            if broker is None:
+                return
+            loop_options = {}
+            try:
+                self.mqtt_client.connect(*broker)
+                self.broker = broker
+                self.logger.info(f"Moved to broker {broker[0]}:{broker[1]}")
+            except OSError as e:
+                self.logger.error(f"Cannot connect to broker {broker[0]}:{broker[1]} ({e}); "
+                                  f"returning to {self.broker[0]}:{self.broker[1]}")
+                # The loop keeps retrying the old broker rather than giving up on a first failure.
+                self.mqtt_client.connect_async(*self.broker)
+                loop_options = {"retry_first_connection": True}
+
     def publish_instant_actions(self):
         self.instant_actions_publisher.add_action(
             action_name="PICK",
@@ -93,51 +412,69 @@ class FleetManager:
             ]
         )
 
-        self.instant_actions_publisher.publish_instant_actions(self.mqtt_client, "001")
+        self.instant_actions_publisher.publish_instant_actions(self.outbound, "001")
         
         
     def publish_order(self):
-        self.order_publisher.add_node(
-            node_id="node_1",
-            sequence_id=1,
-            node_description="Starting node",
-            node_position={
-                "x": 0.0,
-                "y": 0.0,
-                "theta": 0.0,
-                "mapId": "map_1",
-                "allowedDeviationXy": 0.1,
-                "allowedDeviationTheta": 0.1,
-                "mapDescription": "Ground floor"
-            },
-            actions=[
-                {
-                    "actionId": "action_1",
-                    "actionType": "PICK",
-                    "actionDescription": "Picking up load",
-                    "blockingType": "HARD",
-                    "actionParameters": [
-                        {"key": "duration", "value": 5},
-                        {"key": "direction", "value": "left"}
-                    ]
-                }
-            ]
-        )
+        # on_connect runs on the network thread while the charging scheduler builds orders on the ingest one.
+        with self.order_publisher.lock:
+            self.order_publisher.new_order("order_001")
+            self.order_publisher.add_node(
+                node_id="node_1",
+                sequence_id=0,
+                node_description="Starting node",
+                node_position={
+                    "x": 0.0,
+                    "y": 0.0,
+                    "theta": 0.0,
+                    "mapId": "map_1",
+                    "allowedDeviationXy": 0.1,
+                    "allowedDeviationTheta": 0.1,
+                    "mapDescription": "Ground floor"
+                },
+                actions=[
+                    {
+                        "actionId": "action_1",
+                        "actionType": "PICK",
+                        "actionDescription": "Picking up load",
+                        "blockingType": "HARD",
+                        "actionParameters": [
+                            {"key": "duration", "value": 5},
+                            {"key": "direction", "value": "left"}
+                        ]
+                    }
+                ]
+            )
 
-        self.order_publisher.add_edge(
-            edge_id="edge_1",
-            sequence_id=1,
-            start_node_id="node_1",
-            end_node_id="node_2",
-            edge_description="Edge from node 1 to node 2",
-            actions=[],
-            maxSpeed=1.5,
-            orientation=0.0,
-            rotationAllowed=True,
-            length=10.0
-        )
+            self.order_publisher.add_node(
+                node_id="node_2",
+                sequence_id=2,
+                node_description="Drop-off node",
+                node_position={
+                    "x": 10.0,
+                    "y": 0.0,
+                    "theta": 0.0,
+                    "mapId": "map_1",
+                    "allowedDeviationXy": 0.1,
+                    "allowedDeviationTheta": 0.1,
+                    "mapDescription": "Ground floor"
+                },
+                actions=[]
+            )
+
+            self.order_publisher.add_edge(
+                edge_id="edge_1",
+                sequence_id=1,
+                start_node_id="node_1",
+                end_node_id="node_2",
+                edge_description="Edge from node 1 to node 2",
+                actions=[],
+                maxSpeed=1.5,
+                orientation=0.0,
+                rotationAllowed=True
+            )
 
-        self.order_publisher.publish_order(self.mqtt_client,"001")
+            self.order_publisher.publish_order(self.outbound, "001")
         
     def handle_connection_message(self, message):
         self.connection_handler.process_connection_message(message)
@@ -145,8 +482,10 @@ class FleetManager:
     def handle_factsheet_message(self, message):
         self.factsheet_handler.process_factsheet_message(message)
 
-    def handle_state_message(self, message):
+    def handle_state_message(self, message, trace=NULL_TRACE):
         self.state_handler.process_state_message(message)
+        self.state_history.record_state(message)
+        trace.mark("state")
         battery_status = self.state_handler.get_battery_status(message)
         print("Battery Status:", battery_status)
 
@@ -179,29 +518,140 @@ class FleetManager:
 
         robot_id = self.state_handler.get_robot_id(message)
         print("Robot ID:", robot_id)
+        trace.mark("print")
+
+        order_progress = self.order_progress.update_from_state(message)
+        print("Order Progress:", order_progress)
+        trace.mark("order_progress")
+
+        map_alerts = self.map_registry.check_state(message)
+        if map_alerts:
+            print("Map Alerts:", map_alerts)
+        trace.mark("maps")
+
+        deadlocks = self.deadlock_detector.update_from_state(message)
+        for deadlock in deadlocks:
+            print("Deadlock:", deadlock["cycle"], deadlock["proposals"])
+            if self.deadlock_detector.auto_cancel:
+                self.deadlock_detector.resolve(deadlock, self.instant_actions_publisher, self.outbound)
+        trace.mark("deadlock")
+
+        zone_alerts = self.zone_manager.check_state(message)
+        if zone_alerts:
+            print("Zone Alerts:", zone_alerts)
+        trace.mark("zones")
+
+        anomalies = self.anomaly_detector.process_state(message)
+        if anomalies:
+            print("Anomalies:", anomalies)
+        trace.mark("anomalies")
+
+        self.charging_scheduler.update_from_state(message)
+        releases, charging_decisions = self.charging_scheduler.maybe_schedule(self.outbound)
+        if charging_decisions:
+            print("Charging Assignments:", charging_decisions)
+        trace.mark("charging")
 
     def handle_visualization_message(self, message):
         self.visualization_subscriber.process_visualization_message(message)
+        self.state_history.record_visualization(message)
 
     def on_message(self, client, userdata, msg):
-        payload = msg.payload.decode()
+        if self.recorder is not None and not getattr(msg, "replayed", False):
+            self.recorder.record(msg.topic, msg.payload)
+        parts = msg.topic.split('/')
+        if len(parts) > 2 and not self.manufacturer_policies.allows_ingest(parts[2]):
+            return
+        if self.ingest_queue is None:
+            self.process_message(userdata, msg)
+            return
+        lane = self.ingest_queue.submit(userdata, msg)
+        if lane is not None and len(parts) > 4 and parts[4] != "connection":
+            # Arrival counts for liveness even if the message waits in, or is shed from, its lane.
+            self.liveness_monitor.record_message(parts[3])
+
+    def replay(self, start=None, end=None, speed=1.0, topics=None, direct=False, directory=None):
+        """Feeds recorded traffic between start and end (epoch seconds) through an isolated copy of the pipeline.
+
+        The copy has its own handlers, headerId filter, liveness monitor and detectors, writes to a
+        throwaway in-memory database and publishes nowhere, so a replay changes nothing in the live
+        fleet view, the production tables or the robots. It is kept as self.replay_pipeline for
+        inspection. speed=None replays as fast as possible; direct=True bypasses the copy's ingest queue
+        and runs the pipeline on the calling thread, which makes the result a throughput measurement.
+        """
+        pipeline = self._replay_pipeline(direct)
+        replayer = TrafficReplayer(directory or self.recording_directory)
+        on_message = (lambda client, userdata, msg: pipeline.process_message(userdata, msg)) if direct else pipeline.on_message
+        try:
+            result = replayer.replay(on_message, start, end, speed, topics)
+        finally:
+            if pipeline.ingest_queue is not None:
+                pipeline.ingest_queue.stop(timeout=60.0)
+            pipeline.db_writer.stop()
+        self.replay_pipeline = pipeline
+        self.logger.info(f"Replayed {result['messages']} messages in {result['wallSeconds']:.1f} s")
+        return result
+
+    def _replay_pipeline(self, direct):
+        pipeline = FleetManager.__new__(FleetManager)
+        pipeline.logger = logging.getLogger('ReplayPipeline')
+        pipeline.config = self.config
+        for name in ("fleetname", "version", "versions", "manufacturer", "recording_directory"):
+            setattr(pipeline, name, getattr(self, name))
+        pipeline.manufacturer_policies = ManufacturerPolicies(self.config.get('manufacturer_policies'))
+        pipeline.conn = storage.connect({"backend": storage.SQLITE, "sqlite_path": ":memory:"}, None)
+        pipeline.db_writer = DatabaseWriter(pipeline.conn, batch_size=self.storage_config.get('batch_size', 1),
+                                            batch_interval=self.storage_config.get('batch_interval', 0.5))
+        pipeline.db_writer.start()
+        # A client that was never connected: charging orders and deadlock cancels go nowhere.
+        pipeline.mqtt_client = pipeline.outbound = LocalClient(client_id="replay")
+        pipeline.sharded_fleet = None
+        pipeline.recorder = None
+        pipeline.profiler = IngestProfiler()
+        pipeline.ingest_gaps = IngestGapMeter()
+        pipeline._build_pipeline(self.config)
+        pipeline.ingest_queue = None
+        ingest_config = dict(self.config.get('ingest_queue', {}))
+        if ingest_config.pop('enabled', False) and not direct:
+            pipeline.ingest_queue = IngestQueue(pipeline.process_message, **ingest_config)
+            pipeline.ingest_queue.start()
+        return pipeline
+
+    def process_message(self, userdata, msg, message=None):
+        self.ingest_gaps.tick()
+        trace = self.profiler.begin(msg.topic, len(msg.payload))
         try:
-            message = json.loads(payload)
+            if message is None:
+                message = json.loads(msg.payload.decode())
+                trace.mark("decode")
+            if not self.message_filter.accept(msg.topic, message):
+                return
+            if self.sharded_fleet is not None:
+                self.sharded_fleet.record_message(userdata, msg.topic.rsplit('/', 1)[-1], message)
+            trace.mark("filter")
 
             if "connection" in msg.topic:
+                self.liveness_monitor.process_connection_message(message)
                 self.handle_connection_message(message)
             elif "factsheet" in msg.topic:
+                self.liveness_monitor.record_message(message.get("serialNumber"))
+                self.liveness_monitor.update_factsheet(message)
                 self.handle_factsheet_message(message)
             elif "state" in msg.topic:
-                self.handle_state_message(message)
+                self.liveness_monitor.record_message(message.get("serialNumber"))
+                self.handle_state_message(message, trace)
             elif "visualization" in msg.topic:
+                self.liveness_monitor.record_message(message.get("serialNumber"))
                 self.handle_visualization_message(message)
         except json.JSONDecodeError as e:
             self.logger.error(f"Failed to decode JSON message: {e}")
-        except jsonschema.exceptions.ValidationError:
+        except SchemaValidationError:
             pass
+        finally:
+            trace.mark("handler")
+            self.profiler.end(trace, msg.payload)
         
 
 if __name__ == '__main__':
     fleet_manager = FleetManager()
-    fleet_manager.mqtt_client.loop_forever()
+    fleet_manager.run()